@@ -0,0 +1,119 @@
+"""Benchmark track co-occurrence counts, artist/track counts and artist
+similarity: Python loops over the sets vs sparse matrix products in batches.
+
+Run from the repository root (requires numpy and scipy):
+
+    python -m benchmarks.bench_cooccurrence [sets]
+
+The loop approach is measured on LOOP_SETS sets and extrapolated linearly,
+counting pairs is linear in the number of sets.
+"""
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+
+from lsdbcrawler.cooccurrence import CooccurrenceMatrices
+
+SETS = 500_000
+LOOP_SETS = 50_000
+TRACKS = 200_000
+ARTISTS = 20_000
+BATCH = 10_000
+SIMILAR_QUERIES = 100
+
+
+def synthetic_sets(n, rng):
+    for set_id in range(n):
+        yield {
+            "set_id": set_id,
+            "artists": [{"artist": rng.randrange(ARTISTS), "separator": ""} for _ in range(rng.randint(1, 2))],
+            "tracklist": {
+                "type": "modern",
+                "tracks": [
+                    # a few popular tracks make up much of the plays
+                    {"track_id": int(rng.paretovariate(0.8)) % TRACKS + 1, "track_type": "track"}
+                    for _ in range(rng.randint(5, 25))
+                ],
+            },
+        }
+
+
+def loops(livesets):
+    pairs = defaultdict(Counter)
+    artist_tracks = defaultdict(Counter)
+    for liveset in livesets:
+        tracks = sorted({track["track_id"] for track in liveset["tracklist"]["tracks"]})
+        for a in tracks:
+            for b in tracks:
+                pairs[a][b] += 1
+        for artist in {artist["artist"] for artist in liveset["artists"]}:
+            for track in tracks:
+                artist_tracks[artist][track] += 1
+    return pairs, artist_tracks
+
+
+def similar_artists_loops(artist_tracks, artist_ids, n=10):
+    """Cosine similarity of the played tracks against every other artist."""
+    played = {artist: set(tracks) for artist, tracks in artist_tracks.items()}
+    results = []
+    for artist_id in artist_ids:
+        tracks = played[artist_id]
+        scores = [
+            (other, len(tracks & other_tracks) / (len(tracks) * len(other_tracks)) ** 0.5)
+            for other, other_tracks in played.items()
+            if other != artist_id
+        ]
+        results.append(sorted(scores, key=lambda score: -score[1])[:n])
+    return results
+
+
+def vectorized(livesets):
+    matrices = CooccurrenceMatrices()
+    batch = []
+    for liveset in livesets:
+        batch.append(liveset)
+        if len(batch) >= BATCH:
+            matrices.update(batch)
+            batch = []
+    matrices.update(batch)
+    return matrices
+
+
+def main():
+    sets = int(sys.argv[1]) if len(sys.argv) > 1 else SETS
+    livesets = list(synthetic_sets(sets, random.Random(42)))
+
+    start = time.perf_counter()
+    loops(livesets[:LOOP_SETS])
+    loop_seconds = (time.perf_counter() - start) * sets / min(LOOP_SETS, sets)
+
+    start = time.perf_counter()
+    matrices = vectorized(livesets)
+    vectorized_seconds = time.perf_counter() - start
+
+    _, artist_tracks = loops(livesets)
+    queries = list(artist_tracks)[:SIMILAR_QUERIES]
+    start = time.perf_counter()
+    similar_artists_loops(artist_tracks, queries)
+    similar_loop_ms = (time.perf_counter() - start) / len(queries) * 1000
+
+    start = time.perf_counter()
+    matrices.similar_artists_many(queries)
+    similar_ms = (time.perf_counter() - start) / len(queries) * 1000
+
+    start = time.perf_counter()
+    for track_id in range(1, 101):
+        matrices.cooccurring_tracks(track_id)
+    query_ms = (time.perf_counter() - start) * 10
+
+    print(f"{sets} sets, {len(matrices.track_ids)} tracks, {matrices.tracks.nnz} track pairs")
+    print(f"{'loops (extrapolated)':<24} {loop_seconds:>8.1f}s")
+    print(f"{'sparse products':<24} {vectorized_seconds:>8.1f}s")
+    print(f"{'co-occurrence query':<24} {query_ms:>8.2f}ms")
+    print(f"{'similar artists, loops':<24} {similar_loop_ms:>8.2f}ms per artist")
+    print(f"{'similar artists, matrix':<24} {similar_ms:>8.2f}ms per artist")
+
+
+if __name__ == "__main__":
+    main()
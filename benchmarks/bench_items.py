@@ -0,0 +1,86 @@
+"""Benchmark item creation: per-instance schema checks vs class-level checks
+vs compact slotted items.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_items
+"""
+import timeit
+import tracemalloc
+
+import scrapy
+from itemadapter import ItemAdapter
+
+from lsdbcrawler.items import ArtistItem, CompactArtistItem
+
+N = 100_000
+
+
+class LegacyBaseItem(scrapy.Item):
+    """BaseItem as it was, validating the schema on every instantiation."""
+
+    unique_fields = None
+    collection = None
+
+    def __init__(self, *args, **kwargs):
+        super(LegacyBaseItem, self).__init__(*args, **kwargs)
+
+        if self.unique_fields is None:
+            raise NotImplementedError
+        if self.collection is None:
+            raise NotImplementedError
+        if not isinstance(self.unique_fields, list):
+            raise TypeError
+        if not isinstance(self.collection, str):
+            raise TypeError
+
+
+class LegacyArtistItem(LegacyBaseItem):
+    collection = "artist"
+    unique_fields = ["artist_id"]
+
+    artist_id = scrapy.Field()
+    name = scrapy.Field()
+
+
+def build(item_cls):
+    item = item_cls()
+    item["artist_id"] = 1
+    item["name"] = "Artist"
+    return item
+
+
+def adapt(item):
+    return ItemAdapter(item).asdict()
+
+
+def measure(item_cls):
+    seconds = min(timeit.repeat(lambda: build(item_cls), number=N, repeat=5))
+    item = build(item_cls)
+    adapt_seconds = min(timeit.repeat(lambda: adapt(item), number=N, repeat=5))
+
+    tracemalloc.start()
+    items = []
+    for i in range(N):
+        item = item_cls()
+        item["artist_id"] = i
+        item["name"] = "Artist"
+        items.append(item)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return seconds / N * 1e6, adapt_seconds / N * 1e6, current / N
+
+
+def main():
+    print(f"{'item class':<20} {'create us':>10} {'asdict us':>10} {'bytes/item':>12}")
+    for item_cls in (LegacyArtistItem, ArtistItem, CompactArtistItem):
+        create, adapt_time, per_item_bytes = measure(item_cls)
+        print(
+            f"{item_cls.__name__:<20} {create:>10.2f} {adapt_time:>10.2f} "
+            f"{per_item_bytes:>12.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
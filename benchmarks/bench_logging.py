@@ -0,0 +1,67 @@
+"""Measure the logging cost paid by the crawling thread for hot-path messages,
+writing to a log file synchronously vs through the background queue with
+rate limiting, at DEBUG and INFO level.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_logging
+"""
+import logging
+import os
+import tempfile
+import time
+
+from lsdbcrawler.logs import BackgroundLogging, RateLimitFilter
+from lsdbcrawler.processors import to_int, parse_anomalies
+
+N = 20_000
+
+
+def hot_loop(logger):
+    for i in range(N):
+        logger.info("Adding liveset to queue: https://lsdb.eu/set/%s?page=1", i)
+        logger.debug("Found %s comments", i)
+        if i % 100 == 0:
+            to_int("n/a")
+
+
+def measure(level, queued):
+    path = tempfile.mktemp(suffix=".log")
+    handler = logging.FileHandler(path, encoding="utf-8")
+    handler.setFormatter(
+        logging.Formatter("%(asctime)s [%(name)s] %(levelname)s: %(message)s")
+    )
+    handler.setLevel(level)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(handler)
+
+    background = None
+    if queued:
+        background = BackgroundLogging(rate_limit=RateLimitFilter(limit=10, interval=60))
+        background.start()
+
+    parse_anomalies.clear()
+    start = time.perf_counter()
+    hot_loop(logging.getLogger("lsdbcrawler.bench"))
+    elapsed = time.perf_counter() - start
+
+    if background:
+        background.stop()
+    root.removeHandler(handler)
+    handler.close()
+    os.remove(path)
+    return elapsed / N * 1e6
+
+
+def main():
+    print(f"{'level':<6} {'sync us/iter':>13} {'queued us/iter':>15}")
+    for level in (logging.DEBUG, logging.INFO):
+        sync = measure(level, queued=False)
+        queued = measure(level, queued=True)
+        print(f"{logging.getLevelName(level):<6} {sync:>13.2f} {queued:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Benchmark matching legacy track names against known tracks: brute-force
+n-gram similarity against every track vs the n-gram inverted index.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_matching
+"""
+import random
+import time
+
+from lsdbcrawler.matching import TrackIndex, dice, ngrams, normalize
+
+TRACKS = 100_000
+QUERIES = 200
+
+SYLLABLES = ["ka", "lo", "mi", "ra", "tek", "no", "vox", "sun", "dee", "pa", "zo", "trance", "bass", "mix"]
+
+
+def word(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def track_name(rng):
+    artist = " ".join(word(rng) for _ in range(rng.randint(1, 2)))
+    title = " ".join(word(rng) for _ in range(rng.randint(1, 3)))
+    return f"{artist} - {title}".title()
+
+
+def misspell(rng, name):
+    """Legacy names are typed by hand: drop a character and change the case."""
+    i = rng.randrange(len(name))
+    return (name[:i] + name[i + 1:]).lower()
+
+
+def brute_force(names, query, threshold):
+    grams = ngrams(normalize(query))
+    best = None
+    for track_id, name in names.items():
+        confidence = dice(grams, ngrams(name))
+        if best is None or confidence > best[1]:
+            best = (track_id, confidence)
+    return best if best[1] >= threshold else None
+
+
+def main():
+    rng = random.Random(42)
+    names = {track_id: track_name(rng) for track_id in range(1, TRACKS + 1)}
+    queries = [(track_id, misspell(rng, names[track_id])) for track_id in rng.sample(list(names), QUERIES)]
+
+    start = time.perf_counter()
+    index = TrackIndex()
+    for track_id, name in names.items():
+        index.add(track_id, name)
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matches = [index.match(query) for _, query in queries]
+    indexed = (time.perf_counter() - start) / QUERIES
+    indexed_hits = sum(1 for (track_id, _), match in zip(queries, matches) if match and match[0] == track_id)
+
+    normalized = {track_id: normalize(name) for track_id, name in names.items()}
+    sample = queries[:20]
+    start = time.perf_counter()
+    matches = [brute_force(normalized, query, index.threshold) for _, query in sample]
+    brute = (time.perf_counter() - start) / len(sample)
+    brute_hits = sum(1 for (track_id, _), match in zip(sample, matches) if match and match[0] == track_id)
+
+    print(f"{TRACKS} tracks, index built in {build:.1f}s")
+    print(f"{'method':<12} {'ms/query':>10} {'recall':>8}")
+    print(f"{'brute force':<12} {brute * 1000:>10.1f} {brute_hits / len(sample):>8.2f}")
+    print(f"{'index':<12} {indexed * 1000:>10.2f} {indexed_hits / QUERIES:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
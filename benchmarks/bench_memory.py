@@ -0,0 +1,49 @@
+"""Report the memory retained per lsdbcrawler function while parsing the
+livesets index fixture, to catch memory regressions in the spider.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_memory
+"""
+import os
+import tracemalloc
+
+from scrapy.http import HtmlResponse
+from scrapy.settings import Settings
+
+from lsdbcrawler.memory import FunctionIndex, attribute_snapshot, deep_sizeof
+from lsdbcrawler.spiders.liveset_spider import LivesetSpider
+
+N = 200
+
+FIXTURE = os.path.join(
+    os.path.dirname(__file__), "..", "lsdbcrawler", "tests", "response", "livesets_index.html"
+)
+
+
+def main():
+    with open(FIXTURE, mode="rb") as f:
+        body = f.read()
+
+    spider = LivesetSpider()
+    spider.settings = Settings()
+
+    tracemalloc.start(25)
+    retained = []
+    for _ in range(N):
+        response = HtmlResponse(url="https://lsdb.eu/livesets", body=body, encoding="utf-8")
+        retained.extend(spider.parse_livesets_index(response))
+    snapshot = tracemalloc.take_snapshot()
+    traced, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    meta = sum(deep_sizeof(request.meta) for request in retained)
+    print(f"requests retained: {len(retained)}")
+    print(f"traced: {traced / 1024:.1f}KB peak: {peak / 1024:.1f}KB")
+    print(f"request meta: {meta / len(retained):.0f} bytes/request")
+    for owner, size in attribute_snapshot(snapshot, FunctionIndex()):
+        print(f"{size / 1024:>10.1f}KB {owner}")
+
+
+if __name__ == "__main__":
+    main()
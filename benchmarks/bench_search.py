@@ -0,0 +1,106 @@
+"""Benchmark full-text queries over descriptions, comments and track names:
+the SQLite FTS5 index vs case-insensitive regex search, the way the texts are
+searched in MongoDB today.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_search [entries] [mongodb uri]
+
+Without a MongoDB URI the regex search is a scan of the texts with ``re``,
+which is what an unanchored case-insensitive ``$regex`` query has to do as
+well: it can't use an index and tests every document. With a URI the texts
+are inserted into a temporary collection of the ``lsdb_bench`` database and
+queried with ``$regex``; the database is dropped afterwards.
+"""
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+from lsdbcrawler.search import SearchIndex
+
+ENTRIES = 1_000_000
+QUERIES = 50
+BATCH = 10_000
+
+SYLLABLES = ["ka", "lo", "mi", "ra", "tek", "no", "vox", "sun", "dee", "pa", "zo", "trance", "bass", "mix"]
+COMMON = ["the", "set", "live", "mix", "great", "track", "id", "at", "and", "from", "this", "tune"]
+
+
+def word(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def synthetic_entries(n, rng):
+    kinds = ["description", "comment", "track", "tracklist"]
+    for i in range(n):
+        kind = kinds[i % len(kinds)]
+        length = {"description": 40, "comment": 15, "track": 5, "tracklist": 60}[kind]
+        words = [rng.choice(COMMON) if rng.random() < 0.5 else word(rng) for _ in range(rng.randint(3, length))]
+        yield kind, str(i), " ".join(words)
+
+
+def timed(function, queries):
+    start = time.perf_counter()
+    hits = [function(query) for query in queries]
+    return (time.perf_counter() - start) / len(queries), hits
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else ENTRIES
+    uri = sys.argv[2] if len(sys.argv) > 2 else None
+    rng = random.Random(42)
+    rows = list(synthetic_entries(n, rng))
+    queries = [" ".join(word(rng) for _ in range(rng.randint(1, 2))) for _ in range(QUERIES)]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        index = SearchIndex(os.path.join(tmpdir, "search.db"), batch_size=BATCH)
+        index.open()
+        start = time.perf_counter()
+        for row in rows:
+            index.add(*row)
+        index.flush()
+        index.optimize()
+        build = time.perf_counter() - start
+
+        fts, fts_hits = timed(lambda q: len(index.search(q, limit=20)), queries)
+
+        patterns = [re.compile(r"\b" + r"\b.*\b".join(map(re.escape, q.split())) + r"\b", re.IGNORECASE)
+                    for q in queries]
+        texts = [text for _, _, text in rows]
+        regex, regex_hits = timed(
+            lambda p: sum(1 for text in texts if p.search(text)), patterns[:10]
+        )
+
+        print(f"{n} entries, FTS5 index built in {build:.1f}s "
+              f"({os.path.getsize(os.path.join(tmpdir, 'search.db')) / 2 ** 20:.0f} MiB)")
+        print(f"{'method':<14} {'ms/query':>10} {'avg hits':>10}")
+        print(f"{'regex scan':<14} {regex * 1000:>10.1f} {sum(regex_hits) / len(regex_hits):>10.1f}")
+        print(f"{'fts5 (top 20)':<14} {fts * 1000:>10.2f} {sum(fts_hits) / len(fts_hits):>10.1f}")
+        index.close()
+
+    if uri:
+        import pymongo
+
+        client = pymongo.MongoClient(uri)
+        try:
+            collection = client["lsdb_bench"]["search"]
+            collection.drop()
+            for start in range(0, n, BATCH):
+                collection.insert_many(
+                    [{"kind": kind, "key": key, "text": text} for kind, key, text in rows[start:start + BATCH]]
+                )
+            mongo, mongo_hits = timed(
+                lambda p: collection.count_documents({"text": {"$regex": p.pattern, "$options": "i"}}),
+                patterns[:10],
+            )
+            print(f"{'mongo $regex':<14} {mongo * 1000:>10.1f} {sum(mongo_hits) / len(mongo_hits):>10.1f}")
+        finally:
+            client.drop_database("lsdb_bench")
+            client.close()
+
+
+if __name__ == "__main__":
+    main()
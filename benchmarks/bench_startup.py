@@ -0,0 +1,89 @@
+"""Measure cold start: import time of the spider module (python -X importtime)
+and the time from process start until the first request reaches a local
+server during `scrapy crawl LivesetSpider`.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_startup
+"""
+import http.server
+import os
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def import_times(module="lsdbcrawler.spiders.liveset_spider", top=10):
+    """Return the total import time of ``module`` and its slowest imports (us)."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times.append((int(cumulative_us), int(self_us), name.strip()))
+
+    total = next(cumulative for cumulative, _, name in times if name == module)
+    slowest = sorted(times, key=lambda t: t[1], reverse=True)[:top]
+    return total, slowest
+
+
+class FirstRequestHandler(http.server.BaseHTTPRequestHandler):
+    first_request = None
+
+    def do_GET(self):
+        if FirstRequestHandler.first_request is None:
+            FirstRequestHandler.first_request = time.monotonic()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.end_headers()
+        self.wfile.write(b"<html><body></body></html>")
+
+    def log_message(self, *args):
+        pass
+
+
+def time_to_first_request():
+    server = http.server.HTTPServer(("127.0.0.1", 0), FirstRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/livesets"
+
+    FirstRequestHandler.first_request = None
+    start = time.monotonic()
+    subprocess.run(
+        [
+            sys.executable, "-m", "scrapy", "crawl", "LivesetSpider",
+            "-a", f"start_urls={url}",
+            "-s", "ITEM_PIPELINES={}",
+            "-s", "LOG_ENABLED=0",
+            "-s", "TELNETCONSOLE_ENABLED=0",
+        ],
+        cwd=ROOT,
+        check=True,
+    )
+    server.shutdown()
+    return FirstRequestHandler.first_request - start
+
+
+def main():
+    total, slowest = import_times()
+    print(f"spider module import: {total / 1000:.1f}ms")
+    for cumulative, self_us, name in slowest:
+        print(f"  {self_us / 1000:>7.1f}ms self {cumulative / 1000:>7.1f}ms cumulative  {name}")
+
+    runs = [time_to_first_request() for _ in range(3)]
+    print(f"time to first request: {min(runs) * 1000:.0f}ms (best of {len(runs)})")
+
+
+if __name__ == "__main__":
+    main()
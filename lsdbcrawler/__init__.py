@@ -1 +1,8 @@
-from .spiders import liveset_spider
+def __getattr__(name):
+    # imported on first access so that loading the settings or items does
+    # not import the spider and its dependencies
+    if name == "liveset_spider":
+        from .spiders import liveset_spider
+
+        return liveset_spider
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,189 @@
+import logging
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# read model collection -> (id fields, counter field)
+READ_MODELS = {
+    "artist_stats": (("artist_id",), "sets"),
+    "event_stats": (("event_id",), "sets"),
+    "genre_stats": (("genre_id",), "sets"),
+    "track_stats": (("track_id",), "plays"),
+    # pair counters, the top-N lists are indexed queries on these
+    "artist_tracks": (("artist_id", "track_id"), "plays"),
+    "event_artists": (("event_id", "artist_id"), "sets"),
+    "genre_artists": (("genre_id", "artist_id"), "sets"),
+    "track_years": (("year", "track_id"), "plays"),
+}
+
+CONTRIBUTIONS = "aggregate_contributions"
+
+
+def played_tracks(liveset):
+    """Ids of the linked tracks of a set, in tracklist order."""
+    tracklist = liveset.get("tracklist") or {}
+    return [
+        track["track_id"]
+        for track in tracklist.get("tracks") or []
+        if track.get("track_id") and track.get("track_type") in ("track", "w")
+    ]
+
+
+def contribution(liveset):
+    """Counters a set adds to the read models, ``(collection, ids) -> count``."""
+    counters = Counter()
+    artists = sorted({artist["artist"] for artist in liveset.get("artists") or []})
+    genres = sorted(set(liveset.get("genres") or []))
+    event_id = liveset.get("event_id")
+    set_date = liveset.get("set_date")
+    year = set_date.year if set_date else None
+    tracks = played_tracks(liveset)
+
+    for artist_id in artists:
+        counters["artist_stats", (artist_id,)] += 1
+        if event_id:
+            counters["event_artists", (event_id, artist_id)] += 1
+        for genre_id in genres:
+            counters["genre_artists", (genre_id, artist_id)] += 1
+        for track_id in tracks:
+            counters["artist_tracks", (artist_id, track_id)] += 1
+
+    if event_id:
+        counters["event_stats", (event_id,)] += 1
+    for genre_id in genres:
+        counters["genre_stats", (genre_id,)] += 1
+    for track_id in tracks:
+        counters["track_stats", (track_id,)] += 1
+        if year:
+            counters["track_years", (year, track_id)] += 1
+
+    return counters
+
+
+def delta(old, new):
+    """Counter changes turning the contribution ``old`` into ``new``, without zeros."""
+    changes = {}
+    for key in old.keys() | new.keys():
+        change = new.get(key, 0) - old.get(key, 0)
+        if change:
+            changes[key] = change
+    return changes
+
+
+def encode(counters):
+    return [[collection, list(ids), count] for (collection, ids), count in counters.items()]
+
+
+def decode(entries):
+    return Counter({(collection, tuple(ids)): count for collection, ids, count in entries})
+
+
+def id_filter(collection, ids):
+    return dict(zip(READ_MODELS[collection][0], ids))
+
+
+class AggregateStore(object):
+    """Counters and top-N lists per artist, event, genre and track in MongoDB.
+
+    The contribution of every set to the counters is kept in
+    ``aggregate_contributions``, so a recrawled set only applies the
+    difference between its old and new contribution.
+    """
+
+    def __init__(self, database):
+        self.database = database
+
+    def create_indexes(self):
+        import pymongo
+
+        for collection, (fields, counter) in READ_MODELS.items():
+            self.database[collection].create_index(
+                [(field, pymongo.ASCENDING) for field in fields], unique=True
+            )
+            # top-N of the second id per first id, e.g. the top tracks of an artist
+            self.database[collection].create_index(
+                [(fields[0], pymongo.ASCENDING), (counter, pymongo.DESCENDING)]
+            )
+            if len(fields) > 1:
+                self.database[collection].create_index(
+                    [(fields[1], pymongo.ASCENDING), (counter, pymongo.DESCENDING)]
+                )
+
+    def operations(self, changes):
+        """Bulk operations per collection applying ``changes``."""
+        from pymongo import DeleteOne, UpdateOne
+
+        operations = {}
+        for (collection, ids), change in changes.items():
+            counter = READ_MODELS[collection][1]
+            filter_dict = id_filter(collection, ids)
+            ops = operations.setdefault(collection, [])
+            ops.append(UpdateOne(filter_dict, {"$inc": {counter: change}}, upsert=True))
+            if change < 0:
+                ops.append(DeleteOne(dict(filter_dict, **{counter: {"$lte": 0}})))
+        return operations
+
+    def apply(self, liveset):
+        """Update the read models with a new or recrawled set; returns the number of changes."""
+        set_id = liveset["set_id"]
+        stored = self.database[CONTRIBUTIONS].find_one({"_id": set_id})
+        old = decode(stored["entries"]) if stored else Counter()
+        new = contribution(liveset)
+
+        changes = delta(old, new)
+        for collection, ops in self.operations(changes).items():
+            self.database[collection].bulk_write(ops, ordered=True)
+
+        if changes or stored is None:
+            self.database[CONTRIBUTIONS].replace_one(
+                {"_id": set_id}, {"_id": set_id, "entries": encode(new)}, upsert=True
+            )
+        return len(changes)
+
+    def rebuild(self, livesets, batch_size=1000):
+        """Recompute all read models from ``livesets``; returns the number of sets."""
+        totals = Counter()
+        contributions = []
+        count = 0
+
+        for collection in list(READ_MODELS) + [CONTRIBUTIONS]:
+            self.database[collection].drop()
+        self.create_indexes()
+
+        for liveset in livesets:
+            counters = contribution(liveset)
+            totals.update(counters)
+            contributions.append({"_id": liveset["set_id"], "entries": encode(counters)})
+            if len(contributions) >= batch_size:
+                self.database[CONTRIBUTIONS].insert_many(contributions, ordered=False)
+                contributions = []
+            count += 1
+        if contributions:
+            self.database[CONTRIBUTIONS].insert_many(contributions, ordered=False)
+
+        documents = {}
+        for (collection, ids), total in totals.items():
+            counter = READ_MODELS[collection][1]
+            documents.setdefault(collection, []).append(
+                dict(id_filter(collection, ids), **{counter: total})
+            )
+        for collection, docs in documents.items():
+            for start in range(0, len(docs), batch_size):
+                self.database[collection].insert_many(docs[start:start + batch_size], ordered=False)
+
+        logger.info("Rebuilt read models from %s sets", count)
+        return count
+
+    def get(self, collection, *ids):
+        """Counter document of one artist, event, genre, track or pair."""
+        return self.database[collection].find_one(id_filter(collection, ids), {"_id": 0})
+
+    def top(self, collection, n=10, **filter_dict):
+        """Top ``n`` documents of a read model, e.g. ``top("track_years", year=2024)``."""
+        counter = READ_MODELS[collection][1]
+        return list(
+            self.database[collection]
+            .find(filter_dict, {"_id": 0})
+            .sort(counter, -1)
+            .limit(n)
+        )
@@ -0,0 +1,36 @@
+from scrapy.commands import ScrapyCommand
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+
+    def syntax(self):
+        return "[options] [start url, ...]"
+
+    def short_desc(self):
+        return "Run LivesetSpider as a daemon refreshing sets on demand"
+
+    def long_desc(self):
+        return (
+            "Run LivesetSpider without closing it when it is idle. Sets are "
+            "refreshed with POST /refresh/<set_id>[?wait=1] and job status is "
+            "available from GET /jobs/<job_id> on REFRESH_HOST:REFRESH_PORT. "
+            "Optional start urls are crawled as usual."
+        )
+
+    def add_options(self, parser):
+        ScrapyCommand.add_options(self, parser)
+        parser.add_argument(
+            "--port",
+            dest="port",
+            type=int,
+            help="port of the refresh API (default: REFRESH_PORT)",
+        )
+
+    def run(self, args, opts):
+        self.settings.set("DAEMON_ENABLED", True, priority="cmdline")
+        if opts.port:
+            self.settings.set("REFRESH_PORT", opts.port, priority="cmdline")
+
+        self.crawler_process.crawl("LivesetSpider", start_urls=",".join(args))
+        self.crawler_process.start()
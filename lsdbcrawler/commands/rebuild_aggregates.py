@@ -0,0 +1,53 @@
+import time
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from lsdbcrawler.aggregates import AggregateStore
+from lsdbcrawler.items import LivesetItem
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+    default_settings = {"LOG_ENABLED": False}
+
+    def syntax(self):
+        return "[options]"
+
+    def short_desc(self):
+        return "Recompute the artist, event, genre and track read models from all sets"
+
+    def process_options(self, args, opts):
+        ScrapyCommand.process_options(self, args, opts)
+        # print the report instead of routing stdout through the log
+        self.settings.set("LOG_ENABLED", False, priority="cmdline")
+        self.settings.set("LOG_STDOUT", False, priority="cmdline")
+
+    def add_options(self, parser):
+        ScrapyCommand.add_options(self, parser)
+        parser.add_argument(
+            "--batch-size",
+            dest="batch_size",
+            type=int,
+            default=1000,
+            help="documents per insert (default: 1000)",
+        )
+
+    def run(self, args, opts):
+        if args:
+            raise UsageError()
+
+        import pymongo
+
+        client = pymongo.MongoClient(self.settings.get("MONGODB_URI"))
+        try:
+            database = client[self.settings.get("MONGODB_DATABASE")]
+            livesets = database[LivesetItem.collection].find(
+                {}, {"set_id": 1, "set_date": 1, "artists": 1, "event_id": 1, "genres": 1, "tracklist": 1}
+            )
+
+            start = time.perf_counter()
+            count = AggregateStore(database).rebuild(livesets, batch_size=opts.batch_size)
+            print(f"Rebuilt read models from {count} sets in {time.perf_counter() - start:.1f}s")
+        finally:
+            client.close()
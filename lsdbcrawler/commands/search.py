@@ -0,0 +1,81 @@
+import sqlite3
+import time
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from lsdbcrawler.search import KINDS, SearchIndex
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+    default_settings = {"LOG_ENABLED": False}
+
+    def syntax(self):
+        return "[options] <query>"
+
+    def short_desc(self):
+        return "Full-text search of the sets, comments and names in the local search index"
+
+    def long_desc(self):
+        return (
+            "Search the SQLite FTS5 index maintained by SearchIndexPipeline. The query "
+            "uses the FTS5 syntax, e.g. 'born slippy', '\"born slippy\"', 'slip*' or "
+            "'underworld NOT remix'."
+        )
+
+    def process_options(self, args, opts):
+        ScrapyCommand.process_options(self, args, opts)
+        # print the results instead of routing stdout through the log
+        self.settings.set("LOG_ENABLED", False, priority="cmdline")
+        self.settings.set("LOG_STDOUT", False, priority="cmdline")
+
+    def add_options(self, parser):
+        ScrapyCommand.add_options(self, parser)
+        parser.add_argument(
+            "-i",
+            "--index",
+            dest="index",
+            help="path of the index (default: SEARCH_INDEX)",
+        )
+        parser.add_argument(
+            "-k",
+            "--kind",
+            dest="kinds",
+            action="append",
+            choices=KINDS,
+            help="only search texts of this kind, may be repeated",
+        )
+        parser.add_argument(
+            "-n",
+            "--limit",
+            dest="limit",
+            type=int,
+            default=20,
+            help="number of results (default: 20)",
+        )
+
+    def run(self, args, opts):
+        if not args:
+            raise UsageError()
+
+        path = opts.index or self.settings.get("SEARCH_INDEX")
+        if not path:
+            raise UsageError("Set SEARCH_INDEX or pass --index")
+
+        index = SearchIndex(path)
+        index.open()
+        try:
+            start = time.perf_counter()
+            try:
+                results = index.search(" ".join(args), kinds=opts.kinds, limit=opts.limit)
+            except sqlite3.OperationalError as e:
+                raise UsageError(f"Invalid query: {e}")
+            elapsed = time.perf_counter() - start
+
+            for kind, key, snippet in results:
+                snippet = " ".join(snippet.split())
+                print(f"{kind:<12} {key:<12} {snippet}")
+            print(f"{len(results)} results in {elapsed * 1000:.1f} ms")
+        finally:
+            index.close()
@@ -0,0 +1,95 @@
+import os
+from pprint import pformat
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+from scrapy.utils.conf import arglist_to_dict
+
+from lsdbcrawler.shards import ShardSupervisor
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+
+    def syntax(self):
+        return "[options]"
+
+    def short_desc(self):
+        return "Run LivesetSpider in several processes, each crawling a shard of the index"
+
+    def long_desc(self):
+        return (
+            "Start one LivesetSpider process per shard. Shard i crawls the index "
+            "pages i+1, i+1+N, ... Crashed shards are restarted from their last "
+            "checkpoint and the stats of all shards are merged into "
+            "<directory>/stats.json when they are done. Caches, indexes and "
+            "other files written by a crawl get a .shard-<i> suffix per shard "
+            "and EXPORT_COMPACT runs once after all shards are done."
+        )
+
+    def add_options(self, parser):
+        ScrapyCommand.add_options(self, parser)
+        parser.add_argument(
+            "-n",
+            "--shards",
+            dest="shards",
+            type=int,
+            default=os.cpu_count(),
+            help="number of processes (default: number of cores)",
+        )
+        parser.add_argument(
+            "-d",
+            "--directory",
+            dest="directory",
+            default="shards",
+            help="directory for checkpoints, logs and stats (default: shards)",
+        )
+        parser.add_argument(
+            "--max-restarts",
+            dest="max_restarts",
+            type=int,
+            default=3,
+            help="restarts per shard before giving up (default: 3)",
+        )
+        parser.add_argument(
+            "--shard-arg",
+            dest="shard_args",
+            action="append",
+            default=[],
+            metavar="NAME=VALUE",
+            help="spider argument passed to every shard (may be repeated)",
+        )
+        parser.add_argument(
+            "--shard-set",
+            dest="shard_settings",
+            action="append",
+            default=[],
+            metavar="NAME=VALUE",
+            help="setting passed to every shard (may be repeated)",
+        )
+
+    def process_options(self, args, opts):
+        ScrapyCommand.process_options(self, args, opts)
+        # print the report instead of routing stdout through the log
+        self.settings.set("LOG_STDOUT", False, priority="cmdline")
+
+    def run(self, args, opts):
+        if args or opts.shards < 1:
+            raise UsageError()
+
+        crawl_settings = self.settings.copy()
+        try:
+            crawl_settings.setdict(arglist_to_dict(opts.shard_settings), priority="cmdline")
+        except ValueError:
+            raise UsageError("Invalid --shard-set value, use NAME=VALUE", print_help=False)
+
+        supervisor = ShardSupervisor(
+            opts.shards,
+            opts.directory,
+            args=opts.shard_args,
+            settings=opts.shard_settings,
+            max_restarts=opts.max_restarts,
+            crawl_settings=crawl_settings,
+        )
+        stats = supervisor.run()
+        print(pformat(stats))
@@ -0,0 +1,58 @@
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from lsdbcrawler.tracing import STAGES, read_spans, summarize
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+    default_settings = {"LOG_ENABLED": False}
+
+    def syntax(self):
+        return "[options] [trace file]"
+
+    def short_desc(self):
+        return "Report latency percentiles per stage and the slowest livesets"
+
+    def process_options(self, args, opts):
+        ScrapyCommand.process_options(self, args, opts)
+        # print the report instead of routing stdout through the log
+        self.settings.set("LOG_ENABLED", False, priority="cmdline")
+        self.settings.set("LOG_STDOUT", False, priority="cmdline")
+
+    def add_options(self, parser):
+        ScrapyCommand.add_options(self, parser)
+        parser.add_argument(
+            "--slowest",
+            dest="slowest",
+            type=int,
+            default=10,
+            help="number of slowest livesets to list (default: 10)",
+        )
+
+    def run(self, args, opts):
+        if len(args) > 1:
+            raise UsageError()
+        path = args[0] if args else self.settings.get("TRACE_FILE", "traces.jsonl")
+
+        stages, sets = summarize(read_spans(path), slowest=opts.slowest)
+
+        print(f"{'stage':<10} {'count':>8} {'p50':>9} {'p95':>9} {'p99':>9}")
+        for stage in STAGES:
+            if stage not in stages:
+                continue
+            row = stages[stage]
+            print(
+                f"{stage:<10} {row['count']:>8} {row['p50']:>9.3f} "
+                f"{row['p95']:>9.3f} {row['p99']:>9.3f}"
+            )
+
+        print()
+        print("Slowest livesets:")
+        for trace in sets:
+            breakdown = " ".join(
+                f"{stage}={trace['stages'][stage]:.3f}"
+                for stage in STAGES
+                if stage in trace["stages"]
+            )
+            print(f"{trace['duration']:>9.3f}s {trace['set_url']} {breakdown}")
@@ -0,0 +1,237 @@
+"""Artist/track co-occurrence matrices built from the crawled sets.
+
+Requires NumPy and SciPy, which are imported by this module only.
+"""
+import json
+import logging
+import os
+
+import numpy as np
+import scipy.sparse as sp
+
+from lsdbcrawler.aggregates import played_tracks
+
+logger = logging.getLogger(__name__)
+
+
+class IdMap(object):
+    """Map external ids to consecutive matrix indices."""
+
+    def __init__(self, ids=()):
+        self.ids = list(ids)
+        self.index = {external: i for i, external in enumerate(self.ids)}
+
+    def get(self, external):
+        i = self.index.get(external)
+        if i is None:
+            i = self.index[external] = len(self.ids)
+            self.ids.append(external)
+        return i
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def save_csr(directory, name, matrix):
+    matrix = matrix.tocsr()
+    for part in ("data", "indices", "indptr"):
+        np.save(os.path.join(directory, f"{name}.{part}.npy"), getattr(matrix, part))
+    return {"shape": list(matrix.shape)}
+
+
+def load_csr(directory, name, shape):
+    parts = [
+        np.load(os.path.join(directory, f"{name}.{part}.npy"), mmap_mode="r")
+        for part in ("data", "indices", "indptr")
+    ]
+    return sp.csr_matrix(tuple(parts), shape=tuple(shape), copy=False)
+
+
+def incidence(rows, n_cols):
+    """Binary rows x ``n_cols`` matrix from a list of column index arrays."""
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(row) for row in rows])
+    indices = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int32)
+    data = np.ones(len(indices), dtype=np.int32)
+    return sp.csr_matrix((data, indices, indptr), shape=(len(rows), n_cols))
+
+
+def resized(matrix, shape):
+    if matrix.shape == shape:
+        return matrix
+    matrix = matrix.tocsr(copy=True)
+    matrix.resize(shape)
+    return matrix
+
+
+class CooccurrenceMatrices(object):
+    """Incrementally maintained co-occurrence counts of tracks and artists.
+
+    ``tracks`` counts the sets two tracks were played in together (the
+    diagonal is the number of sets of a track) and ``artist_tracks`` how often
+    an artist played a track. Both are sparse products of the binary set x
+    track and set x artist incidence matrices of a batch of sets, added to the
+    totals; a recrawled set first subtracts its previous incidence.
+    """
+
+    def __init__(self):
+        self.track_ids = IdMap()
+        self.artist_ids = IdMap()
+        # set_id -> (artist indices, track indices) of the last seen version
+        self.sets = {}
+        self.tracks = sp.csr_matrix((0, 0), dtype=np.int32)
+        self.artist_tracks = sp.csr_matrix((0, 0), dtype=np.int32)
+        self._normalized = None
+
+    def set_incidence(self, liveset):
+        artists = {artist["artist"] for artist in liveset.get("artists") or []}
+        artists = sorted(map(self.artist_ids.get, artists))
+        tracks = sorted(map(self.track_ids.get, set(played_tracks(liveset))))
+        return np.array(artists, dtype=np.int32), np.array(tracks, dtype=np.int32)
+
+    def products(self, incidences):
+        artists = incidence([artists for artists, _ in incidences], len(self.artist_ids))
+        tracks = incidence([tracks for _, tracks in incidences], len(self.track_ids))
+        return (tracks.T @ tracks).tocsr(), (artists.T @ tracks).tocsr()
+
+    def update(self, livesets):
+        """Add a batch of sets, replacing earlier versions of the same sets."""
+        return self.apply({liveset["set_id"]: self.set_incidence(liveset) for liveset in livesets})
+
+    def merge(self, other):
+        """Add the sets of ``other``, e.g. of a shard, replacing the same sets."""
+        artists = np.array([self.artist_ids.get(a) for a in other.artist_ids.ids], dtype=np.int32)
+        tracks = np.array([self.track_ids.get(t) for t in other.track_ids.ids], dtype=np.int32)
+        return self.apply({
+            set_id: (np.sort(artists[set_artists]), np.sort(tracks[set_tracks]))
+            for set_id, (set_artists, set_tracks) in other.sets.items()
+        })
+
+    def apply(self, incidences):
+        """Add ``set_id -> (artist indices, track indices)``; returns the number of changed sets."""
+        added = []
+        removed = []
+        for set_id, new in incidences.items():
+            old = self.sets.get(set_id)
+            if old is not None:
+                if np.array_equal(old[0], new[0]) and np.array_equal(old[1], new[1]):
+                    continue
+                removed.append(old)
+            self.sets[set_id] = new
+            added.append(new)
+
+        self._normalized = None
+        shape = (len(self.track_ids), len(self.track_ids))
+        self.tracks = resized(self.tracks, shape)
+        self.artist_tracks = resized(self.artist_tracks, (len(self.artist_ids), len(self.track_ids)))
+
+        if added:
+            tracks, artist_tracks = self.products(added)
+            self.tracks = self.tracks + tracks
+            self.artist_tracks = self.artist_tracks + artist_tracks
+        if removed:
+            tracks, artist_tracks = self.products(removed)
+            self.tracks = self.tracks - tracks
+            self.artist_tracks = self.artist_tracks - artist_tracks
+            self.tracks.eliminate_zeros()
+            self.artist_tracks.eliminate_zeros()
+        return len(added)
+
+    def cooccurring_tracks(self, track_id, n=10):
+        """Tracks most often played in the same sets as ``track_id``, with counts."""
+        i = self.track_ids.index.get(track_id)
+        if i is None:
+            return []
+        row = self.tracks.getrow(i)
+        return self.top(row, self.track_ids, n, exclude=i)
+
+    def normalized_artists(self):
+        """Binary artist x track matrix with rows scaled to unit length."""
+        if self._normalized is None:
+            played = (self.artist_tracks > 0).astype(np.float64)
+            norms = np.sqrt(np.asarray(played.sum(axis=1)).ravel())
+            norms[norms == 0] = 1
+            self._normalized = (sp.diags(1 / norms) @ played).tocsr()
+        return self._normalized
+
+    def similar_artists(self, artist_id, n=10):
+        """Artists playing the same tracks as ``artist_id``, by cosine similarity."""
+        return self.similar_artists_many([artist_id], n)[0]
+
+    def similar_artists_many(self, artist_ids, n=10):
+        """``similar_artists`` for several artists with one matrix product."""
+        rows = [self.artist_ids.index.get(artist_id) for artist_id in artist_ids]
+        known = [row for row in rows if row is not None]
+        normalized = self.normalized_artists()
+        similarity = (normalized[known] @ normalized.T).tocsr()
+
+        results = []
+        position = 0
+        for row in rows:
+            if row is None:
+                results.append([])
+                continue
+            results.append(self.top(similarity.getrow(position), self.artist_ids, n, exclude=row))
+            position += 1
+        return results
+
+    @staticmethod
+    def top(row, ids, n, exclude=None):
+        row = row.tocoo()
+        keep = row.col != exclude
+        cols, values = row.col[keep], row.data[keep]
+        order = np.argsort(-values, kind="stable")[:n]
+        return [(ids.ids[cols[j]], values[j].item()) for j in order]
+
+    def save(self, directory):
+        """Persist to ``directory``, writing a new version next to the old one."""
+        tmp = directory.rstrip(os.sep) + ".new"
+        os.makedirs(tmp, exist_ok=True)
+
+        set_ids = list(self.sets)
+        meta = {
+            "track_ids": self.track_ids.ids,
+            "artist_ids": self.artist_ids.ids,
+            "set_ids": set_ids,
+            "tracks": save_csr(tmp, "tracks", self.tracks),
+            "artist_tracks": save_csr(tmp, "artist_tracks", self.artist_tracks),
+            "set_artists": save_csr(
+                tmp, "set_artists", incidence([self.sets[s][0] for s in set_ids], len(self.artist_ids))
+            ),
+            "set_tracks": save_csr(
+                tmp, "set_tracks", incidence([self.sets[s][1] for s in set_ids], len(self.track_ids))
+            ),
+        }
+        with open(os.path.join(tmp, "meta.json"), mode="w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+        if os.path.isdir(directory):
+            old = directory.rstrip(os.sep) + ".old"
+            os.replace(directory, old)
+            os.replace(tmp, directory)
+            for name in os.listdir(old):
+                os.remove(os.path.join(old, name))
+            os.rmdir(old)
+        else:
+            os.replace(tmp, directory)
+
+    @classmethod
+    def load(cls, directory):
+        """Load matrices saved with ``save``, memory-mapping their arrays."""
+        with open(os.path.join(directory, "meta.json"), mode="r", encoding="utf-8") as f:
+            meta = json.load(f)
+
+        matrices = cls()
+        matrices.track_ids = IdMap(meta["track_ids"])
+        matrices.artist_ids = IdMap(meta["artist_ids"])
+        matrices.tracks = load_csr(directory, "tracks", meta["tracks"]["shape"])
+        matrices.artist_tracks = load_csr(directory, "artist_tracks", meta["artist_tracks"]["shape"])
+
+        set_artists = load_csr(directory, "set_artists", meta["set_artists"]["shape"])
+        set_tracks = load_csr(directory, "set_tracks", meta["set_tracks"]["shape"])
+        for row, set_id in enumerate(meta["set_ids"]):
+            matrices.sets[set_id] = (
+                set_artists.indices[set_artists.indptr[row]:set_artists.indptr[row + 1]],
+                set_tracks.indices[set_tracks.indptr[row]:set_tracks.indptr[row + 1]],
+            )
+        return matrices
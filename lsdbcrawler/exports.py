@@ -0,0 +1,248 @@
+import datetime
+import glob
+import gzip
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# part files are written under this suffix and renamed once they are complete
+IN_PROGRESS = ".inprogress"
+
+
+def json_default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value)
+
+
+class JsonLinesPart(object):
+    """Gzip compressed JSON lines part file."""
+
+    extension = ".jsonl.gz"
+
+    def __init__(self, path, schema=None):
+        self.path = path
+        self.file = gzip.open(path + IN_PROGRESS, mode="wt", encoding="utf-8")
+
+    @staticmethod
+    def schema(paths):
+        return None
+
+    def write(self, rows):
+        written = 0
+        for row in rows:
+            line = json.dumps(row, default=json_default, ensure_ascii=False) + "\n"
+            written += self.file.write(line)
+        return written
+
+    def close(self):
+        self.file.close()
+        os.replace(self.path + IN_PROGRESS, self.path)
+
+    @staticmethod
+    def read(path):
+        with gzip.open(path, mode="rt", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+
+class ParquetPart(object):
+    """Parquet part file, every write is one row group.
+
+    Lists and dicts are stored as JSON strings. A batch whose schema can't be
+    cast to the schema of the file is reported with ``SchemaChanged`` so the
+    caller can start a new part. A part opened with a ``schema``, e.g. the
+    ``schema`` of the parts it merges, writes every batch with that schema.
+    """
+
+    extension = ".parquet"
+
+    class SchemaChanged(Exception):
+        pass
+
+    def __init__(self, path, schema=None):
+        self.path = path
+        self.writer = None
+        self.fixed_schema = schema
+
+    @staticmethod
+    def schema(paths):
+        """Schema all of the part files at ``paths`` can be cast to."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        return pa.unify_schemas([pq.read_schema(path) for path in paths], promote_options="permissive")
+
+    @staticmethod
+    def table(rows, schema=None):
+        import pyarrow as pa
+
+        rows = [
+            {
+                key: json.dumps(value, default=json_default, ensure_ascii=False)
+                if isinstance(value, (list, dict))
+                else value
+                for key, value in row.items()
+            }
+            for row in rows
+        ]
+        return pa.Table.from_pylist(rows, schema=schema)
+
+    def write(self, rows):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = self.table(rows, self.fixed_schema)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path + IN_PROGRESS, table.schema)
+        elif not table.schema.equals(self.writer.schema):
+            schema = pa.unify_schemas(
+                [self.writer.schema, table.schema], promote_options="permissive"
+            )
+            if not schema.equals(self.writer.schema):
+                raise self.SchemaChanged(schema)
+            table = table.select(schema.names).cast(schema)
+
+        self.writer.write_table(table)
+        return table.nbytes
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            os.replace(self.path + IN_PROGRESS, self.path)
+
+    @staticmethod
+    def read(path):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches():
+            yield from batch.to_pylist()
+
+
+formats = {"jsonl": JsonLinesPart, "parquet": ParquetPart}
+
+
+class CollectionExport(object):
+    """Buffered, rotating export of the items of one collection.
+
+    Rows are buffered and written in batches of ``buffer_size``. The current
+    part file is closed and a new one started once ``rotate_bytes`` of
+    uncompressed data were written to it or it is older than
+    ``rotate_seconds``.
+    """
+
+    def __init__(self, directory, collection, unique_fields, part_cls,
+                 buffer_size=1000, rotate_bytes=128 * 1024 * 1024, rotate_seconds=3600):
+        self.directory = os.path.join(directory, collection)
+        self.collection = collection
+        self.unique_fields = unique_fields
+        self.part_cls = part_cls
+        self.buffer_size = buffer_size
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+
+        self.buffer = []
+        self.part = None
+        self.part_bytes = 0
+        self.part_started = 0
+        self.parts = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def add(self, row):
+        self.buffer.append(row)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def new_part(self):
+        self.close_part()
+        name = f"part-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{self.parts:05d}"
+        self.part = self.part_cls(os.path.join(self.directory, name + self.part_cls.extension))
+        self.part_bytes = 0
+        self.part_started = time.monotonic()
+        self.parts += 1
+
+    def close_part(self):
+        if self.part is not None:
+            self.part.close()
+            self.part = None
+
+    def flush(self):
+        if not self.buffer:
+            return
+
+        if self.part is None or (
+            self.rotate_seconds and time.monotonic() - self.part_started >= self.rotate_seconds
+        ):
+            self.new_part()
+
+        try:
+            self.part_bytes += self.part.write(self.buffer)
+        except getattr(self.part_cls, "SchemaChanged", ()):
+            self.new_part()
+            self.part_bytes += self.part.write(self.buffer)
+        self.buffer = []
+
+        if self.rotate_bytes and self.part_bytes >= self.rotate_bytes:
+            self.close_part()
+
+    def close(self):
+        self.flush()
+        self.close_part()
+
+
+def part_order(path):
+    """Sort key of part files in the order they were written, their last modification."""
+    return os.stat(path).st_mtime_ns, path
+
+
+def compact(directory, unique_fields, part_cls, batch_size=10000):
+    """Merge the part files in ``directory`` into one, keeping the last row per unique key.
+
+    Parts are read in the order they were written, a previously compacted
+    file first. Only the location of the last row of every key is kept in
+    memory: a first pass over the parts finds these locations and a second
+    one writes their rows in batches (row groups) of ``batch_size``. Returns
+    the number of rows kept and dropped.
+    """
+    compacted = os.path.join(directory, "compacted" + part_cls.extension)
+    parts = sorted(glob.glob(os.path.join(directory, "part-*" + part_cls.extension)), key=part_order)
+    if not parts:
+        return 0, 0
+    if os.path.isfile(compacted):
+        parts.insert(0, compacted)
+
+    def keyed_rows(path):
+        for row in part_cls.read(path):
+            yield tuple(json.dumps(row.get(field), default=json_default) for field in unique_fields), row
+
+    latest = {}
+    read = 0
+    for i, path in enumerate(parts):
+        for j, (key, _) in enumerate(keyed_rows(path)):
+            latest[key] = (i, j)
+            read += 1
+
+    # write next to the parts and swap in, a crash leaves the parts untouched
+    part = part_cls(compacted + ".new", schema=part_cls.schema(parts))
+    batch = []
+    for i, path in enumerate(parts):
+        for j, (key, row) in enumerate(keyed_rows(path)):
+            if latest[key] == (i, j):
+                batch.append(row)
+            if len(batch) >= batch_size:
+                part.write(batch)
+                batch = []
+    if batch or not latest:
+        part.write(batch)
+    part.close()
+
+    os.replace(compacted + ".new", compacted)
+    for path in parts:
+        if path != compacted:
+            os.remove(path)
+
+    logger.info("Compacted %s rows of %s parts in %s to %s rows", read, len(parts), directory, len(latest))
+    return len(latest), read - len(latest)
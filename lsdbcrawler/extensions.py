@@ -0,0 +1,551 @@
+import gc
+import itertools
+import json
+import logging
+import os
+import time
+import tracemalloc
+import urllib.parse
+
+from collections import OrderedDict
+
+from scrapy import Request, signals
+from scrapy.exceptions import DontCloseSpider, NotConfigured
+
+from twisted.internet import reactor, task
+from twisted.web.resource import Resource
+from twisted.web.server import NOT_DONE_YET, Site
+
+from lsdbcrawler import signals as lsdb_signals
+from lsdbcrawler.items import LivesetItem
+from lsdbcrawler.logs import BackgroundLogging, RateLimitFilter
+from lsdbcrawler.metrics import MetricsRegistry
+from lsdbcrawler.memory import (
+    FunctionIndex,
+    attribute_snapshot,
+    live_objects,
+    rss_bytes,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def proxy_label(proxy):
+    """Strip credentials from a proxy url so it can be used as a metric label."""
+    if not proxy:
+        return "none"
+    parsed = urllib.parse.urlparse(proxy)
+    return f"{parsed.hostname}:{parsed.port}" if parsed.port else str(parsed.hostname)
+
+
+class MetricsResource(Resource):
+    isLeaf = True
+
+    def __init__(self, exporter):
+        Resource.__init__(self)
+        self.exporter = exporter
+
+    def render_GET(self, request):
+        request.setHeader(b"Content-Type", MetricsRegistry.content_type.encode())
+        return self.exporter.render().encode("utf-8")
+
+
+class OpenMetricsExporter(object):
+    """Serve crawl, parse, proxy and database metrics in the OpenMetrics format.
+
+    Enabled with ``METRICS_ENABLED``; the endpoint listens on
+    ``METRICS_HOST``:``METRICS_PORT``.
+    """
+
+    def __init__(self, crawler, host, port):
+        self.crawler = crawler
+        self.host = host
+        self.port = port
+        self.listener = None
+
+        registry = self.registry = MetricsRegistry()
+        self.parse_seconds = registry.histogram(
+            "lsdb_parse_seconds", "Time spent in a spider callback", ["callback"]
+        )
+        self.items = registry.counter(
+            "lsdb_items", "Items scraped per collection", ["collection"]
+        )
+        self.db_write_seconds = registry.histogram(
+            "lsdb_db_write_seconds", "Latency of Mongo writes", ["collection"]
+        )
+        self.db_batch_size = registry.histogram(
+            "lsdb_db_batch_size",
+            "Number of operations per Mongo write",
+            ["collection"],
+            buckets=(1, 2, 5, 10, 50, 100, 500, 1000, 5000),
+        )
+        self.queue_depth = registry.gauge(
+            "lsdb_queue_depth", "Requests waiting or in progress", ["queue"]
+        )
+        self.proxy_responses = registry.counter(
+            "lsdb_proxy_responses", "Responses per proxy and outcome", ["proxy", "outcome"]
+        )
+        self.proxy_latency = registry.histogram(
+            "lsdb_proxy_latency_seconds", "Download latency per proxy", ["proxy"]
+        )
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+
+        if not settings.getbool("METRICS_ENABLED", default=False):
+            raise NotConfigured("OpenMetricsExporter is not enabled")
+
+        exporter = cls(
+            crawler,
+            host=settings.get("METRICS_HOST", "127.0.0.1"),
+            port=settings.getint("METRICS_PORT", 9410),
+        )
+
+        crawler.signals.connect(exporter.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(exporter.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(exporter.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(
+            exporter.response_received, signal=signals.response_received
+        )
+        crawler.signals.connect(
+            exporter.callback_parsed, signal=lsdb_signals.callback_parsed
+        )
+        crawler.signals.connect(
+            exporter.database_write, signal=lsdb_signals.database_write
+        )
+        crawler.signals.connect(exporter.proxy_failed, signal=lsdb_signals.proxy_failed)
+        return exporter
+
+    def spider_opened(self, spider):
+        self.listener = reactor.listenTCP(
+            self.port, Site(MetricsResource(self)), interface=self.host
+        )
+        logger.info("Serving OpenMetrics on http://%s:%s/metrics", self.host, self.port)
+
+    def spider_closed(self, spider):
+        if self.listener:
+            return self.listener.stopListening()
+
+    def item_scraped(self, item, spider):
+        self.items.inc(getattr(item, "collection", None) or type(item).__name__)
+
+    def callback_parsed(self, callback, seconds, **kwargs):
+        self.parse_seconds.observe(callback, value=seconds)
+
+    def database_write(self, collection, operations, seconds, **kwargs):
+        self.db_write_seconds.observe(collection, value=seconds)
+        self.db_batch_size.observe(collection, value=operations)
+
+    def response_received(self, response, request, spider):
+        proxy = proxy_label(request.meta.get("proxy"))
+        # LSDB answers with 500 when it is overloaded or blocking us
+        outcome = "error" if response.status >= 500 else "success"
+        self.proxy_responses.inc(proxy, outcome)
+
+        latency = request.meta.get("download_latency")
+        if latency is not None:
+            self.proxy_latency.observe(proxy, value=latency)
+
+    def proxy_failed(self, proxy, **kwargs):
+        self.proxy_responses.inc(proxy_label(proxy), "exception")
+
+    def update_queue_depths(self):
+        engine = self.crawler.engine
+        if engine is None or engine.slot is None:
+            return
+
+        downloader = engine.downloader
+        self.queue_depth.set("scheduler", value=len(engine.slot.scheduler))
+        self.queue_depth.set("downloader_active", value=len(downloader.active))
+        self.queue_depth.set(
+            "downloader_queued",
+            value=sum(len(slot.queue) for slot in downloader.slots.values()),
+        )
+
+    def render(self):
+        self.update_queue_depths()
+        return self.registry.render()
+
+
+class MemoryProfiler(object):
+    """Periodically sample memory use and report where it goes.
+
+    Every ``MEMPROF_INTERVAL`` seconds the RSS and traced memory are recorded
+    in stats and the live allocations are logged per lsdbcrawler function
+    (spider callbacks, pipelines, ...), together with the largest live object
+    types and the request meta size per callback. When the RSS crosses
+    ``MEMPROF_RSS_THRESHOLD_MB`` a tracemalloc snapshot is dumped to
+    ``MEMPROF_DIR`` for offline analysis.
+    """
+
+    def __init__(self, stats, interval, frames, threshold, directory, top):
+        self.stats = stats
+        self.interval = interval
+        self.frames = frames
+        self.threshold = threshold
+        self.directory = directory
+        self.top = top
+        self.index = FunctionIndex()
+        self.above_threshold = False
+        self.task = None
+        # only stop tracing that this extension started
+        self.started_tracing = False
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+
+        if not settings.getbool("MEMPROF_ENABLED", default=False):
+            raise NotConfigured("MemoryProfiler is not enabled")
+
+        profiler = cls(
+            crawler.stats,
+            interval=settings.getfloat("MEMPROF_INTERVAL", 60),
+            frames=settings.getint("MEMPROF_FRAMES", 25),
+            threshold=settings.getfloat("MEMPROF_RSS_THRESHOLD_MB", 0) * 1024 * 1024,
+            directory=settings.get("MEMPROF_DIR", "memprof"),
+            top=settings.getint("MEMPROF_TOP", 10),
+        )
+        crawler.signals.connect(profiler.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(profiler.spider_closed, signal=signals.spider_closed)
+        return profiler
+
+    def spider_opened(self, spider):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self.started_tracing = True
+        self.task = task.LoopingCall(self.sample, spider)
+        self.task.start(self.interval, now=False)
+
+    def spider_closed(self, spider):
+        if self.task and self.task.running:
+            self.task.stop()
+        self.sample(spider)
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    def sample(self, spider):
+        rss = rss_bytes()
+        traced, peak = tracemalloc.get_traced_memory()
+        self.stats.set_value("memprof/rss_mb", round(rss / 1024 / 1024, 1))
+        self.stats.max_value("memprof/max_rss_mb", round(rss / 1024 / 1024, 1))
+        self.stats.set_value("memprof/traced_mb", round(traced / 1024 / 1024, 1))
+        self.stats.max_value("memprof/peak_traced_mb", round(peak / 1024 / 1024, 1))
+
+        snapshot = tracemalloc.take_snapshot()
+        lines = [
+            f"Memory: rss={rss / 1024 / 1024:.1f}MB traced={traced / 1024 / 1024:.1f}MB",
+            "Live allocations by function:",
+        ]
+        for owner, size in attribute_snapshot(snapshot, self.index, self.top):
+            self.stats.set_value(f"memprof/alloc_kb/{owner}", size // 1024)
+            lines.append(f"  {size / 1024:>10.1f}KB {owner}")
+
+        types, meta = live_objects(gc.get_objects(), self.top)
+        lines.append("Largest live object types:")
+        for name, count, size in types:
+            lines.append(f"  {size / 1024:>10.1f}KB {count:>9} {name}")
+        lines.append("Request meta by callback:")
+        for callback, count, size in meta:
+            self.stats.set_value(f"memprof/meta_kb/{callback}", size // 1024)
+            lines.append(f"  {size / 1024:>10.1f}KB {count:>9} {callback}")
+        logger.info("\n".join(lines), extra={"spider": spider})
+
+        if self.threshold and rss >= self.threshold:
+            if not self.above_threshold:
+                self.dump(snapshot, rss)
+            self.above_threshold = True
+        else:
+            self.above_threshold = False
+
+    def dump(self, snapshot, rss):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(
+            self.directory, f"snapshot-{int(time.time())}-{rss // 1024 // 1024}MB.tracemalloc"
+        )
+        snapshot.dump(path)
+        self.stats.inc_value("memprof/snapshots")
+        logger.warning("RSS crossed the threshold, tracemalloc snapshot written to %s", path)
+
+
+class QueuedLogging(object):
+    """Write logs from a background thread and rate limit repetitive messages.
+
+    With ``LOG_QUEUE_ENABLED`` the root log handlers installed by scrapy are
+    run by a ``QueueListener`` thread. When ``LOG_RATE_LIMIT`` is set, at most
+    that many records below WARNING are logged per message template every
+    ``LOG_RATE_INTERVAL`` seconds; the number of suppressed records is kept in
+    the ``log/suppressed`` stat.
+    """
+
+    def __init__(self, stats, rate_limit=None):
+        self.stats = stats
+        self.rate_limit = rate_limit
+        self.background = BackgroundLogging(rate_limit=rate_limit)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+
+        if not settings.getbool("LOG_QUEUE_ENABLED", default=False):
+            raise NotConfigured("QueuedLogging is not enabled")
+
+        rate_limit = None
+        if settings.getint("LOG_RATE_LIMIT", 0) > 0:
+            rate_limit = RateLimitFilter(
+                limit=settings.getint("LOG_RATE_LIMIT"),
+                interval=settings.getfloat("LOG_RATE_INTERVAL", 60),
+            )
+
+        extension = cls(crawler.stats, rate_limit)
+        extension.background.start()
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        return extension
+
+    def spider_closed(self, spider):
+        self.background.stop()
+
+        if self.rate_limit is None:
+            return
+
+        self.stats.set_value("log/suppressed", self.rate_limit.suppressed)
+        for name, template, suppressed in self.rate_limit.pending():
+            logger.info(
+                "%s similar messages suppressed from %s: %s", suppressed, name, template
+            )
+
+
+class RefreshResource(Resource):
+    """HTTP API of the refresh daemon.
+
+    ``POST /refresh/<set_id>`` queues a refresh of a set and answers with the
+    job; add ``?wait=1`` to answer only once the job has finished.
+    ``GET /jobs/<job_id>`` returns the status of a job.
+    """
+
+    isLeaf = True
+
+    def __init__(self, daemon):
+        Resource.__init__(self)
+        self.daemon = daemon
+
+    def respond(self, request, status, body):
+        request.setResponseCode(status)
+        request.setHeader(b"Content-Type", b"application/json")
+        return json.dumps(body).encode("utf-8")
+
+    def render_POST(self, request):
+        path = [part.decode("utf-8") for part in request.postpath if part]
+        if len(path) != 2 or path[0] != "refresh" or not path[1].isdigit():
+            return self.respond(request, 404, {"error": "use POST /refresh/<set_id>"})
+
+        job = self.daemon.refresh(int(path[1]))
+        if request.args.get(b"wait", [b"0"])[0] in (b"1", b"true"):
+            disconnected = []
+            request.notifyFinish().addErrback(disconnected.append)
+            self.daemon.wait(job, lambda: self.finish_wait(request, job, disconnected))
+            return NOT_DONE_YET
+        return self.respond(request, 202, job)
+
+    def finish_wait(self, request, job, disconnected):
+        if disconnected:
+            return
+        status = {"done": 200, "timeout": 504}.get(job["status"], 502)
+        request.write(self.respond(request, status, job))
+        request.finish()
+
+    def render_GET(self, request):
+        path = [part.decode("utf-8") for part in request.postpath if part]
+        if len(path) != 2 or path[0] != "jobs":
+            return self.respond(request, 404, {"error": "use GET /jobs/<job_id>"})
+
+        job = self.daemon.jobs.get(path[1])
+        if job is None:
+            return self.respond(request, 404, {"error": "unknown job"})
+        return self.respond(request, 200, job)
+
+
+class RefreshDaemon(object):
+    """Keep the spider running and refresh single sets on demand.
+
+    With ``DAEMON_ENABLED`` the spider is not closed when it runs out of
+    requests. Refresh jobs received on ``REFRESH_HOST``:``REFRESH_PORT`` are
+    scheduled through ``parse_liveset`` at ``REFRESH_PRIORITY``, and a job is
+    done once its liveset item has gone through the item pipelines. A job
+    without an item after ``REFRESH_TIMEOUT`` seconds, e.g. when another node
+    of a shared frontier claimed its request, times out. Run it with
+    ``scrapy daemon``.
+    """
+
+    max_jobs = 10000
+
+    def __init__(self, crawler, host, port, priority, url, timeout=300, clock=reactor):
+        self.crawler = crawler
+        self.host = host
+        self.port = port
+        self.priority = priority
+        self.url = url
+        self.timeout = timeout
+        self.clock = clock
+        self.timeouts = {}
+        self.listener = None
+        self.spider = None
+        self.jobs = OrderedDict()
+        self.pending = {}
+        self.waiters = {}
+        self.ids = itertools.count(1)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+
+        if not settings.getbool("DAEMON_ENABLED", default=False):
+            raise NotConfigured("RefreshDaemon is not enabled")
+
+        daemon = cls(
+            crawler,
+            host=settings.get("REFRESH_HOST", "127.0.0.1"),
+            port=settings.getint("REFRESH_PORT", 9411),
+            priority=settings.getint("REFRESH_PRIORITY", 1000),
+            url=settings.get("REFRESH_URL", "https://lsdb.eu/set/{set_id}/?page=1"),
+            timeout=settings.getfloat("REFRESH_TIMEOUT", 300),
+        )
+        crawler.signals.connect(daemon.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(daemon.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(daemon.spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(daemon.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(daemon.item_dropped, signal=signals.item_dropped)
+        crawler.signals.connect(daemon.item_dropped, signal=signals.item_error)
+        crawler.signals.connect(daemon.spider_error, signal=signals.spider_error)
+        crawler.signals.connect(daemon.refresh_failed, signal=lsdb_signals.refresh_failed)
+        return daemon
+
+    def spider_opened(self, spider):
+        self.spider = spider
+        self.listener = reactor.listenTCP(
+            self.port, Site(RefreshResource(self)), interface=self.host
+        )
+        logger.info("Accepting refresh jobs on http://%s:%s", self.host, self.port)
+
+    def spider_closed(self, spider):
+        for set_id in list(self.pending):
+            self.finish_set(set_id, "failed", "spider closed")
+        if self.listener:
+            return self.listener.stopListening()
+
+    def spider_idle(self, spider):
+        raise DontCloseSpider("waiting for refresh jobs")
+
+    def refresh(self, set_id):
+        job = {
+            "job": str(next(self.ids)),
+            "set_id": set_id,
+            "status": "pending",
+            "created": time.time(),
+            "seconds": None,
+            "error": None,
+        }
+        self.jobs[job["job"]] = job
+        while len(self.jobs) > self.max_jobs:
+            _, evicted = self.jobs.popitem(last=False)
+            if evicted["status"] == "pending":
+                self.discard(evicted)
+                self.finish(evicted, "failed", "evicted, too many jobs")
+
+        self.pending.setdefault(set_id, []).append(job["job"])
+        if self.timeout:
+            self.timeouts[job["job"]] = self.clock.callLater(self.timeout, self.timed_out, job)
+        request = Request(
+            self.url.format(set_id=set_id),
+            callback=self.spider.parse_liveset,
+            # a spider method, so the request can be serialized
+            errback=self.spider.refresh_failed,
+            priority=self.priority,
+            dont_filter=True,
+            meta={"refresh_set_id": set_id},
+        )
+        self.crawler.engine.crawl(request)
+        self.crawler.stats.inc_value("daemon/jobs")
+        return job
+
+    def wait(self, job, callback):
+        if job["status"] != "pending":
+            callback()
+        else:
+            self.waiters.setdefault(job["job"], []).append(callback)
+
+    def discard(self, job):
+        """Remove a job from the pending jobs of its set."""
+        job_ids = self.pending.get(job["set_id"], [])
+        if job["job"] in job_ids:
+            job_ids.remove(job["job"])
+        if not job_ids:
+            self.pending.pop(job["set_id"], None)
+
+    def timed_out(self, job):
+        self.timeouts.pop(job["job"], None)
+        if job["status"] == "pending":
+            self.discard(job)
+            self.finish(job, "timeout", f"no liveset item within {self.timeout:g} seconds")
+
+    def finish(self, job, status, error=None):
+        call = self.timeouts.pop(job["job"], None)
+        if call is not None and call.active():
+            call.cancel()
+
+        job["status"] = status
+        job["error"] = error
+        job["seconds"] = round(time.time() - job["created"], 3)
+        self.crawler.stats.inc_value(f"daemon/jobs_{status}")
+
+        for callback in self.waiters.pop(job["job"], []):
+            callback()
+
+    def finish_set(self, set_id, status, error=None):
+        for job_id in self.pending.pop(set_id, []):
+            if job_id in self.jobs:
+                self.finish(self.jobs[job_id], status, error)
+
+    def item_scraped(self, item, spider, **kwargs):
+        if isinstance(item, LivesetItem):
+            self.finish_set(item["set_id"], "done")
+
+    def item_dropped(self, item, spider, **kwargs):
+        if isinstance(item, LivesetItem):
+            reason = kwargs.get("exception") or kwargs.get("failure")
+            self.finish_set(item["set_id"], "failed", str(reason))
+
+    def spider_error(self, failure, response, spider):
+        set_id = response.meta.get("refresh_set_id")
+        if set_id is not None:
+            self.finish_set(set_id, "failed", failure.getErrorMessage())
+
+    def refresh_failed(self, request, failure, spider):
+        set_id = request.meta.get("refresh_set_id")
+        self.finish_set(set_id, "failed", failure.getErrorMessage())
+
+
+class StatsFileWriter(object):
+    """Write the final crawl stats as JSON to ``STATS_FILE``."""
+
+    def __init__(self, stats, path):
+        self.stats = stats
+        self.path = path
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get("STATS_FILE")
+        if not path:
+            raise NotConfigured("STATS_FILE is not set")
+
+        extension = cls(crawler.stats, path)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        return extension
+
+    def spider_closed(self, spider, reason):
+        stats = dict(self.stats.get_stats())
+        stats["finish_reason"] = reason
+        with open(self.path, mode="w", encoding="utf-8") as f:
+            json.dump(stats, f, default=str, indent=1, sort_keys=True)
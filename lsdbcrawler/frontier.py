@@ -0,0 +1,313 @@
+import logging
+import time
+
+from scrapy.dupefilters import BaseDupeFilter
+from scrapy.utils.misc import load_object
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+LEASED = "leased"
+
+
+class MemoryFrontierStore(object):
+    """In-process frontier store with the semantics of ``MongoFrontierStore``.
+
+    Stores are shared per ``name`` within a process, so several crawlers in
+    one process (or several schedulers in a test) work on the same frontier.
+    """
+
+    stores = {}
+
+    def __init__(self, name="frontier", clock=time.time):
+        self.name = name
+        self.clock = clock
+        self.requests = {}
+        self.seen = set()
+        self.nodes = {}
+
+    @classmethod
+    def from_settings(cls, settings):
+        name = settings.get("FRONTIER_NAME")
+        if name not in cls.stores:
+            cls.stores[name] = cls(name)
+        return cls.stores[name]
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def add_seen(self, fingerprint):
+        if fingerprint in self.seen:
+            return False
+        self.seen.add(fingerprint)
+        return True
+
+    def push(self, key, data, priority):
+        if key in self.requests:
+            return False
+        self.requests[key] = {
+            "data": data,
+            "priority": priority,
+            "queued_at": self.clock(),
+            "state": QUEUED,
+            "node": None,
+            "lease_until": None,
+        }
+        return True
+
+    def claimable(self, document, now):
+        return document["state"] == QUEUED or document["lease_until"] < now
+
+    def claim(self, node, lease):
+        now = self.clock()
+        candidates = [
+            (key, document)
+            for key, document in self.requests.items()
+            if self.claimable(document, now)
+        ]
+        if not candidates:
+            return None
+
+        key, document = min(
+            candidates, key=lambda c: (-c[1]["priority"], c[1]["queued_at"])
+        )
+        previous_node = document["node"] if document["state"] == LEASED else None
+        document.update({"state": LEASED, "node": node, "lease_until": now + lease})
+        return key, document["data"], previous_node
+
+    def complete(self, key, node):
+        document = self.requests.get(key)
+        if document is None or document["node"] != node:
+            return False
+        del self.requests[key]
+        return True
+
+    def renew(self, node, lease):
+        lease_until = self.clock() + lease
+        renewed = 0
+        for document in self.requests.values():
+            if document["state"] == LEASED and document["node"] == node:
+                document["lease_until"] = lease_until
+                renewed += 1
+        return renewed
+
+    def release(self, node):
+        released = 0
+        for document in self.requests.values():
+            if document["state"] == LEASED and document["node"] == node:
+                document.update({"state": QUEUED, "node": None, "lease_until": None})
+                released += 1
+        return released
+
+    def pending(self):
+        return len(self.requests)
+
+    def size(self):
+        return len(self.requests)
+
+    def new_crawl(self, idle):
+        if self.requests or any(
+            stats["active"] and stats["last_seen"] >= self.clock() - idle
+            for stats in self.nodes.values()
+        ):
+            return False
+        self.seen.clear()
+        return True
+
+    def update_node(self, node, stats, active=True):
+        self.nodes[node] = dict(stats, active=active, last_seen=self.clock())
+
+    def node_stats(self):
+        return dict(self.nodes)
+
+
+class MongoFrontierStore(object):
+    """Frontier shared by several crawler nodes through MongoDB.
+
+    Requests live in ``<name>_requests``, fingerprints of seen requests in
+    ``<name>_seen`` and the stats each node reports in ``<name>_nodes``.
+    Fingerprints are kept for one crawl: ``new_crawl`` clears them when the
+    first node of a crawl joins an empty frontier.
+    Claiming is a single ``find_one_and_update``, so a request is handed to
+    one node only; its lease has to be renewed by that node or any node may
+    claim it again once the lease expired.
+
+    ``pending`` is polled by the engine several times a second; a non-zero
+    count is reused for ``pending_interval`` seconds. A zero count is never
+    reused, so a node doesn't close on a stale result.
+    """
+
+    def __init__(self, uri, database, name="frontier", clock=time.time, pending_interval=1.0):
+        self.uri = uri
+        self.database_name = database
+        self.name = name
+        self.clock = clock
+        self.pending_interval = pending_interval
+        self.pending_cache = (0, 0)
+        self.client = None
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            settings.get("MONGODB_URI"),
+            settings.get("MONGODB_DATABASE"),
+            settings.get("FRONTIER_NAME"),
+            pending_interval=settings.getfloat("FRONTIER_PENDING_INTERVAL", 1.0),
+        )
+
+    def open(self):
+        # opened by the scheduler and by SharedDupeFilter, they share the client
+        if self.client is not None:
+            return
+
+        import pymongo
+
+        self.client = pymongo.MongoClient(self.uri)
+        database = self.client[self.database_name]
+        self.requests = database[f"{self.name}_requests"]
+        self.seen = database[f"{self.name}_seen"]
+        self.nodes = database[f"{self.name}_nodes"]
+
+        self.requests.create_index(
+            [("state", pymongo.ASCENDING), ("priority", pymongo.DESCENDING), ("queued_at", pymongo.ASCENDING)]
+        )
+        self.requests.create_index([("node", pymongo.ASCENDING), ("state", pymongo.ASCENDING)])
+
+    def close(self):
+        if self.client:
+            self.client.close()
+            self.client = None
+
+    def add_seen(self, fingerprint):
+        from pymongo.errors import DuplicateKeyError
+
+        try:
+            self.seen.insert_one({"_id": fingerprint})
+        except DuplicateKeyError:
+            return False
+        return True
+
+    def push(self, key, data, priority):
+        from pymongo.errors import DuplicateKeyError
+
+        try:
+            self.requests.insert_one({
+                "_id": key,
+                "data": data,
+                "priority": priority,
+                "queued_at": self.clock(),
+                "state": QUEUED,
+                "node": None,
+                "lease_until": None,
+            })
+        except DuplicateKeyError:
+            return False
+        return True
+
+    def claim(self, node, lease):
+        from pymongo import ASCENDING, DESCENDING, ReturnDocument
+
+        now = self.clock()
+        document = self.requests.find_one_and_update(
+            {"$or": [{"state": QUEUED}, {"state": LEASED, "lease_until": {"$lt": now}}]},
+            {"$set": {"state": LEASED, "node": node, "lease_until": now + lease}},
+            sort=[("priority", DESCENDING), ("queued_at", ASCENDING)],
+            return_document=ReturnDocument.BEFORE,
+        )
+        if document is None:
+            return None
+
+        previous_node = document["node"] if document["state"] == LEASED else None
+        return document["_id"], document["data"], previous_node
+
+    def complete(self, key, node):
+        return self.requests.delete_one({"_id": key, "node": node}).deleted_count == 1
+
+    def renew(self, node, lease):
+        return self.requests.update_many(
+            {"state": LEASED, "node": node},
+            {"$set": {"lease_until": self.clock() + lease}},
+        ).modified_count
+
+    def release(self, node):
+        return self.requests.update_many(
+            {"state": LEASED, "node": node},
+            {"$set": {"state": QUEUED, "node": None, "lease_until": None}},
+        ).modified_count
+
+    def pending(self):
+        count, counted_at = self.pending_cache
+        now = self.clock()
+        if count and now - counted_at < self.pending_interval:
+            return count
+
+        count = self.requests.count_documents({}, limit=1)
+        self.pending_cache = (count, now)
+        return count
+
+    def size(self):
+        """Number of requests in the frontier, from the collection metadata."""
+        return self.requests.estimated_document_count()
+
+    def new_crawl(self, idle):
+        """Clear the seen fingerprints if no crawl is running; returns whether it did.
+
+        A crawl is running while requests are left in the frontier or a node
+        that hasn't closed reported in the last ``idle`` seconds.
+        """
+        active = {"active": True, "last_seen": {"$gte": self.clock() - idle}}
+        if self.requests.count_documents({}, limit=1) or self.nodes.count_documents(active, limit=1):
+            return False
+        self.seen.delete_many({})
+        return True
+
+    def update_node(self, node, stats, active=True):
+        self.nodes.update_one(
+            {"_id": node},
+            {"$set": dict(stats, active=active, last_seen=self.clock())},
+            upsert=True,
+        )
+
+    def node_stats(self):
+        return {document.pop("_id"): document for document in self.nodes.find()}
+
+
+def frontier_store(settings):
+    """Frontier store configured by ``FRONTIER_STORE``, shared by scheduler and dupefilter."""
+    return load_object(settings.get("FRONTIER_STORE")).from_settings(settings)
+
+
+class SharedDupeFilter(BaseDupeFilter):
+    """Request fingerprint filter on the fingerprints seen by all nodes."""
+
+    def __init__(self, store, fingerprinter, debug=False):
+        self.store = store
+        self.fingerprinter = fingerprinter
+        self.debug = debug
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(
+            frontier_store(crawler.settings),
+            crawler.request_fingerprinter,
+            crawler.settings.getbool("DUPEFILTER_DEBUG"),
+        )
+
+    def open(self):
+        self.store.open()
+
+    def close(self, reason):
+        self.store.close()
+
+    def request_fingerprint(self, request):
+        return self.fingerprinter.fingerprint(request).hex()
+
+    def request_seen(self, request):
+        return not self.store.add_seen(self.request_fingerprint(request))
+
+    def log(self, request, spider):
+        if self.debug:
+            logger.debug("Filtered duplicate request: %s", request, extra={"spider": spider})
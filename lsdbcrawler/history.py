@@ -0,0 +1,200 @@
+import datetime
+import difflib
+import json
+import logging
+
+from lsdbcrawler.matching import normalize
+
+logger = logging.getLogger(__name__)
+
+HISTORY = "tracklist_history"
+
+# added to old-style tracks by TrackMatchPipeline, they aren't edits of the set
+MATCH_FIELDS = ("track_id", "match_confidence")
+
+
+def track_identity(track):
+    """What makes a track the same track across edits of its other fields.
+
+    The track id of linked tracks, else the normalized name. Never the
+    ``track_index``, it is the position and shifts with every insertion.
+    """
+    if track.get("track_id"):
+        return json.dumps(["id", track["track_id"]], default=str)
+    return json.dumps(["name", normalize(track.get("track_name") or "")])
+
+
+def strip_matches(tracks):
+    """Copy of ``tracks`` without the ``MATCH_FIELDS`` of matched tracks."""
+    return [
+        {key: value for key, value in track.items() if key not in MATCH_FIELDS}
+        if "match_confidence" in track else track
+        for track in tracks
+    ]
+
+
+def rename(old, new):
+    """Fields of ``new`` that differ from ``old``, removed fields in ``__unset``."""
+    changes = {key: value for key, value in new.items() if old.get(key, object()) != value}
+    unset = [key for key in old if key not in new]
+    if unset:
+        changes["__unset"] = unset
+    return changes
+
+
+def diff_tracks(old, new):
+    """Structural diff of two tracklists as positional operations on ``old``.
+
+    Operations are ``["d", position, count]`` (deletion), ``["i", position,
+    tracks]`` (insertion) and ``["r", position, changes]`` (changed fields of
+    consecutive tracks, see ``rename``). Positions refer to ``old`` and the
+    operations are in ascending order.
+
+    Tracks are aligned on their ``track_identity``, so an edited name of a
+    linked track is a rename rather than a deletion and an insertion, and an
+    inserted track doesn't change the tracks after it.
+    """
+    matcher = difflib.SequenceMatcher(
+        None, [track_identity(t) for t in old], [track_identity(t) for t in new], autojunk=False
+    )
+    operations = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            run = None
+            for k in range(i2 - i1):
+                if old[i1 + k] == new[j1 + k]:
+                    run = None
+                    continue
+                if run is None:
+                    run = ["r", i1 + k, []]
+                    operations.append(run)
+                run[2].append(rename(old[i1 + k], new[j1 + k]))
+        elif tag == "delete":
+            operations.append(["d", i1, i2 - i1])
+        elif tag == "insert":
+            operations.append(["i", i1, new[j1:j2]])
+        else:
+            common = min(i2 - i1, j2 - j1)
+            operations.append(
+                ["r", i1, [rename(old[i1 + k], new[j1 + k]) for k in range(common)]]
+            )
+            if i2 - i1 > common:
+                operations.append(["d", i1 + common, i2 - i1 - common])
+            elif j2 - j1 > common:
+                operations.append(["i", i2, new[j1 + common:j2]])
+    return operations
+
+
+def apply_delta(tracks, operations):
+    """Apply operations of ``diff_tracks`` to a copy of ``tracks``."""
+    tracks = [dict(track) for track in tracks]
+    # from the end so the positions of earlier operations stay valid
+    for operation, position, value in reversed(operations):
+        if operation == "d":
+            del tracks[position:position + value]
+        elif operation == "i":
+            tracks[position:position] = [dict(track) for track in value]
+        else:
+            for k, changes in enumerate(value):
+                track = tracks[position + k]
+                for key in changes.get("__unset", []):
+                    track.pop(key, None)
+                track.update({key: v for key, v in changes.items() if key != "__unset"})
+    return tracks
+
+
+class TracklistHistory(object):
+    """Tracklist versions of every set kept as deltas in MongoDB.
+
+    Version 0 of a set inserts its first known tracklist, every later version
+    is the ``diff_tracks`` delta to the version before it, so storage grows
+    with the size of the edits. Track matches are left out of the history, a
+    set matched again to other tracks isn't a new version.
+    """
+
+    def __init__(self, database):
+        self.collection = database[HISTORY]
+
+    def create_indexes(self):
+        import pymongo
+
+        self.collection.create_index(
+            [("set_id", pymongo.ASCENDING), ("version", pymongo.ASCENDING)], unique=True
+        )
+
+    def last_version(self, set_id):
+        document = self.collection.find_one(
+            {"set_id": set_id}, {"version": 1}, sort=[("version", -1)]
+        )
+        return document["version"] if document else None
+
+    def record(self, set_id, stored, tracks, updated=None, retries=3):
+        """Append the delta from the ``stored`` to the new ``tracks``.
+
+        Returns the new version, or None if the tracklist didn't change. When
+        another node recorded a version of the set in the meantime, the delta
+        is taken again from the latest version in the history.
+        """
+        from pymongo.errors import DuplicateKeyError
+
+        stored = strip_matches(stored) if stored else stored
+        tracks = strip_matches(tracks)
+        for _ in range(retries):
+            try:
+                return self._record(set_id, stored, tracks, updated)
+            except DuplicateKeyError:
+                stored = self.reconstruct(set_id)
+
+        logger.warning("Gave up recording a tracklist version of set %s, it is edited concurrently", set_id)
+        return None
+
+    def _record(self, set_id, stored, tracks, updated):
+        version = self.last_version(set_id)
+        documents = []
+        if version is None:
+            version = -1
+            if stored:
+                # history starts after the set was first stored
+                documents.append(self.document(set_id, 0, diff_tracks([], stored)))
+                version = 0
+
+        delta = diff_tracks(stored or [], tracks)
+        if delta or version < 0:
+            version += 1
+            documents.append(self.document(set_id, version, delta, updated))
+
+        if not documents:
+            return None
+        self.collection.insert_many(documents)
+        return version
+
+    @staticmethod
+    def document(set_id, version, delta, updated=None):
+        return {
+            "set_id": set_id,
+            "version": version,
+            "delta": delta,
+            "updated": updated or None,
+            "recorded": datetime.datetime.now(datetime.timezone.utc),
+        }
+
+    def versions(self, set_id):
+        """Version numbers and edit info of a set, without the deltas."""
+        return list(
+            self.collection.find({"set_id": set_id}, {"_id": 0, "delta": 0}).sort("version", 1)
+        )
+
+    def reconstruct(self, set_id, version=None):
+        """Tracklist of a set at ``version``, the latest version by default."""
+        query = {"set_id": set_id}
+        if version is not None:
+            query["version"] = {"$lte": version}
+
+        tracks = []
+        found = False
+        for document in self.collection.find(query, {"delta": 1, "version": 1}).sort("version", 1):
+            tracks = apply_delta(tracks, document["delta"])
+            found = True
+        if not found:
+            raise KeyError(f"No tracklist history of set {set_id}")
+        return tracks
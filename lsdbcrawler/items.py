@@ -1,32 +1,72 @@
 import scrapy
+from dataclasses import dataclass
 from pprint import pformat
 
+
+def check_item_schema(cls):
+    """Validate the ``unique_fields`` and ``collection`` of an item class."""
+    if cls.unique_fields is None:
+        raise NotImplementedError(f"'unique_fields' not defined in {cls.__name__}")
+
+    if cls.collection is None:
+        raise NotImplementedError(f"'collection' not defined in {cls.__name__}")
+
+    if not isinstance(cls.unique_fields, list):
+        raise TypeError(f"'unique_fields' must be a list in {cls.__name__}")
+
+    if not isinstance(cls.collection, str):
+        raise TypeError(f"'collection' must be a string in {cls.__name__}")
+
+
 class BaseItem(scrapy.Item):
     unique_fields = None
     collection = None
 
-    def __init__(self, *args, **kwargs):
-        super(BaseItem, self).__init__(*args, **kwargs)
+    def __init_subclass__(cls, **kwargs):
+        # validated once when the class is created instead of on every instance.
+        # ItemMeta also runs this for its internal "x_" classes, skip those.
+        if issubclass(cls, BaseItem):
+            # not super(): ItemMeta builds the "x_" class from the same body,
+            # which binds its __class__ cell to that class
+            super(BaseItem, cls).__init_subclass__(**kwargs)
+            check_item_schema(cls)
 
-        if self.unique_fields is None:
-            raise NotImplementedError(
-                f"'unique_fields' not defined in {self.__class__.__name__}"
-            )
 
-        if self.collection is None:
-            raise NotImplementedError(
-                f"'collection' not defined in {self.__class__.__name__}"
-            )
+class CompactItem(object):
+    """Base for slotted dataclass items.
 
-        if not isinstance(self.unique_fields, list):
-            raise TypeError(
-                f"'unique_fields' must be a list in {self.__class__.__name__}"
-            )
+    Compact items store their values in slots instead of a dict and support
+    the same ``item["field"]`` access as scrapy items, so they can be used
+    with ``ItemAdapter`` and ``MongoPipeline`` in place of a ``BaseItem``.
+    All fields default to ``None``.
+    """
 
-        if not isinstance(self.collection, str):
-            raise TypeError(
-                f"'collection' must be a string in {self.__class__.__name__}"
-            )
+    __slots__ = ()
+    unique_fields = None
+    collection = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        check_item_schema(cls)
+
+    def __getitem__(self, key):
+        if key not in self.__dataclass_fields__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__dataclass_fields__:
+            raise KeyError(f"{self.__class__.__name__} does not support field: {key}")
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.__dataclass_fields__
+
+    def __iter__(self):
+        return iter(self.__dataclass_fields__)
+
+    def keys(self):
+        return self.__dataclass_fields__.keys()
 
 class LivesetItem(BaseItem):
     collection = "liveset"
@@ -137,6 +177,21 @@ class FavoriteItem(BaseItem):
     user_name = scrapy.Field()
 
 
+class LivesetVotesItem(BaseItem):
+    """All ratings and favorites of a set, written to the "rating" and
+    "favorite" collections as a diff against the stored state."""
+
+    collection = "liveset_votes"
+    unique_fields = ["liveset_set_id"]
+
+    liveset_set_id = scrapy.Field()
+    ratings = scrapy.Field()
+    favorites = scrapy.Field()
+
+    def __repr__(self):
+        return repr({"liveset_set_id": self["liveset_set_id"]})
+
+
 class CommentItem(BaseItem):
     collection = "comment"
     unique_fields = ["comment_id"]
@@ -158,3 +213,80 @@ class FailedRequestItem(BaseItem):
     url = scrapy.Field()
     status = scrapy.Field()
     meta = scrapy.Field()
+
+
+@dataclass(slots=True)
+class CompactTrackItem(CompactItem):
+    collection = "track"
+    unique_fields = ["track_id"]
+
+    track_id: int = None
+    track_name: str = None
+
+
+@dataclass(slots=True)
+class CompactArtistItem(CompactItem):
+    collection = "artist"
+    unique_fields = ["artist_id"]
+
+    artist_id: int = None
+    name: str = None
+
+
+@dataclass(slots=True)
+class CompactGenreItem(CompactItem):
+    collection = "genre"
+    unique_fields = ["genre_id"]
+
+    genre_id: str = None
+    name: str = None
+
+
+@dataclass(slots=True)
+class CompactTagItem(CompactItem):
+    collection = "tag"
+    unique_fields = ["tag_id"]
+
+    tag_id: str = None
+    name: str = None
+
+
+@dataclass(slots=True)
+class CompactEventItem(CompactItem):
+    collection = "event"
+    unique_fields = ["event_id"]
+
+    event_id: int = None
+    name: str = None
+
+
+@dataclass(slots=True)
+class CompactRaitingItem(CompactItem):
+    collection = "rating"
+    unique_fields = ["liveset_set_id", "user_name"]
+
+    liveset_set_id: int = None
+    user_name: str = None
+    rating: int = None
+
+
+@dataclass(slots=True)
+class CompactFavoriteItem(CompactItem):
+    collection = "favorite"
+    unique_fields = ["liveset_set_id", "user_name"]
+
+    liveset_set_id: int = None
+    user_name: str = None
+
+
+# item classes replaced by their compact variant when COMPACT_ITEMS is enabled
+compact_items = {
+    TrackItem: CompactTrackItem,
+    ArtistItem: CompactArtistItem,
+    GenreItem: CompactGenreItem,
+    TagItem: CompactTagItem,
+    EventItem: CompactEventItem,
+    RaitingItem: CompactRaitingItem,
+    FavoriteItem: CompactFavoriteItem,
+}
+
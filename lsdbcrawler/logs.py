@@ -0,0 +1,133 @@
+import copy
+import logging
+import queue
+import time
+from collections import Counter
+from logging.handlers import QueueHandler, QueueListener
+
+
+class BackgroundQueueHandler(QueueHandler):
+    """Queue handler leaving formatting and writing to the listener thread.
+
+    Only the message arguments are merged in the calling thread, so that
+    mutable arguments cannot change the message after it was logged.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class RateLimitFilter(logging.Filter):
+    """Let through at most ``limit`` records per message template and interval.
+
+    Records at or above ``max_level`` are never limited. The first record let
+    through after suppressing is annotated with the number of records that
+    were dropped. Expired windows are dropped once per ``interval``, the
+    records they suppressed are kept for ``pending``.
+    """
+
+    def __init__(self, limit, interval, max_level=logging.WARNING):
+        super(RateLimitFilter, self).__init__()
+        self.limit = limit
+        self.interval = interval
+        self.max_level = max_level
+        # (logger name, template) -> [window start, count, suppressed]
+        self.windows = {}
+        # (logger name, template) -> suppressed records of dropped windows
+        self.unreported = Counter()
+        self.suppressed = 0
+        self.evicted_at = time.monotonic()
+
+    def evict(self, now):
+        expired = [key for key, window in self.windows.items() if now - window[0] >= self.interval]
+        for key in expired:
+            suppressed = self.windows.pop(key)[2]
+            if suppressed:
+                self.unreported[key] += suppressed
+        self.evicted_at = now
+
+    def filter(self, record):
+        if record.levelno >= self.max_level:
+            return True
+
+        now = time.monotonic()
+        if now - self.evicted_at >= self.interval:
+            self.evict(now)
+
+        key = (record.name, record.msg)
+        window = self.windows.get(key)
+        if window is None or now - window[0] >= self.interval:
+            suppressed = (window[2] if window else 0) + self.unreported.pop(key, 0)
+            self.windows[key] = [now, 1, 0]
+            if suppressed:
+                record.msg = f"{record.msg} [{suppressed} similar messages suppressed]"
+            return True
+
+        window[1] += 1
+        if window[1] <= self.limit:
+            return True
+
+        window[2] += 1
+        self.suppressed += 1
+        return False
+
+    def pending(self):
+        """Templates with records suppressed since the last record let through."""
+        pending = Counter(self.unreported)
+        for key, window in self.windows.items():
+            if window[2]:
+                pending[key] += window[2]
+        return [(name, template, suppressed) for (name, template), suppressed in pending.items()]
+
+
+class BackgroundLogging(object):
+    """Move the writing of log handlers to a background thread.
+
+    Handlers doing I/O (stream and file handlers) are replaced on their
+    logger by a single ``BackgroundQueueHandler`` feeding a ``QueueListener``
+    that runs the original handlers.
+    """
+
+    def __init__(self, logger=None, rate_limit=None):
+        self.logger = logger or logging.getLogger()
+        self.rate_limit = rate_limit
+        self.handlers = []
+        self.queue_handler = None
+        self.listener = None
+
+    def start(self):
+        self.handlers = [
+            handler
+            for handler in self.logger.handlers
+            if isinstance(handler, logging.StreamHandler)
+        ]
+        if not self.handlers:
+            return
+
+        log_queue = queue.SimpleQueue()
+        self.queue_handler = BackgroundQueueHandler(log_queue)
+        self.queue_handler.setLevel(min(handler.level for handler in self.handlers))
+        if self.rate_limit:
+            self.queue_handler.addFilter(self.rate_limit)
+
+        for handler in self.handlers:
+            self.logger.removeHandler(handler)
+        self.logger.addHandler(self.queue_handler)
+
+        self.listener = QueueListener(
+            log_queue, *self.handlers, respect_handler_level=True
+        )
+        self.listener.start()
+
+    def stop(self):
+        if self.listener is None:
+            return
+
+        self.listener.stop()
+        self.logger.removeHandler(self.queue_handler)
+        for handler in self.handlers:
+            self.logger.addHandler(handler)
+        self.listener = None
@@ -0,0 +1,139 @@
+import logging
+import os
+import re
+import unicodedata
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+non_alnum_regex = re.compile(r"[^0-9a-z]+")
+
+
+def normalize(name):
+    """Lower case ``name`` without accents and punctuation."""
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    return non_alnum_regex.sub(" ", name.lower()).strip()
+
+
+def ngrams(name, n=3):
+    """Character n-grams of a normalized name, padded so short words count."""
+    padded = f" {name} "
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+def dice(a, b):
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+class TrackIndex(object):
+    """Character n-gram inverted index of track names.
+
+    ``match`` looks up the postings of the n-grams of a name, skipping
+    n-grams shared by more than ``stop_fraction`` of all tracks (but at least
+    100), and keeps the ``candidates`` tracks sharing the most n-grams whose
+    size can still reach ``threshold``. Those are scored with the Dice
+    coefficient of their n-gram sets, which is returned as the confidence of
+    the best match.
+
+    With a ``path`` the normalized names are persisted to a tab separated
+    file, one ``track_id, name`` per line; the postings are rebuilt when it is
+    opened. Every line is written at once, so several processes can append
+    to the same file.
+    """
+
+    def __init__(self, path=None, n=3, threshold=0.75, candidates=20, stop_fraction=0.05):
+        self.path = path
+        self.n = n
+        self.threshold = threshold
+        self.candidates = candidates
+        self.stop_fraction = stop_fraction
+        self.names = {}
+        self.sizes = {}
+        self.postings = {}
+        self._file = None
+
+    def open(self):
+        if self.path and os.path.isfile(self.path):
+            with open(self.path, mode="r", encoding="utf-8") as f:
+                for line in f:
+                    track_id, _, name = line.rstrip("\n").partition("\t")
+                    if name:
+                        self._index(int(track_id), name)
+
+        if self.path:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # line buffered, shards append to the same file
+            self._file = open(self.path, mode="a", encoding="utf-8", buffering=1)
+        logger.info("Loaded %s track names into the n-gram index", len(self.names))
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _index(self, track_id, name):
+        name = normalize(name)
+        old = self.names.get(track_id)
+        if old == name:
+            return False
+        if old is not None:
+            for gram in ngrams(old, self.n):
+                self.postings[gram].remove(track_id)
+
+        grams = ngrams(name, self.n)
+        self.names[track_id] = name
+        self.sizes[track_id] = len(grams)
+        for gram in grams:
+            self.postings.setdefault(gram, []).append(track_id)
+        return True
+
+    def add(self, track_id, name):
+        """Index a track name; returns False if it was already indexed."""
+        if not track_id or not name:
+            return False
+        if not self._index(track_id, name):
+            return False
+        if self._file:
+            self._file.write(f"{track_id}\t{self.names[track_id]}\n")
+        return True
+
+    def match(self, name):
+        """Best ``(track_id, confidence)`` for ``name``, or None below the threshold."""
+        grams = ngrams(normalize(name), self.n)
+        if not grams or not self.names:
+            return None
+
+        # sizes of n-gram sets that can reach the threshold
+        min_size = self.threshold * len(grams) / (2 - self.threshold)
+        max_size = (2 - self.threshold) * len(grams) / self.threshold
+        max_postings = max(self.stop_fraction * len(self.names), 100)
+
+        shared = Counter()
+        for gram in grams:
+            posting = self.postings.get(gram)
+            if posting and len(posting) <= max_postings:
+                shared.update(posting)
+
+        best = None
+        considered = 0
+        for track_id, _ in shared.most_common(self.candidates * 5):
+            if not min_size <= self.sizes[track_id] <= max_size:
+                continue
+            confidence = dice(grams, ngrams(self.names[track_id], self.n))
+            if best is None or confidence > best[1]:
+                best = (track_id, confidence)
+            considered += 1
+            if considered >= self.candidates:
+                break
+
+        if best is None or best[1] < self.threshold:
+            return None
+        return best[0], round(best[1], 3)
+
+    def __len__(self):
+        return len(self.names)
@@ -0,0 +1,134 @@
+import ast
+import os
+import resource
+import sys
+from collections import Counter, defaultdict
+
+from scrapy import Request
+
+from lsdbcrawler.utils import callback_name
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def rss_bytes():
+    """Current resident set size of this process."""
+    try:
+        with open("/proc/self/statm", mode="r", encoding="utf-8") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # not on linux, fall back to the peak rss (kilobytes on linux, bytes on macOS)
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def deep_sizeof(obj, depth=4, seen=None):
+    """Approximate size of an object and the containers it references."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if depth <= 0:
+        return size
+
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += deep_sizeof(key, depth - 1, seen)
+            size += deep_sizeof(value, depth - 1, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for value in obj:
+            size += deep_sizeof(value, depth - 1, seen)
+    elif hasattr(obj, "keys") and hasattr(obj, "__getitem__"):
+        # scrapy and compact items
+        for key in obj.keys():
+            size += deep_sizeof(obj[key], depth - 1, seen)
+    return size
+
+
+class FunctionIndex(object):
+    """Map ``(filename, lineno)`` of lsdbcrawler sources to function names."""
+
+    def __init__(self):
+        self._functions = {}
+
+    def _load(self, filename):
+        functions = []
+        try:
+            with open(filename, mode="r", encoding="utf-8") as f:
+                tree = ast.parse(f.read(), filename)
+        except (OSError, SyntaxError):
+            tree = None
+
+        if tree is not None:
+            for node in ast.walk(tree):
+                if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    functions.append((node.lineno, node.end_lineno, node.name))
+        # innermost function first
+        functions.sort(key=lambda f: f[1] - f[0])
+        self._functions[filename] = functions
+        return functions
+
+    def lookup(self, filename, lineno):
+        functions = self._functions.get(filename)
+        if functions is None:
+            functions = self._load(filename)
+
+        module = os.path.relpath(filename, PACKAGE_DIR)[:-3].replace(os.sep, ".")
+        for start, end, name in functions:
+            if start <= lineno <= end:
+                return f"{module}.{name}"
+        return module
+
+
+def attribute_snapshot(snapshot, index, top=10):
+    """Sum the live allocations of a snapshot by lsdbcrawler function.
+
+    An allocation is charged to the innermost frame of its traceback that is
+    part of this package, so memory allocated by scrapy or parsel on behalf
+    of a spider callback or pipeline is counted for that callback or pipeline.
+    """
+    sizes = Counter()
+    for stat in snapshot.statistics("traceback"):
+        owner = "other"
+        for frame in reversed(stat.traceback):
+            if frame.filename.startswith(PACKAGE_DIR):
+                owner = index.lookup(frame.filename, frame.lineno)
+                break
+        sizes[owner] += stat.size
+    return sizes.most_common(top)
+
+
+def live_objects(objects, top=10):
+    """Return the largest live object types and request meta sizes per callback.
+
+    ``objects`` is usually ``gc.get_objects()``; request meta is measured for
+    every live request, including the ones waiting in the scheduler.
+    """
+    type_sizes = Counter()
+    type_counts = Counter()
+    meta_sizes = defaultdict(int)
+    meta_counts = Counter()
+
+    for obj in objects:
+        name = type(obj).__name__
+        type_sizes[name] += sys.getsizeof(obj, 0)
+        type_counts[name] += 1
+
+        if isinstance(obj, Request):
+            callback = callback_name(obj)
+            # Request.meta creates an empty dict when there is none, read the
+            # attribute behind it so measuring does not allocate
+            meta_sizes[callback] += deep_sizeof(getattr(obj, "_meta", None) or {})
+            meta_counts[callback] += 1
+
+    types = [
+        (name, type_counts[name], size) for name, size in type_sizes.most_common(top)
+    ]
+    meta = [
+        (callback, meta_counts[callback], size)
+        for callback, size in sorted(meta_sizes.items(), key=lambda m: -m[1])
+    ]
+    return types, meta
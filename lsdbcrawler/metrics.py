@@ -0,0 +1,121 @@
+import bisect
+import math
+
+# latency buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{escape_label(v)}"' for k, v in pairs) + "}"
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(object):
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.samples = {}
+
+    def render(self):
+        lines = [
+            f"# TYPE {self.name} {self.type}",
+            f"# HELP {self.name} {self.documentation}",
+        ]
+        for labelvalues in sorted(self.samples, key=lambda v: tuple(map(str, v))):
+            lines.extend(self.render_sample(labelvalues, self.samples[labelvalues]))
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labelvalues, amount=1):
+        self.samples[labelvalues] = self.samples.get(labelvalues, 0) + amount
+
+    def render_sample(self, labelvalues, value):
+        labels = format_labels(self.labelnames, labelvalues)
+        yield f"{self.name}_total{labels} {format_value(value)}"
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, *labelvalues, value):
+        self.samples[labelvalues] = value
+
+    def render_sample(self, labelvalues, value):
+        labels = format_labels(self.labelnames, labelvalues)
+        yield f"{self.name}{labels} {format_value(value)}"
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, *labelvalues, value):
+        sample = self.samples.get(labelvalues)
+        if sample is None:
+            # [per bucket counts..., +Inf count], sum
+            sample = self.samples[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+        sample[0][bisect.bisect_left(self.buckets, value)] += 1
+        sample[1] += value
+
+    def render_sample(self, labelvalues, value):
+        counts, total = value
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            labels = format_labels(
+                self.labelnames, labelvalues, [("le", format_value(float(bound)))]
+            )
+            yield f"{self.name}_bucket{labels} {cumulative}"
+        labels = format_labels(self.labelnames, labelvalues)
+        yield f"{self.name}_count{labels} {cumulative}"
+        yield f"{self.name}_sum{labels} {format_value(total)}"
+
+
+class MetricsRegistry(object):
+    """Minimal in-process registry rendering the OpenMetrics text format."""
+
+    content_type = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
@@ -1,25 +1,32 @@
 from __future__ import absolute_import, division, unicode_literals
+import json
 import logging
+import time
+import uuid
+from collections import OrderedDict
 
-from lsdbcrawler.items import FailedRequestItem
-from lsdbcrawler.utils import randomProxy
+from lsdbcrawler import signals as lsdb_signals
+from lsdbcrawler.items import FailedRequestItem, LivesetItem
+from lsdbcrawler.throttle import SlotThrottle, TokenBucket
+from lsdbcrawler.utils import randomProxy, callback_name
 
 
 from scrapy.exceptions import CloseSpider, IgnoreRequest
 from scrapy.exceptions import NotConfigured
+from scrapy import Request, signals
 from scrapy.downloadermiddlewares.retry import RetryMiddleware, get_retry_request
+from scrapy.utils.misc import load_object
 from scrapy.utils.response import response_status_message
 
 from twisted.internet import reactor
 import twisted.internet.task
 
 
-from scrapy.utils.project import get_project_settings
-
-
 class HttpProxyMiddelware(object):
-    def __init__(self, https=True):
+    def __init__(self, proxy_list, https=True, signals=None):
+        self.proxy_list = proxy_list
         self.https = https
+        self.signals = signals
 
     @classmethod
     def from_crawler(cls, crawler):
@@ -30,11 +37,13 @@ class HttpProxyMiddelware(object):
 
         https = settings.getbool("PROXY_HTTPS", default=True)
 
-        middelware = cls(https=https)
+        middelware = cls(
+            settings.getlist("PROXY_POOL"), https=https, signals=crawler.signals
+        )
         return middelware
 
     def process_request(self, request, spider):
-        proxy_url = randomProxy(https=self.https)
+        proxy_url = randomProxy(self.proxy_list, https=self.https)
 
         # Set the proxy
         request.meta["proxy"] = proxy_url
@@ -46,6 +55,15 @@ class HttpProxyMiddelware(object):
 
         logging.error("Exception using proxy %s: %s. %s", proxy, exception, request)
 
+        if self.signals:
+            self.signals.send_catch_log(
+                lsdb_signals.proxy_failed,
+                request=request,
+                proxy=proxy,
+                exception=exception,
+                spider=spider,
+            )
+
 
 class DeferMiddleware(object):
     def process_request(self, request, spider):
@@ -75,7 +93,8 @@ class CustomRetryMiddleware(RetryMiddleware):
             # change proxy
             req = request.copy()
             req.meta["proxy"] = randomProxy(
-                settings.getbool("PROXY_HTTPS", default=True)
+                settings.getlist("PROXY_POOL"),
+                settings.getbool("PROXY_HTTPS", default=True),
             )
             req.dont_filter = True
 
@@ -103,3 +122,407 @@ class CustomRetryMiddleware(RetryMiddleware):
                 {"request": request, "retry_times": retry_times, "reason": reason},
                 extra={"spider": spider},
             )
+
+
+class AdaptiveThrottleMiddleware(object):
+    """Downloader middleware adapting the concurrency of each download slot.
+
+    Every response and download error is fed to a ``SlotThrottle`` of its
+    slot. Responses with a status in ``ADAPTIVE_THROTTLE_ERROR_CODES``, unless
+    the request handles it with ``handle_httpstatus_list``, ban pages
+    containing one of ``ADAPTIVE_THROTTLE_BAN_MARKERS`` and download
+    exceptions (timeouts, connection resets) count as errors. The slot's
+    concurrency is raised additively while the error rate stays within
+    ``ADAPTIVE_THROTTLE_ERROR_BUDGET`` and the p95 latency within
+    ``ADAPTIVE_THROTTLE_TARGET_LATENCY``, and halved otherwise.
+
+    A token bucket per slot caps the request rate at
+    ``ADAPTIVE_THROTTLE_MAX_RATE`` requests per second, delaying requests
+    the same way ``DeferMiddleware`` does. The state of each slot is kept in
+    the ``throttle/<slot>/*`` stats.
+    """
+
+    def __init__(self, crawler, settings):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.error_codes = set(int(code) for code in settings.getlist("ADAPTIVE_THROTTLE_ERROR_CODES", [429, 502, 503, 504]))
+        self.ban_markers = [
+            marker.lower().encode("utf-8")
+            for marker in settings.getlist("ADAPTIVE_THROTTLE_BAN_MARKERS", [])
+        ]
+        self.max_rate = settings.getfloat("ADAPTIVE_THROTTLE_MAX_RATE")
+        self.burst = settings.getint("ADAPTIVE_THROTTLE_BURST", 5)
+        self.throttle_settings = {
+            "start_concurrency": settings.getint("ADAPTIVE_THROTTLE_START_CONCURRENCY", 2),
+            "min_concurrency": settings.getint("ADAPTIVE_THROTTLE_MIN_CONCURRENCY", 1),
+            "max_concurrency": settings.getint(
+                "ADAPTIVE_THROTTLE_MAX_CONCURRENCY", settings.getint("CONCURRENT_REQUESTS")
+            ),
+            "error_budget": settings.getfloat("ADAPTIVE_THROTTLE_ERROR_BUDGET", 0.1),
+            "target_latency": settings.getfloat("ADAPTIVE_THROTTLE_TARGET_LATENCY", 5),
+            "window": settings.getint("ADAPTIVE_THROTTLE_WINDOW", 20),
+        }
+        self.throttles = {}
+        self.buckets = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("ADAPTIVE_THROTTLE_ENABLED", default=False):
+            raise NotConfigured("AdaptiveThrottleMiddleware is not enabled")
+        return cls(crawler, settings)
+
+    def slot_key(self, request, spider):
+        if "download_slot" in request.meta:
+            return request.meta["download_slot"]
+        return self.crawler.engine.downloader._get_slot_key(request, spider)
+
+    def throttle(self, key):
+        if key not in self.throttles:
+            self.throttles[key] = SlotThrottle(**self.throttle_settings)
+            if self.max_rate:
+                self.buckets[key] = TokenBucket(self.max_rate, self.burst)
+        return self.throttles[key]
+
+    def process_request(self, request, spider):
+        key = self.slot_key(request, spider)
+        throttle = self.throttle(key)
+        # slots are created by the downloader on their first request
+        slot = self.crawler.engine.downloader.slots.get(key)
+        if slot is not None and slot.concurrency != throttle.slot_concurrency:
+            self.apply(key, spider)
+        request.meta["throttle_start"] = time.monotonic()
+
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            return
+
+        delay = bucket.reserve()
+        if delay:
+            self.stats.inc_value(f"throttle/{key}/delayed", spider=spider)
+            return twisted.internet.task.deferLater(reactor, delay, lambda: None)
+
+    def process_response(self, request, response, spider):
+        self.record(request, spider, error=self.is_error(request, response))
+        return response
+
+    def process_exception(self, request, exception, spider):
+        if not isinstance(exception, IgnoreRequest):
+            self.record(request, spider, error=True)
+
+    def is_error(self, request, response):
+        if request.meta.get("handle_httpstatus_all"):
+            return False
+        if response.status in request.meta.get("handle_httpstatus_list", ()):
+            return False
+        if response.status in self.error_codes:
+            return True
+        if self.ban_markers and response.status == 200:
+            head = response.body[:4096].lower()
+            return any(marker in head for marker in self.ban_markers)
+        return False
+
+    def record(self, request, spider, error):
+        key = self.slot_key(request, spider)
+        latency = request.meta.get("download_latency")
+        if latency is None and "throttle_start" in request.meta:
+            latency = time.monotonic() - request.meta["throttle_start"]
+
+        if error:
+            self.stats.inc_value(f"throttle/{key}/errors", spider=spider)
+        if self.throttle(key).record(latency, error=error):
+            self.apply(key, spider)
+
+    def apply(self, key, spider):
+        throttle = self.throttles[key]
+        slot = self.crawler.engine.downloader.slots.get(key)
+        if slot is not None:
+            slot.concurrency = throttle.slot_concurrency
+
+        for name, value in throttle.state().items():
+            self.stats.set_value(f"throttle/{key}/{name}", value, spider=spider)
+
+
+class CallbackPriorityMiddleware(object):
+    """Spider middleware assigning request priorities by callback.
+
+    Each request yielded by a callback gets the priority configured for its
+    own callback in ``CALLBACK_PRIORITIES``. With ``PRIORITY_DEPTH_FIRST``
+    a request for a different callback than its parent is scheduled at least
+    one above the parent, so the user pages, download links and comment pages
+    of a set are finished before the next set is started.
+
+    Also records ``priority/time_to_first_set``, the seconds from spider open
+    until the first liveset item is scraped.
+    """
+
+    def __init__(self, priorities, depth_first=True, stats=None):
+        self.priorities = priorities
+        self.depth_first = depth_first
+        self.stats = stats
+        self.start_time = time.monotonic()
+        self.first_set_seen = False
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+
+        if not settings.getbool("PRIORITY_ENABLED", default=False):
+            raise NotConfigured("CallbackPriorityMiddleware is not enabled")
+
+        middleware = cls(
+            priorities=settings.getdict("CALLBACK_PRIORITIES"),
+            depth_first=settings.getbool("PRIORITY_DEPTH_FIRST", default=True),
+            stats=crawler.stats,
+        )
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        return middleware
+
+    def spider_opened(self, spider):
+        self.start_time = time.monotonic()
+
+    def process_start_requests(self, start_requests, spider):
+        for request in start_requests:
+            yield self.prioritize(request)
+
+    def process_spider_output(self, response, result, spider):
+        for entry in result:
+            if isinstance(entry, Request):
+                yield self.prioritize(entry, parent=response.request)
+                continue
+
+            if isinstance(entry, LivesetItem) and not self.first_set_seen:
+                self.first_set_seen = True
+                if self.stats:
+                    self.stats.set_value(
+                        "priority/time_to_first_set",
+                        round(time.monotonic() - self.start_time, 3),
+                        spider=spider,
+                    )
+            yield entry
+
+    def prioritize(self, request, parent=None):
+        # keep priorities that were set explicitly
+        if request.priority != 0:
+            return request
+
+        name = callback_name(request)
+        priority = int(self.priorities.get(name, 0))
+
+        if self.depth_first and parent is not None:
+            if callback_name(parent) == name:
+                priority = max(priority, parent.priority)
+            else:
+                priority = max(priority, parent.priority + 1)
+
+        if priority == request.priority:
+            return request
+        return request.replace(priority=priority)
+
+
+class CallbackTimingMiddleware(object):
+    """Spider middleware timing spider callbacks.
+
+    Sends ``lsdbcrawler.signals.callback_parsed`` with the time spent
+    producing the output of a callback once it is exhausted.
+    """
+
+    def __init__(self, signals):
+        self.signals = signals
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.signals)
+
+    def process_spider_output(self, response, result, spider):
+        seconds = 0.0
+        result = iter(result)
+        while True:
+            start = time.perf_counter()
+            try:
+                entry = next(result)
+            except StopIteration:
+                seconds += time.perf_counter() - start
+                break
+            seconds += time.perf_counter() - start
+            yield entry
+
+        self.signals.send_catch_log(
+            lsdb_signals.callback_parsed,
+            request=response.request,
+            response=response,
+            callback=callback_name(response.request),
+            seconds=seconds,
+            spider=spider,
+        )
+
+
+class TracingMiddleware(object):
+    """Spider middleware tracing each liveset from discovery to its DB writes.
+
+    Every request to ``parse_liveset`` starts a trace; its id is copied into
+    the meta of all child requests and remembered for every item they yield.
+    Spans are appended to ``TRACE_FILE`` as JSON lines:
+
+    * ``schedule``: from the request being yielded until it was downloaded,
+      minus the download itself
+    * ``download``: the download latency
+    * ``parse``: the time spent in the callback
+    * ``pipeline``: from the item being yielded until the pipelines are done
+
+    Items waiting for the pipelines are kept with their trace until they were
+    scraped, dropped or failed, at most ``max_pending_items`` of them.
+
+    Use ``scrapy trace_summary`` to report on the file.
+    """
+
+    max_pending_items = 10000
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        # id(item) -> (item, trace, start), the item keeps its id from being reused
+        self.pending_items = OrderedDict()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+
+        if not settings.getbool("TRACE_ENABLED", default=False):
+            raise NotConfigured("TracingMiddleware is not enabled")
+
+        middleware = cls(settings.get("TRACE_FILE", "traces.jsonl"))
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(
+            middleware.response_received, signal=signals.response_received
+        )
+        crawler.signals.connect(
+            middleware.callback_parsed, signal=lsdb_signals.callback_parsed
+        )
+        crawler.signals.connect(middleware.item_done, signal=signals.item_scraped)
+        crawler.signals.connect(middleware.item_done, signal=signals.item_dropped)
+        crawler.signals.connect(middleware.item_done, signal=signals.item_error)
+        return middleware
+
+    def spider_opened(self, spider):
+        self.file = open(self.path, mode="a", encoding="utf-8")
+
+    def spider_closed(self, spider):
+        self.pending_items.clear()
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def write_span(self, trace, stage, name, start, duration):
+        if not self.file:
+            return
+        trace_id, set_url = trace
+        span = {
+            "trace_id": trace_id,
+            "set_url": set_url,
+            "stage": stage,
+            "name": name,
+            "start": round(start, 6),
+            "duration": round(duration, 6),
+        }
+        self.file.write(json.dumps(span) + "\n")
+
+    def process_start_requests(self, start_requests, spider):
+        for request in start_requests:
+            yield self.trace_request(request, parent=None)
+
+    def process_spider_output(self, response, result, spider):
+        parent = response.request
+        for entry in result:
+            if isinstance(entry, Request):
+                yield self.trace_request(entry, parent)
+                continue
+
+            if "trace_id" in parent.meta:
+                self.pending_items[id(entry)] = (entry, self.trace_of(parent), time.time())
+                # items lost without a signal, e.g. when the spider output failed
+                while len(self.pending_items) > self.max_pending_items:
+                    self.pending_items.popitem(last=False)
+            yield entry
+
+    def trace_request(self, request, parent):
+        meta = request.meta
+        if parent is not None and "trace_id" in parent.meta:
+            meta["trace_id"] = parent.meta["trace_id"]
+            meta["trace_set_url"] = parent.meta["trace_set_url"]
+        elif callback_name(request) == "parse_liveset" and "trace_id" not in meta:
+            meta["trace_id"] = uuid.uuid4().hex
+            meta["trace_set_url"] = request.url
+
+        if "trace_id" in meta:
+            meta["trace_queued"] = time.time()
+        return request
+
+    def trace_of(self, request):
+        return request.meta["trace_id"], request.meta["trace_set_url"]
+
+    def response_received(self, response, request, spider):
+        if "trace_id" not in request.meta:
+            return
+
+        trace = self.trace_of(request)
+        name = callback_name(request)
+        now = time.time()
+        queued = request.meta.get("trace_queued", now)
+        latency = request.meta.get("download_latency", 0.0)
+
+        wait = max(now - queued - latency, 0.0)
+        self.write_span(trace, "schedule", name, queued, wait)
+        self.write_span(trace, "download", name, now - latency, latency)
+
+    def callback_parsed(self, request, callback, seconds, **kwargs):
+        if "trace_id" in request.meta:
+            trace = self.trace_of(request)
+            self.write_span(trace, "parse", callback, time.time() - seconds, seconds)
+
+    def item_done(self, item, spider, **kwargs):
+        pending = self.pending_items.get(id(item))
+        if pending is None or pending[0] is not item:
+            return
+
+        del self.pending_items[id(item)]
+        _, trace, start = pending
+        name = getattr(item, "collection", None) or type(item).__name__
+        self.write_span(trace, "pipeline", name, start, time.time() - start)
+
+
+class FrontierMiddleware(object):
+    """Spider and downloader middleware telling when a request is done.
+
+    Sends ``lsdbcrawler.signals.request_done`` once the spider output for a
+    response was consumed, so the child requests are in the frontier before
+    the ``SharedScheduler`` removes their parent, and when a download failed
+    and no other downloader middleware retried it. Only enabled with the
+    ``SharedScheduler``; enable it close to the engine in both
+    ``SPIDER_MIDDLEWARES`` and ``DOWNLOADER_MIDDLEWARES`` so it sees the final
+    output and only the failures that weren't turned into a new request.
+    """
+
+    def __init__(self, signals):
+        self.signals = signals
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        from lsdbcrawler.scheduler import SharedScheduler
+
+        # not issubclass, BaseScheduler subclass checks are duck-typed
+        if SharedScheduler not in load_object(crawler.settings["SCHEDULER"]).__mro__:
+            raise NotConfigured("FrontierMiddleware requires the SharedScheduler")
+        return cls(crawler.signals)
+
+    def process_spider_output(self, response, result, spider):
+        yield from result
+        self.done(response.request, spider)
+
+    def process_exception(self, request, exception, spider):
+        self.done(request, spider)
+
+    def done(self, request, spider):
+        self.signals.send_catch_log(lsdb_signals.request_done, request=request, spider=spider)
+
@@ -1,13 +1,25 @@
+import os
+import time
 import pymongo
 import datetime
+from itemadapter import ItemAdapter
 from scrapy.exceptions import DropItem, NotConfigured
 
+from lsdbcrawler import signals as lsdb_signals
+from lsdbcrawler.aggregates import AggregateStore
+from lsdbcrawler.exports import CollectionExport, compact, formats
+from lsdbcrawler.history import TracklistHistory
+from lsdbcrawler.items import LivesetItem, LivesetVotesItem, RaitingItem, FavoriteItem
+from lsdbcrawler.matching import TrackIndex
+from lsdbcrawler.search import COLLECTIONS as SEARCH_COLLECTIONS, SearchIndex, fts5_available
+
 import logging
 logger = logging.getLogger(__name__)
 
 class MongoPipeline(object):
-    def __init__(self, settings, stats, **kwargs):
+    def __init__(self, settings, stats, signals=None, **kwargs):
         self.stats = stats
+        self.signals = signals
         if not settings.get('MONGODB_DATABASE'):
             raise NotConfigured
         if not settings.get('MONGODB_URI'):
@@ -18,7 +30,7 @@ class MongoPipeline(object):
             
     @classmethod
     def from_crawler(cls, crawler):
-        return cls(crawler.settings, crawler.stats)
+        return cls(crawler.settings, crawler.stats, signals=crawler.signals)
 
     def open_spider(self, spider):
         self.connection = pymongo.MongoClient(self._uri)
@@ -28,20 +40,403 @@ class MongoPipeline(object):
         self.client.close()
 
     def process_item(self, item, spider):
+        if isinstance(item, LivesetVotesItem):
+            return self.process_votes(item, spider)
+
+        # works for both scrapy items and compact dataclass items
+        adapter = ItemAdapter(item)
+
         # filter based on item's unique fields
-        filter_dict = {key: item[key] for key in item if key in item.unique_fields}
+        filter_dict = {key: adapter[key] for key in adapter if key in item.unique_fields}
 
         # append a "last_modified" datetime field.
-        insert_dict = dict(item)
+        insert_dict = adapter.asdict()
         insert_dict.update({"last_modified": datetime.datetime.now(datetime.timezone.utc)})
 
         # update or insert (aka "upsert") with the $set field update operator
         try:
+            start = time.perf_counter()
             self.database[item.collection].update_one(
                 filter_dict, {"$set": insert_dict}, upsert=True
             )
+            self.write_done(item.collection, 1, start, spider)
+        except pymongo.errors.PyMongoError as e:
+            spider.logger.error(f"Database error: {e}")
+            raise DropItem(f"Database error: {e}")
+
+        return item
+
+    def process_votes(self, item, spider):
+        """Bring the ratings and favorites of a set in line with the snapshot."""
+        set_filter = {"liveset_set_id": item["liveset_set_id"]}
+
+        try:
+            self.sync_documents(RaitingItem, set_filter, item["ratings"], spider)
+            self.sync_documents(FavoriteItem, set_filter, item["favorites"], spider)
+        except pymongo.errors.PyMongoError as e:
+            spider.logger.error(f"Database error: {e}")
+            raise DropItem(f"Database error: {e}")
+
+        return item
+
+    def sync_documents(self, item_cls, parent_filter, documents, spider):
+        """Diff ``documents`` against the stored documents matching ``parent_filter``.
+
+        New and changed documents are upserted and stored documents missing
+        from ``documents`` are deleted, all in a single bulk write.
+        """
+        collection = self.database[item_cls.collection]
+        unique_fields = item_cls.unique_fields
+
+        def key(doc):
+            return tuple(doc.get(field) for field in unique_fields)
+
+        stored = {
+            key(doc): doc
+            for doc in collection.find(parent_filter, {"_id": 0, "last_modified": 0})
+        }
+        now = datetime.datetime.now(datetime.timezone.utc)
+
+        operations = []
+        for doc in documents:
+            stored_doc = stored.pop(key(doc), None)
+            if stored_doc == doc:
+                continue
+
+            filter_dict = {field: doc[field] for field in unique_fields}
+            insert_dict = dict(doc)
+            insert_dict.update({"last_modified": now})
+            operations.append(
+                pymongo.UpdateOne(filter_dict, {"$set": insert_dict}, upsert=True)
+            )
+
+        upserts = len(operations)
+        for doc in stored.values():
+            operations.append(
+                pymongo.DeleteOne({field: doc.get(field) for field in unique_fields})
+            )
+
+        self.stats.inc_value(f"votes/{item_cls.collection}/upserted", upserts)
+        self.stats.inc_value(
+            f"votes/{item_cls.collection}/deleted", len(operations) - upserts
+        )
+        self.stats.inc_value(
+            f"votes/{item_cls.collection}/unchanged", len(documents) - upserts
+        )
+
+        if operations:
+            start = time.perf_counter()
+            collection.bulk_write(operations, ordered=False)
+            self.write_done(item_cls.collection, len(operations), start, spider)
+
+    def write_done(self, collection, operations, start, spider):
+        if self.signals:
+            self.signals.send_catch_log(
+                lsdb_signals.database_write,
+                collection=collection,
+                operations=operations,
+                seconds=time.perf_counter() - start,
+                spider=spider,
+            )
+
+
+class ExportPipeline(object):
+    """Stream items into per collection files under ``EXPORT_DIR``.
+
+    Items are written to ``<EXPORT_DIR>/<collection>/part-*`` files as gzip
+    compressed JSON lines or Parquet row groups (``EXPORT_FORMAT``), see
+    ``CollectionExport`` for buffering and rotation. With ``EXPORT_COMPACT``
+    the parts of each collection are merged into one file when the spider
+    closes, keeping the last row for each value of the item's
+    ``unique_fields``.
+    """
+
+    def __init__(self, settings, stats):
+        self.stats = stats
+        self.directory = settings.get("EXPORT_DIR")
+        if not self.directory:
+            raise NotConfigured("EXPORT_DIR is not set")
+
+        export_format = settings.get("EXPORT_FORMAT", "jsonl")
+        if export_format not in formats:
+            raise NotConfigured(f"Unknown EXPORT_FORMAT {export_format!r}")
+        if export_format == "parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise NotConfigured("EXPORT_FORMAT 'parquet' requires pyarrow")
+
+        self.part_cls = formats[export_format]
+        self.buffer_size = settings.getint("EXPORT_BUFFER_SIZE", 1000)
+        self.rotate_bytes = settings.getint("EXPORT_ROTATE_BYTES", 128 * 1024 * 1024)
+        self.rotate_seconds = settings.getint("EXPORT_ROTATE_SECONDS", 3600)
+        self.compact = settings.getbool("EXPORT_COMPACT", default=False)
+        self.exports = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings, crawler.stats)
+
+    def export(self, item):
+        collection = item.collection
+        if collection not in self.exports:
+            self.exports[collection] = CollectionExport(
+                self.directory,
+                collection,
+                item.unique_fields,
+                self.part_cls,
+                buffer_size=self.buffer_size,
+                rotate_bytes=self.rotate_bytes,
+                rotate_seconds=self.rotate_seconds,
+            )
+        return self.exports[collection]
+
+    def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+        # unset fields are exported as nulls so every row has the same columns
+        row = {name: adapter.get(name) for name in adapter.field_names()}
+        self.export(item).add(row)
+        self.stats.inc_value(f"export/{item.collection}/rows", spider=spider)
+        return item
+
+    def close_spider(self, spider):
+        for collection, export in self.exports.items():
+            export.close()
+            self.stats.set_value(f"export/{collection}/parts", export.parts, spider=spider)
+
+            if self.compact:
+                kept, dropped = compact(export.directory, export.unique_fields, self.part_cls)
+                self.stats.set_value(f"export/{collection}/compacted", kept, spider=spider)
+                self.stats.set_value(f"export/{collection}/duplicates", dropped, spider=spider)
+
+
+class AggregatePipeline(MongoPipeline):
+    """Keep the artist, event, genre and track read models up to date.
+
+    Every ``LivesetItem`` applies the difference between its previous and its
+    current contribution to the counters, see ``AggregateStore``. Use
+    ``scrapy rebuild_aggregates`` to backfill from the ``liveset`` collection.
+    """
+
+    def __init__(self, settings, stats, signals=None, **kwargs):
+        if not settings.getbool("AGGREGATES_ENABLED", default=False):
+            raise NotConfigured("AggregatePipeline is not enabled")
+        super(AggregatePipeline, self).__init__(settings, stats, signals=signals, **kwargs)
+
+    def open_spider(self, spider):
+        super(AggregatePipeline, self).open_spider(spider)
+        self.store = AggregateStore(self.database)
+        self.store.create_indexes()
+
+    def close_spider(self, spider):
+        self.connection.close()
+
+    def process_item(self, item, spider):
+        if not isinstance(item, LivesetItem):
+            return item
+
+        try:
+            start = time.perf_counter()
+            changes = self.store.apply(ItemAdapter(item).asdict())
+            if changes:
+                self.write_done("aggregates", changes, start, spider)
         except pymongo.errors.PyMongoError as e:
             spider.logger.error(f"Database error: {e}")
             raise DropItem(f"Database error: {e}")
 
+        self.stats.inc_value("aggregates/changes", changes, spider=spider)
         return item
+
+
+class TracklistHistoryPipeline(MongoPipeline):
+    """Record the tracklist edits of sets before they are overwritten.
+
+    Runs before ``MongoPipeline``: the stored tracklist of a set is compared
+    with the newly parsed one and the delta is appended to
+    ``tracklist_history``, see ``TracklistHistory``.
+    """
+
+    def __init__(self, settings, stats, signals=None, **kwargs):
+        if not settings.getbool("TRACKLIST_HISTORY_ENABLED", default=False):
+            raise NotConfigured("TracklistHistoryPipeline is not enabled")
+        super(TracklistHistoryPipeline, self).__init__(settings, stats, signals=signals, **kwargs)
+
+    def open_spider(self, spider):
+        super(TracklistHistoryPipeline, self).open_spider(spider)
+        self.history = TracklistHistory(self.database)
+        self.history.create_indexes()
+
+    def close_spider(self, spider):
+        self.connection.close()
+
+    def process_item(self, item, spider):
+        if not isinstance(item, LivesetItem):
+            return item
+
+        tracks = (item.get("tracklist") or {}).get("tracks") or []
+        try:
+            start = time.perf_counter()
+            stored = self.database[item.collection].find_one(
+                {"set_id": item["set_id"]}, {"tracklist.tracks": 1}
+            )
+            stored_tracks = ((stored or {}).get("tracklist") or {}).get("tracks")
+            version = self.history.record(
+                item["set_id"], stored_tracks, tracks, updated=item.get("updated")
+            )
+            if version is not None:
+                self.write_done("tracklist_history", 1, start, spider)
+                self.stats.inc_value("tracklist_history/versions", spider=spider)
+        except pymongo.errors.PyMongoError as e:
+            spider.logger.error(f"Database error: {e}")
+            raise DropItem(f"Database error: {e}")
+
+        return item
+
+
+class TrackMatchPipeline(object):
+    """Resolve the free-text tracks of old-style tracklists to track ids.
+
+    Track names of ``TrackItem``s are added to a ``TrackIndex`` persisted to
+    ``TRACK_MATCH_INDEX``. The ``track`` entries of old-style tracklists get
+    the ``track_id`` of their best match and its ``match_confidence``. Runs
+    before ``MongoPipeline`` so the matches are stored with the set.
+    """
+
+    def __init__(self, settings, stats):
+        self.stats = stats
+        path = settings.get("TRACK_MATCH_INDEX")
+        if not path:
+            raise NotConfigured("TRACK_MATCH_INDEX is not set")
+
+        self.index = TrackIndex(
+            path,
+            n=settings.getint("TRACK_MATCH_NGRAM", 3),
+            threshold=settings.getfloat("TRACK_MATCH_THRESHOLD", 0.75),
+        )
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings, crawler.stats)
+
+    def open_spider(self, spider):
+        self.index.open()
+
+    def close_spider(self, spider):
+        self.index.close()
+        self.stats.set_value("track_match/indexed", len(self.index), spider=spider)
+
+    def process_item(self, item, spider):
+        if item.collection == "track":
+            adapter = ItemAdapter(item)
+            self.index.add(adapter.get("track_id"), adapter.get("track_name"))
+        elif isinstance(item, LivesetItem):
+            self.match_tracklist(item.get("tracklist") or {}, spider)
+        return item
+
+    def match_tracklist(self, tracklist, spider):
+        if tracklist.get("type") != "old":
+            return
+
+        for track in tracklist.get("tracks") or []:
+            if track.get("track_type") != "track":
+                continue
+
+            match = self.index.match(track["track_name"])
+            if match is None:
+                self.stats.inc_value("track_match/unmatched", spider=spider)
+                continue
+
+            track["track_id"], track["match_confidence"] = match
+            self.stats.inc_value("track_match/matched", spider=spider)
+
+
+class CooccurrencePipeline(object):
+    """Maintain artist/track co-occurrence matrices in ``COOCCURRENCE_DIR``.
+
+    Sets are added to the matrices in batches of ``COOCCURRENCE_BATCH_SIZE``
+    and the matrices are saved when the spider closes, see
+    ``lsdbcrawler.cooccurrence``. Requires NumPy and SciPy.
+    """
+
+    def __init__(self, settings, stats):
+        self.stats = stats
+        self.directory = settings.get("COOCCURRENCE_DIR")
+        if not self.directory:
+            raise NotConfigured("COOCCURRENCE_DIR is not set")
+
+        try:
+            from lsdbcrawler.cooccurrence import CooccurrenceMatrices
+        except ImportError:
+            raise NotConfigured("CooccurrencePipeline requires numpy and scipy")
+
+        self.matrices_cls = CooccurrenceMatrices
+        self.batch_size = settings.getint("COOCCURRENCE_BATCH_SIZE", 1000)
+        self.batch = []
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings, crawler.stats)
+
+    def open_spider(self, spider):
+        if os.path.isfile(os.path.join(self.directory, "meta.json")):
+            self.matrices = self.matrices_cls.load(self.directory)
+        else:
+            self.matrices = self.matrices_cls()
+
+    def close_spider(self, spider):
+        self.flush(spider)
+        self.matrices.save(self.directory)
+        self.stats.set_value("cooccurrence/sets", len(self.matrices.sets), spider=spider)
+        self.stats.set_value("cooccurrence/tracks", len(self.matrices.track_ids), spider=spider)
+        self.stats.set_value("cooccurrence/artists", len(self.matrices.artist_ids), spider=spider)
+
+    def flush(self, spider):
+        if self.batch:
+            updated = self.matrices.update(self.batch)
+            self.stats.inc_value("cooccurrence/updated", updated, spider=spider)
+            self.batch = []
+
+    def process_item(self, item, spider):
+        if isinstance(item, LivesetItem):
+            self.batch.append(ItemAdapter(item).asdict())
+            if len(self.batch) >= self.batch_size:
+                self.flush(spider)
+        return item
+
+
+class SearchIndexPipeline(object):
+    """Maintain a local SQLite FTS5 search index in ``SEARCH_INDEX``.
+
+    Indexes set descriptions and tracklists, comments and the names of
+    tracks, artists and events, see ``lsdbcrawler.search``. Query it with
+    ``scrapy search``.
+    """
+
+    def __init__(self, settings, stats):
+        self.stats = stats
+        path = settings.get("SEARCH_INDEX")
+        if not path:
+            raise NotConfigured("SEARCH_INDEX is not set")
+        if not fts5_available():
+            raise NotConfigured("SQLite was built without FTS5")
+
+        self.index = SearchIndex(path, batch_size=settings.getint("SEARCH_INDEX_BATCH_SIZE", 1000))
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings, crawler.stats)
+
+    def open_spider(self, spider):
+        self.index.open()
+
+    def close_spider(self, spider):
+        self.index.flush()
+        self.stats.set_value("search_index/written", self.index.written, spider=spider)
+        self.stats.set_value("search_index/entries", len(self.index), spider=spider)
+        self.index.close()
+
+    def process_item(self, item, spider):
+        if getattr(item, "collection", None) in SEARCH_COLLECTIONS:
+            self.index.add_item(item)
+        return item
+
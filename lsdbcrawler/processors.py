@@ -1,6 +1,12 @@
 import logging
 import traceback
 import sys
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# failed casts per call site, "module:line function" -> count
+parse_anomalies = Counter()
 
 
 def to_int(s, fallback=0):
@@ -8,12 +14,39 @@ def to_int(s, fallback=0):
     try:
         result = int(s)
     except ValueError:
-        logging.warning("Couldn't cast %s to int", s)
-        logging.error(traceback.format_exc())
         f = sys._getframe().f_back
-        for item in traceback.StackSummary.from_list(traceback.extract_stack(f)):
-            logging.error(item)
+        # the module, not the file, so stat keys don't depend on the install path
+        call_site = f"{f.f_globals.get('__name__')}:{f.f_lineno} {f.f_code.co_name}"
+        parse_anomalies[call_site] += 1
+
+        # the stack trace is only logged the first time a call site fails
+        if parse_anomalies[call_site] == 1:
+            logger.warning("Couldn't cast %s to int at %s", s, call_site)
+            logger.error(
+                "".join(traceback.StackSummary.from_list(traceback.extract_stack(f)).format())
+            )
+        else:
+            logger.debug("Couldn't cast %s to int at %s", s, call_site)
 
         result = fallback
 
     return result
+
+
+def parse_date(date_string, settings=None):
+    """``dateparser.parse``, importing dateparser on first use.
+
+    Importing dateparser loads its language data and compiles its regexes,
+    which takes a large part of the startup time.
+    """
+    import dateparser
+
+    return dateparser.parse(date_string, settings=settings)
+
+
+def html_to_markdown(html):
+    """``markdownify``, importing markdownify and BeautifulSoup on first use."""
+    from markdownify import markdownify
+
+    return markdownify(html)
+
@@ -0,0 +1,304 @@
+import heapq
+import itertools
+import logging
+import os
+import pickle
+import socket
+import uuid
+from collections import Counter, defaultdict
+
+from scrapy import signals
+from scrapy.core.scheduler import BaseScheduler, Scheduler
+from scrapy.utils.misc import create_instance, load_object
+from scrapy.utils.request import request_from_dict
+from twisted.internet import task
+
+from lsdbcrawler import signals as lsdb_signals
+from lsdbcrawler.frontier import frontier_store
+from lsdbcrawler.utils import callback_name
+
+logger = logging.getLogger(__name__)
+
+
+class CallbackScheduler(Scheduler):
+    """Scheduler that caps how many requests of a callback are downloaded at once.
+
+    Caps are read from the ``CALLBACK_CONCURRENCY`` setting, e.g.
+    ``{"parse_user": 2}``. A request whose callback is at its cap is held back
+    and handed out again once one of its in-flight requests leaves the
+    downloader, when it has a higher priority than the next queued request.
+    Callbacks without a cap are scheduled as usual.
+
+    At most ``CALLBACK_MAX_HELD`` requests are held back. While that many
+    are held, no further requests are taken from the queues until a held one
+    is handed out.
+    """
+
+    def __init__(self, *args, concurrency=None, max_held=1000, **kwargs):
+        super(CallbackScheduler, self).__init__(*args, **kwargs)
+        self.concurrency = concurrency or {}
+        self.max_held = max_held
+        self.in_flight = defaultdict(int)
+        # (-priority, order, request) per callback
+        self.held = defaultdict(list)
+        self.held_order = itertools.count()
+        # a queued request taken out to compare its priority with the held ones
+        self.lookahead = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        scheduler = super(CallbackScheduler, cls).from_crawler(crawler)
+        scheduler.concurrency = {
+            name: int(cap)
+            for name, cap in crawler.settings.getdict("CALLBACK_CONCURRENCY").items()
+        }
+        scheduler.max_held = crawler.settings.getint("CALLBACK_MAX_HELD", 1000)
+
+        crawler.signals.connect(
+            scheduler.request_reached_downloader,
+            signal=signals.request_reached_downloader,
+        )
+        crawler.signals.connect(
+            scheduler.request_left_downloader,
+            signal=signals.request_left_downloader,
+        )
+        return scheduler
+
+    def request_reached_downloader(self, request, spider):
+        name = callback_name(request)
+        if name in self.concurrency:
+            self.in_flight[name] += 1
+
+    def request_left_downloader(self, request, spider):
+        name = callback_name(request)
+        if name in self.concurrency and self.in_flight[name] > 0:
+            self.in_flight[name] -= 1
+
+    def is_capped(self, name):
+        cap = self.concurrency.get(name)
+        return cap is not None and self.in_flight[name] >= cap
+
+    def held_count(self):
+        return sum(len(held) for held in self.held.values())
+
+    def next_held(self):
+        """Callback of the highest priority held request that may be downloaded."""
+        heads = [
+            (held[0], name)
+            for name, held in self.held.items()
+            if held and not self.is_capped(name)
+        ]
+        return min(heads, key=lambda head: head[0][:2])[1] if heads else None
+
+    def hold(self, name, request):
+        heapq.heappush(self.held[name], (-request.priority, next(self.held_order), request))
+        if self.stats:
+            self.stats.inc_value(f"scheduler/held/{name}", spider=self.spider)
+
+    def next_queued(self):
+        """Next queued request of a callback below its cap, holding back the others."""
+        if self.lookahead is not None:
+            # its callback may have reached the cap since it was taken out
+            name = callback_name(self.lookahead)
+            if not self.is_capped(name):
+                return self.lookahead
+            self.hold(name, self.lookahead)
+            self.lookahead = None
+
+        while self.held_count() < self.max_held:
+            request = super(CallbackScheduler, self).next_request()
+            if request is None:
+                return None
+
+            name = callback_name(request)
+            if not self.is_capped(name):
+                self.lookahead = request
+                return request
+            self.hold(name, request)
+        return None
+
+    def next_request(self):
+        request = self.next_queued()
+        name = self.next_held()
+        # held requests left the queue first, they go first at equal priority
+        if name is not None and (request is None or -self.held[name][0][0] >= request.priority):
+            return heapq.heappop(self.held[name])[2]
+
+        self.lookahead = None
+        return request
+
+    def close(self, reason):
+        # hand held requests to the disk queue so they survive a JOBDIR restart
+        if self.dqs is not None:
+            if self.lookahead is not None:
+                self._dqpush(self.lookahead)
+                self.lookahead = None
+            for held in self.held.values():
+                while held:
+                    self._dqpush(heapq.heappop(held)[2])
+        return super(CallbackScheduler, self).close(reason)
+
+    def __len__(self):
+        queued = super(CallbackScheduler, self).__len__()
+        return queued + self.held_count() + (self.lookahead is not None)
+
+
+class SharedScheduler(BaseScheduler):
+    """Scheduler handing out requests from a frontier shared by several nodes.
+
+    Every node enqueues into and claims from the store configured by
+    ``FRONTIER_STORE``. A claimed request is leased to the node for
+    ``FRONTIER_LEASE`` seconds and the lease is renewed until the request is
+    done: the spider output for its response was consumed (see
+    ``FrontierMiddleware``), the callback failed, its download failed or it
+    was dropped. A redirect or retry carrying the key of a claimed request
+    replaces it in the frontier. Leases of a node that stopped renewing them
+    expire and their requests are claimed by other nodes, so a crash while
+    parsing a response gives the request to another node. Leases still held
+    when a node closes are released right away.
+
+    The fingerprints of seen requests are shared for one crawl: the first node
+    joining an empty frontier, with no other node active in the last
+    ``FRONTIER_LEASE`` seconds, starts a new crawl and clears them.
+
+    Requests that can't be serialized, e.g. with a callback that isn't a
+    spider method, are kept in a local queue of the node, handed out before
+    the shared ones.
+    """
+
+    def __init__(self, store, dupefilter, fingerprinter, node, lease, stats=None):
+        self.store = store
+        self.df = dupefilter
+        self.fingerprinter = fingerprinter
+        self.node = node
+        self.lease = lease
+        self.stats = stats
+        self.spider = None
+        self.counts = Counter()
+        self.heartbeat = None
+        # (-priority, order, request) of requests that can't be serialized
+        self.local = []
+        self.local_order = itertools.count()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        dupefilter_cls = load_object(settings["DUPEFILTER_CLASS"])
+        scheduler = cls(
+            frontier_store(settings),
+            create_instance(dupefilter_cls, settings, crawler),
+            crawler.request_fingerprinter,
+            settings.get("FRONTIER_NODE") or f"{socket.gethostname()}:{os.getpid()}",
+            settings.getfloat("FRONTIER_LEASE"),
+            stats=crawler.stats,
+        )
+        crawler.signals.connect(scheduler.request_done, signal=lsdb_signals.request_done)
+        crawler.signals.connect(scheduler.request_done, signal=signals.request_dropped)
+        crawler.signals.connect(scheduler.spider_error, signal=signals.spider_error)
+        return scheduler
+
+    def open(self, spider):
+        self.spider = spider
+        self.store.open()
+        if self.store.new_crawl(self.lease):
+            logger.info("Starting a new crawl, cleared the seen requests", extra={"spider": spider})
+        self.heartbeat = task.LoopingCall(self.renew)
+        self.heartbeat.start(self.lease / 3, now=True)
+        logger.info("Node %s joined the frontier", self.node, extra={"spider": spider})
+        return self.df.open()
+
+    def close(self, reason):
+        if self.heartbeat and self.heartbeat.running:
+            self.heartbeat.stop()
+
+        released = self.store.release(self.node)
+        if released:
+            self.inc("released", released)
+            logger.info("Released %s leased requests", released, extra={"spider": self.spider})
+
+        self.store.update_node(self.node, self.counts, active=False)
+        self.store.close()
+        return self.df.close(reason)
+
+    def inc(self, key, count=1):
+        self.counts[key] += count
+        if self.stats:
+            self.stats.inc_value(f"frontier/{key}", count, spider=self.spider)
+
+    def renew(self):
+        self.store.renew(self.node, self.lease)
+        self.store.update_node(self.node, self.counts)
+
+    def has_pending_requests(self):
+        # leased requests of other nodes count too, they may still add requests
+        return bool(self.local) or self.store.pending() > 0
+
+    def __len__(self):
+        # requests leased by any node are included
+        return len(self.local) + self.store.size()
+
+    def enqueue_request(self, request):
+        if not request.dont_filter and self.df.request_seen(request):
+            self.df.log(request, self.spider)
+            self.inc("filtered")
+            return False
+
+        key = self.fingerprinter.fingerprint(request).hex()
+        if request.dont_filter:
+            # retries share the fingerprint of the request they replace
+            key = f"{key}:{uuid.uuid4().hex}"
+
+        try:
+            data = pickle.dumps(request.to_dict(spider=self.spider), protocol=4)
+        except ValueError as e:
+            if not self.counts["unserializable"]:
+                logger.warning(
+                    "Unable to serialize request %s, keeping it in the node's local queue: %s "
+                    "(further unserializable requests are not logged)",
+                    request, e, extra={"spider": self.spider},
+                )
+            self.inc("unserializable")
+            heapq.heappush(self.local, (-request.priority, next(self.local_order), request))
+            self.complete(request.meta.get("frontier_key"))
+            return True
+
+        if not self.store.push(key, data, request.priority):
+            self.inc("duplicate")
+            return False
+
+        self.inc("enqueued")
+        # a redirect or retry of a claimed request takes its place
+        self.complete(request.meta.get("frontier_key"))
+        return True
+
+    def next_request(self):
+        if self.local:
+            return heapq.heappop(self.local)[2]
+
+        claimed = self.store.claim(self.node, self.lease)
+        if claimed is None:
+            return None
+
+        key, data, previous_node = claimed
+        self.inc("claimed")
+        if previous_node is not None:
+            self.inc("reclaimed")
+            logger.info(
+                "Reclaimed a request with an expired lease of node %s",
+                previous_node,
+                extra={"spider": self.spider},
+            )
+
+        request = request_from_dict(pickle.loads(data), spider=self.spider)
+        request.meta["frontier_key"] = key
+        return request
+
+    def complete(self, key):
+        if key is not None and self.store.complete(key, self.node):
+            self.inc("completed")
+
+    def request_done(self, request, spider):
+        self.complete(request.meta.get("frontier_key"))
+
+    def spider_error(self, failure, response, spider):
+        self.complete(response.meta.get("frontier_key"))
@@ -0,0 +1,230 @@
+"""Local full-text search index of the crawled texts in SQLite FTS5."""
+import logging
+import os
+import sqlite3
+
+from itemadapter import ItemAdapter
+
+logger = logging.getLogger(__name__)
+
+# collection -> searchable field, sets are handled by ``entries``
+FIELDS = {
+    "comment": "text",
+    "track": "track_name",
+    "artist": "name",
+    "event": "name",
+}
+
+COLLECTIONS = ("liveset",) + tuple(FIELDS)
+
+# kinds of indexed texts, a set has its description and its tracklist
+KINDS = ("description", "tracklist") + tuple(FIELDS)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    text TEXT NOT NULL,
+    UNIQUE (kind, key)
+);
+CREATE TABLE IF NOT EXISTS deleted (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    PRIMARY KEY (kind, key)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5(
+    text, content='entries', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+    INSERT INTO search (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+    INSERT INTO search (search, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE ON entries BEGIN
+    INSERT INTO search (search, rowid, text) VALUES ('delete', old.id, old.text);
+    INSERT INTO search (rowid, text) VALUES (new.id, new.text);
+END;
+"""
+
+UPSERT = """
+INSERT INTO entries (kind, key, text) VALUES (?, ?, ?)
+ON CONFLICT (kind, key) DO UPDATE SET text = excluded.text WHERE text != excluded.text
+"""
+
+
+def fts5_available():
+    connection = sqlite3.connect(":memory:")
+    try:
+        connection.execute("CREATE VIRTUAL TABLE test USING fts5(text)")
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        connection.close()
+
+
+def item_key(item):
+    """Key of an item from its ``unique_fields``, tab separated."""
+    adapter = ItemAdapter(item)
+    return "\t".join(str(adapter.get(field)) for field in item.unique_fields)
+
+
+def entries(item, track_name=None):
+    """``(kind, key, text)`` of the searchable texts of an item.
+
+    An empty text removes the entry, e.g. when a description was deleted.
+    The spider moves the names of linked tracks in modern tracklists to
+    ``TrackItem``s, ``track_name`` resolves the ``track_id`` of a track
+    without a name.
+    """
+    adapter = ItemAdapter(item)
+    key = item_key(item)
+    if item.collection == "liveset":
+        tracks = (adapter.get("tracklist") or {}).get("tracks") or []
+        names = []
+        for track in tracks:
+            name = track.get("track_name")
+            if not name and track.get("track_id") and track_name is not None:
+                name = track_name(track["track_id"])
+            if name:
+                names.append(name)
+        return [
+            ("description", key, adapter.get("description") or ""),
+            ("tracklist", key, "\n".join(names)),
+        ]
+    field = FIELDS.get(item.collection)
+    if field is None:
+        return []
+    return [(item.collection, key, adapter.get(field) or "")]
+
+
+class SearchIndex(object):
+    """Full-text index of set descriptions, tracklists, comments and names.
+
+    The texts are kept in the ``entries`` table, unique per kind and item
+    key, and indexed by an external content FTS5 table kept in sync by
+    triggers, so an upsert of a changed text replaces its postings. Writes
+    are buffered and applied in one transaction per ``batch_size`` entries.
+    Deleted entries are remembered in ``deleted`` so ``merge`` can apply the
+    deletions of another index, e.g. of a shard.
+    """
+
+    def __init__(self, path, batch_size=1000):
+        self.path = path
+        self.batch_size = batch_size
+        self.upserts = {}
+        self.deletes = set()
+        self.written = 0
+        self.connection = None
+
+    def open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        # readers, e.g. the search command, don't block the crawl
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        if self.connection is not None:
+            self.flush()
+            self.connection.close()
+            self.connection = None
+
+    def add(self, kind, key, text):
+        # only the last text of an entry within a batch is written
+        if text:
+            self.deletes.discard((kind, key))
+            self.upserts[kind, key] = text
+        else:
+            self.upserts.pop((kind, key), None)
+            self.deletes.add((kind, key))
+        if len(self.upserts) + len(self.deletes) >= self.batch_size:
+            self.flush()
+
+    def add_item(self, item):
+        for entry in entries(item, track_name=self.track_name):
+            self.add(*entry)
+
+    def track_name(self, track_id):
+        """Indexed name of a track, the spider yields tracks before their sets."""
+        key = str(track_id)
+        if ("track", key) in self.upserts:
+            return self.upserts["track", key]
+        if ("track", key) in self.deletes:
+            return None
+        row = self.connection.execute(
+            "SELECT text FROM entries WHERE kind = 'track' AND key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def flush(self):
+        """Write the buffered entries; returns the number of entries written."""
+        if not self.upserts and not self.deletes:
+            return 0
+        with self.connection:
+            self.connection.executemany(
+                UPSERT, [(kind, key, text) for (kind, key), text in self.upserts.items()]
+            )
+            self.connection.executemany(
+                "DELETE FROM deleted WHERE kind = ? AND key = ?", list(self.upserts)
+            )
+            self.connection.executemany(
+                "DELETE FROM entries WHERE kind = ? AND key = ?", list(self.deletes)
+            )
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO deleted (kind, key) VALUES (?, ?)", list(self.deletes)
+            )
+        written = len(self.upserts) + len(self.deletes)
+        self.written += written
+        self.upserts = {}
+        self.deletes = set()
+        return written
+
+    def merge(self, path):
+        """Apply the entries and deletions of the index at ``path``; returns its entry count."""
+        self.flush()
+        self.connection.execute("ATTACH DATABASE ? AS other", (path,))
+        try:
+            with self.connection:
+                # WHERE true, an upsert from a SELECT is ambiguous without it
+                self.connection.execute(
+                    "INSERT INTO entries (kind, key, text)"
+                    " SELECT kind, key, text FROM other.entries WHERE true"
+                    " ON CONFLICT (kind, key) DO UPDATE SET text = excluded.text"
+                    " WHERE text != excluded.text"
+                )
+                self.connection.execute(
+                    "DELETE FROM entries WHERE (kind, key) IN (SELECT kind, key FROM other.deleted)"
+                )
+            merged = self.connection.execute("SELECT count(*) FROM other.entries").fetchone()[0]
+        finally:
+            self.connection.execute("DETACH DATABASE other")
+        return merged
+
+    def optimize(self):
+        """Merge the FTS5 segments, worth it after a large crawl."""
+        with self.connection:
+            self.connection.execute("INSERT INTO search (search) VALUES ('optimize')")
+
+    def search(self, query, kinds=None, limit=20):
+        """Best matches of an FTS5 ``query`` as ``(kind, key, snippet)``, best first."""
+        sql = (
+            "SELECT entries.kind, entries.key, snippet(search, 0, '[', ']', '...', 12)"
+            " FROM search JOIN entries ON entries.id = search.rowid"
+            " WHERE search MATCH ?"
+        )
+        params = [query]
+        if kinds:
+            sql += f" AND entries.kind IN ({', '.join('?' * len(kinds))})"
+            params.extend(kinds)
+        sql += " ORDER BY search.rank LIMIT ?"
+        params.append(limit)
+        return self.connection.execute(sql, params).fetchall()
+
+    def __len__(self):
+        return self.connection.execute("SELECT count(*) FROM entries").fetchone()[0]
@@ -18,6 +18,7 @@ BOT_NAME = "lsdbcrawler"
 
 SPIDER_MODULES = ["lsdbcrawler.spiders"]
 NEWSPIDER_MODULE = "lsdbcrawler.spiders"
+COMMANDS_MODULE = "lsdbcrawler.commands"
 
 # Crawl responsibly by identifying yourself (and your website) on the user-agent
 USER_AGENT = os.getenv("USER_AGENT", "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:132.0) Gecko/20100101 Firefox/132.0")
@@ -32,6 +33,11 @@ LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 LOG_ENABLED = os.getenv("LOG_ENABLED", True)
 LOG_STDOUT = os.getenv("LOG_STDOUT", True)
 LOG_FILE_APPEND = False
+# write log records from a background thread
+LOG_QUEUE_ENABLED = os.getenv("LOG_QUEUE_ENABLED", True)
+# log at most LOG_RATE_LIMIT INFO/DEBUG records per message per LOG_RATE_INTERVAL seconds, 0 disables
+LOG_RATE_LIMIT = os.getenv("LOG_RATE_LIMIT", 10)
+LOG_RATE_INTERVAL = os.getenv("LOG_RATE_INTERVAL", 60)
 
 # PROXY CONFIGURATION
 PROXY_ENABLED = os.getenv("PROXY_ENABLED", False)
@@ -83,22 +89,145 @@ LOGSTATS_INTERVAL = 10
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
 DOWNLOADER_MIDDLEWARES = {
+    "lsdbcrawler.middlewares.FrontierMiddleware": 50,
     "lsdbcrawler.middlewares.HttpProxyMiddelware": 150,
     "lsdbcrawler.middlewares.DeferMiddleware": 200,
     "scrapy.downloadermiddlewares.redirect.RedirectMiddleware": 250,
     "lsdbcrawler.middlewares.CustomRetryMiddleware": 300,
+    "lsdbcrawler.middlewares.AdaptiveThrottleMiddleware": 900,
 }
 
 DUPEFILTER_CLASS = "scrapy.dupefilters.RFPDupeFilter"
 
+# Enable or disable spider middlewares
+# See https://docs.scrapy.org/en/latest/topics/spider-middleware.html
+SPIDER_MIDDLEWARES = {
+    "lsdbcrawler.middlewares.FrontierMiddleware": 10,
+    "lsdbcrawler.middlewares.CallbackPriorityMiddleware": 550,
+    "lsdbcrawler.middlewares.TracingMiddleware": 560,
+    "lsdbcrawler.middlewares.CallbackTimingMiddleware": 950,
+}
+
+# Request priority per spider callback, higher is scheduled first
+PRIORITY_ENABLED = os.getenv("PRIORITY_ENABLED", False)
+CALLBACK_PRIORITIES = {
+    "parse_livesets_index": 0,
+    "parse_liveset": 10,
+    "parse_comments": 5,
+    "parse_download_link": 1,
+    "parse_user": 1,
+}
+# With PRIORITY_ENABLED, schedule the children of a set above the set itself so
+# each set completes before the next one is started
+PRIORITY_DEPTH_FIRST = os.getenv("PRIORITY_DEPTH_FIRST", True)
+
+# Maximum number of concurrent downloads per spider callback, e.g. {"parse_user": 2},
+# with SCHEDULER = "lsdbcrawler.scheduler.CallbackScheduler". At most
+# CALLBACK_MAX_HELD requests of capped callbacks are held back in memory.
+CALLBACK_CONCURRENCY = {}
+CALLBACK_MAX_HELD = os.getenv("CALLBACK_MAX_HELD", 1000)
+
+# Crawl with several nodes from one frontier by setting
+# SCHEDULER = "lsdbcrawler.scheduler.SharedScheduler" and
+# DUPEFILTER_CLASS = "lsdbcrawler.frontier.SharedDupeFilter".
+# Claimed requests are leased to a node for FRONTIER_LEASE seconds.
+FRONTIER_STORE = os.getenv("FRONTIER_STORE", "lsdbcrawler.frontier.MongoFrontierStore")
+FRONTIER_NAME = os.getenv("FRONTIER_NAME", "frontier")
+FRONTIER_NODE = os.getenv("FRONTIER_NODE", None)
+FRONTIER_LEASE = os.getenv("FRONTIER_LEASE", 300)
+# Seconds the number of pending requests in MongoDB is reused while non-zero
+FRONTIER_PENDING_INTERVAL = os.getenv("FRONTIER_PENDING_INTERVAL", 1.0)
+
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 ITEM_PIPELINES = {
+    "lsdbcrawler.pipelines.TrackMatchPipeline": 290,
+    "lsdbcrawler.pipelines.TracklistHistoryPipeline": 295,
     "lsdbcrawler.pipelines.MongoPipeline": 300,
+    "lsdbcrawler.pipelines.ExportPipeline": 310,
+    "lsdbcrawler.pipelines.AggregatePipeline": 320,
+    "lsdbcrawler.pipelines.CooccurrencePipeline": 330,
+    "lsdbcrawler.pipelines.SearchIndexPipeline": 340,
+}
+
+# Match the tracks of old-style tracklists to track ids with a character
+# n-gram index of the crawled track names, persisted to TRACK_MATCH_INDEX
+TRACK_MATCH_INDEX = os.getenv("TRACK_MATCH_INDEX", None)
+TRACK_MATCH_NGRAM = 3
+# Minimum Dice similarity of the n-grams of a match
+TRACK_MATCH_THRESHOLD = os.getenv("TRACK_MATCH_THRESHOLD", 0.75)
+
+# Keep every version of a set's tracklist as a delta in the tracklist_history
+# collection
+TRACKLIST_HISTORY_ENABLED = os.getenv("TRACKLIST_HISTORY_ENABLED", False)
+
+# Maintain artist/track co-occurrence matrices in COOCCURRENCE_DIR (requires
+# numpy and scipy)
+COOCCURRENCE_DIR = os.getenv("COOCCURRENCE_DIR", None)
+COOCCURRENCE_BATCH_SIZE = 1000
+
+# Maintain a SQLite FTS5 index of set descriptions, tracklists, comments and
+# track, artist and event names in SEARCH_INDEX, query with `scrapy search`
+SEARCH_INDEX = os.getenv("SEARCH_INDEX", None)
+SEARCH_INDEX_BATCH_SIZE = 1000
+
+# Maintain counters and top-N read models per artist, event, genre and track,
+# backfill with `scrapy rebuild_aggregates`
+AGGREGATES_ENABLED = os.getenv("AGGREGATES_ENABLED", False)
+
+# Export items to per collection files under EXPORT_DIR, as "jsonl" (gzip
+# compressed) or "parquet" (requires pyarrow). Run without MongoDB by setting
+# MONGODB_DATABASE to an empty value.
+EXPORT_DIR = os.getenv("EXPORT_DIR", None)
+EXPORT_FORMAT = os.getenv("EXPORT_FORMAT", "jsonl")
+EXPORT_BUFFER_SIZE = 1000
+# Start a new part file after this many bytes (uncompressed) or seconds
+EXPORT_ROTATE_BYTES = os.getenv("EXPORT_ROTATE_BYTES", 128 * 1024 * 1024)
+EXPORT_ROTATE_SECONDS = os.getenv("EXPORT_ROTATE_SECONDS", 3600)
+# Merge the parts of each collection into one file without duplicates when the spider closes
+EXPORT_COMPACT = os.getenv("EXPORT_COMPACT", False)
+
+# Enable or disable extensions
+# See https://docs.scrapy.org/en/latest/topics/extensions.html
+EXTENSIONS = {
+    "lsdbcrawler.extensions.OpenMetricsExporter": 500,
+    "lsdbcrawler.extensions.MemoryProfiler": 510,
+    "lsdbcrawler.extensions.QueuedLogging": 0,
+    "lsdbcrawler.extensions.RefreshDaemon": 520,
+    "lsdbcrawler.extensions.StatsFileWriter": 530,
 }
 
+# Write the final stats of a crawl as JSON to this file
+STATS_FILE = os.getenv("STATS_FILE", None)
+
+# Serve crawl metrics in the OpenMetrics format on METRICS_HOST:METRICS_PORT
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", False)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = os.getenv("METRICS_PORT", 9410)
+
+# Sample tracemalloc and RSS every MEMPROF_INTERVAL seconds, dumping a
+# snapshot to MEMPROF_DIR once the RSS crosses MEMPROF_RSS_THRESHOLD_MB
+MEMPROF_ENABLED = os.getenv("MEMPROF_ENABLED", False)
+MEMPROF_INTERVAL = os.getenv("MEMPROF_INTERVAL", 60)
+MEMPROF_RSS_THRESHOLD_MB = os.getenv("MEMPROF_RSS_THRESHOLD_MB", 0)
+MEMPROF_DIR = os.getenv("MEMPROF_DIR", "memprof")
+
+# Keep the spider running and accept set refresh jobs over HTTP, see `scrapy daemon`
+DAEMON_ENABLED = os.getenv("DAEMON_ENABLED", False)
+REFRESH_HOST = os.getenv("REFRESH_HOST", "127.0.0.1")
+REFRESH_PORT = os.getenv("REFRESH_PORT", 9411)
+REFRESH_PRIORITY = 1000
+REFRESH_URL = os.getenv("REFRESH_URL", "https://lsdb.eu/set/{set_id}/?page=1")
+# Seconds until a refresh job without a liveset item times out, 0 to wait forever
+REFRESH_TIMEOUT = os.getenv("REFRESH_TIMEOUT", 300)
+
+# Write per liveset trace spans to TRACE_FILE, see `scrapy trace_summary`
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", False)
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
+# LivesetSpider turns it off when ADAPTIVE_THROTTLE_ENABLED is set.
 AUTOTHROTTLE_ENABLED = True
 # The initial download delay
 AUTOTHROTTLE_START_DELAY = 0.1
@@ -110,6 +239,27 @@ AUTOTHROTTLE_TARGET_CONCURRENCY = 10
 # Enable showing throttling stats for every response received:
 AUTOTHROTTLE_DEBUG = True
 
+# Adapt the concurrency per download slot to the error rate and p95 latency
+# (AIMD), use instead of AutoThrottle. Concurrency is still capped by
+# CONCURRENT_REQUESTS.
+ADAPTIVE_THROTTLE_ENABLED = os.getenv("ADAPTIVE_THROTTLE_ENABLED", False)
+ADAPTIVE_THROTTLE_START_CONCURRENCY = 2
+ADAPTIVE_THROTTLE_MIN_CONCURRENCY = 1
+ADAPTIVE_THROTTLE_MAX_CONCURRENCY = CONCURRENT_REQUESTS
+# Share of errors per window of ADAPTIVE_THROTTLE_WINDOW responses tolerated,
+# 2 of 20 by default
+ADAPTIVE_THROTTLE_ERROR_BUDGET = os.getenv("ADAPTIVE_THROTTLE_ERROR_BUDGET", 0.1)
+# p95 download latency in seconds tolerated, 0 to only look at errors
+ADAPTIVE_THROTTLE_TARGET_LATENCY = os.getenv("ADAPTIVE_THROTTLE_TARGET_LATENCY", 5)
+ADAPTIVE_THROTTLE_WINDOW = 20
+# Not 500, LSDB answers it for some user pages. Statuses a request handles
+# (handle_httpstatus_list in its meta) are never errors.
+ADAPTIVE_THROTTLE_ERROR_CODES = [403, 429, 502, 503, 504]
+ADAPTIVE_THROTTLE_BAN_MARKERS = ["Too many requests", "temporarily banned"]
+# Requests per second per slot, 0 for no ceiling
+ADAPTIVE_THROTTLE_MAX_RATE = os.getenv("ADAPTIVE_THROTTLE_MAX_RATE", 0)
+ADAPTIVE_THROTTLE_BURST = 5
+
 # Enable and configure HTTP caching (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html#httpcache-middleware-settings
 # HTTPCACHE_ENABLED = True
@@ -124,3 +274,25 @@ TWISTED_REACTOR = "twisted.internet.asyncioreactor.AsyncioSelectorReactor"
 FEED_EXPORT_ENCODING = "utf-8"
 
 RETRY_TIMES = 5
+
+# Download link resolution
+# File keeping the ids of already resolved /listen/go/<id> links, skipped on recrawls
+DOWNLOAD_LINK_STORE = os.getenv("DOWNLOAD_LINK_STORE", None)
+# Resolve download links with a body-less HEAD request, falling back to GET
+DOWNLOAD_LINK_HEAD = os.getenv("DOWNLOAD_LINK_HEAD", False)
+
+# User page cache
+# File caching fetched user pages; cached users are not requested again until they expire
+USER_CACHE = os.getenv("USER_CACHE", None)
+USER_CACHE_TTL = os.getenv("USER_CACHE_TTL", 30 * 24 * 3600)
+# Users whose page returned 500 are retried after this delay, doubled on every failure
+USER_CACHE_NEGATIVE_TTL = os.getenv("USER_CACHE_NEGATIVE_TTL", 24 * 3600)
+USER_CACHE_NEGATIVE_MAX_TTL = os.getenv("USER_CACHE_NEGATIVE_MAX_TTL", 30 * 24 * 3600)
+
+# Collect the ratings and favorites of a set into a single item and only write
+# the differences with the stored ratings and favorites
+VOTES_SNAPSHOT = os.getenv("VOTES_SNAPSHOT", False)
+
+# Use slotted dataclass items for the small, high volume entities
+# (tracks, artists, genres, tags, events, ratings and favorites)
+COMPACT_ITEMS = os.getenv("COMPACT_ITEMS", False)
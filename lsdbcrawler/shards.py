@@ -0,0 +1,302 @@
+import glob
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+from lsdbcrawler.exports import compact, formats
+from lsdbcrawler.items import BaseItem, CompactItem
+
+logger = logging.getLogger(__name__)
+
+# files and directories written by one process only, every shard gets its
+# own. USER_CACHE, DOWNLOAD_LINK_STORE and TRACK_MATCH_INDEX are appended to
+# by all shards; SEARCH_INDEX and COOCCURRENCE_DIR are written per shard and
+# merged into the configured path after the shards exited.
+SHARD_PATH_SETTINGS = (
+    "TRACE_FILE",
+    "MEMPROF_DIR",
+    "SEARCH_INDEX",
+    "COOCCURRENCE_DIR",
+)
+
+
+def shard_path(path, index):
+    """``path`` of shard ``index``, e.g. ``users.shard-1.tsv`` for ``users.tsv``."""
+    root, ext = os.path.splitext(path.rstrip(os.sep))
+    return f"{root}.shard-{index}{ext}"
+
+
+def shard_paths(settings, index):
+    """Per shard values of the path settings that are set."""
+    return {
+        name: shard_path(settings.get(name), index)
+        for name in SHARD_PATH_SETTINGS
+        if settings.get(name)
+    }
+
+
+def shard_outputs(path):
+    """Existing per shard copies of ``path``, in shard order."""
+    root, ext = os.path.splitext(path.rstrip(os.sep))
+    pattern = glob.escape(root) + ".shard-*" + glob.escape(ext)
+    paths = [p for p in glob.glob(pattern) if p[len(root) + 7:len(p) - len(ext)].isdigit()]
+    return sorted(paths, key=lambda p: int(p[len(root) + 7:len(p) - len(ext)]))
+
+
+def unique_fields():
+    """``unique_fields`` of every item collection."""
+    fields = {}
+    for base in (BaseItem, CompactItem):
+        for cls in base.__subclasses__():
+            # a class failing check_item_schema is listed until it is collected
+            if isinstance(cls.collection, str) and isinstance(cls.unique_fields, list):
+                fields.setdefault(cls.collection, cls.unique_fields)
+    return fields
+
+
+def merge_stats(shard_stats):
+    """Merge the final stats of several shards into one report.
+
+    Counters are summed, ``max`` and memory values take the maximum, ``start_time`` the
+    earliest and ``finish_time`` the latest value. Finish reasons are counted.
+    """
+    merged = {}
+    reasons = {}
+
+    for stats in shard_stats:
+        for key, value in stats.items():
+            if key == "finish_reason":
+                reasons[value] = reasons.get(value, 0) + 1
+            elif key == "start_time":
+                merged[key] = min(merged.get(key, value), value)
+            elif key == "finish_time":
+                merged[key] = max(merged.get(key, value), value)
+            elif isinstance(value, bool) or not isinstance(value, (int, float)):
+                merged.setdefault(key, value)
+            elif "max" in key or key.startswith("memusage/"):
+                merged[key] = max(merged.get(key, value), value)
+            else:
+                merged[key] = merged.get(key, 0) + value
+
+    merged["finish_reason"] = reasons
+    return merged
+
+
+class Shard(object):
+    def __init__(self, index, count, directory, args, settings, paths=None):
+        self.index = index
+        self.count = count
+        self.directory = directory
+        self.args = args
+        self.settings = settings
+        self.paths = paths or {}
+        self.process = None
+        self.restarts = 0
+
+    @property
+    def checkpoint(self):
+        return os.path.join(self.directory, f"shard-{self.index}.checkpoint.json")
+
+    @property
+    def stats_file(self):
+        return os.path.join(self.directory, f"shard-{self.index}.stats.json")
+
+    @property
+    def log_file(self):
+        return os.path.join(self.directory, f"shard-{self.index}.log")
+
+    def command(self):
+        command = [
+            sys.executable, "-m", "scrapy", "crawl", "LivesetSpider",
+            "-a", f"shard={self.index}",
+            "-a", f"shards={self.count}",
+            "-a", f"checkpoint={self.checkpoint}",
+            "-s", f"STATS_FILE={self.stats_file}",
+            "-s", f"LOG_FILE={self.log_file}",
+            "-s", "LOG_FILE_APPEND=True",
+            # every shard would try to bind the same ports otherwise
+            "-s", "TELNETCONSOLE_ENABLED=False",
+            "-s", "METRICS_ENABLED=False",
+        ]
+        for arg in self.args:
+            command.extend(["-a", arg])
+        for setting in self.settings:
+            command.extend(["-s", setting])
+        # after the passed settings so they override them. Parts are compacted
+        # by the supervisor once all shards are done, a shard would remove the
+        # parts other shards are still writing.
+        for name, path in sorted(self.paths.items()):
+            command.extend(["-s", f"{name}={path}"])
+        command.extend(["-s", "EXPORT_COMPACT=False"])
+        return command
+
+    def start(self):
+        self.process = subprocess.Popen(self.command())
+        logger.info("Started shard %s (pid %s)", self.index, self.process.pid)
+
+    def poll(self):
+        return self.process.poll() if self.process else None
+
+
+class ShardSupervisor(object):
+    """Run ``count`` LivesetSpider processes, each crawling a shard of the index.
+
+    Shards crawl every ``count``-th index page and checkpoint the last index
+    page they parsed. A shard exiting with a non-zero status is restarted from
+    its checkpoint, up to ``max_restarts`` times.
+
+    ``crawl_settings`` are the settings the shards run with, i.e. the project
+    settings with ``settings`` applied. The files and directories of
+    ``SHARD_PATH_SETTINGS`` get a ``.shard-<index>`` suffix per shard. Once
+    all shards exited, the search indexes and co-occurrence matrices of the
+    shards are merged into ``SEARCH_INDEX`` and ``COOCCURRENCE_DIR`` and
+    ``EXPORT_COMPACT`` runs once. Shard outputs left by an interrupted run are
+    merged before the shards start.
+    """
+
+    def __init__(self, count, directory, args=(), settings=(), max_restarts=3, poll_interval=1,
+                 crawl_settings=None):
+        self.directory = directory
+        self.max_restarts = max_restarts
+        self.poll_interval = poll_interval
+        self.crawl_settings = crawl_settings
+        self.shards = [
+            Shard(
+                index, count, directory, args, settings,
+                paths=shard_paths(crawl_settings, index) if crawl_settings else None,
+            )
+            for index in range(count)
+        ]
+
+    def run(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.merge_outputs()
+        for shard in self.shards:
+            shard.start()
+
+        running = list(self.shards)
+        try:
+            while running:
+                time.sleep(self.poll_interval)
+                for shard in list(running):
+                    returncode = shard.poll()
+                    if returncode is None:
+                        continue
+
+                    if returncode != 0 and shard.restarts < self.max_restarts:
+                        shard.restarts += 1
+                        logger.warning(
+                            "Shard %s exited with %s, restarting from checkpoint (%s/%s)",
+                            shard.index, returncode, shard.restarts, self.max_restarts,
+                        )
+                        shard.start()
+                        continue
+
+                    if returncode != 0:
+                        logger.error("Shard %s failed with %s, giving up", shard.index, returncode)
+                    running.remove(shard)
+        finally:
+            for shard in running:
+                shard.process.terminate()
+            for shard in running:
+                shard.process.wait()
+
+        return self.merged_stats(self.merge_outputs())
+
+    def merge_outputs(self):
+        """Merge the per shard outputs; returns the merge stats."""
+        stats = {}
+        stats.update(self.merge_search_indexes())
+        stats.update(self.merge_cooccurrence())
+        stats.update(self.compact_exports())
+        return stats
+
+    def merge_search_indexes(self):
+        settings = self.crawl_settings
+        if not settings or not settings.get("SEARCH_INDEX"):
+            return {}
+
+        from lsdbcrawler.search import SearchIndex
+
+        paths = shard_outputs(settings.get("SEARCH_INDEX"))
+        if not paths:
+            return {}
+
+        index = SearchIndex(settings.get("SEARCH_INDEX"))
+        index.open()
+        merged = 0
+        try:
+            for path in paths:
+                merged += index.merge(path)
+                for suffix in ("", "-wal", "-shm"):
+                    if os.path.isfile(path + suffix):
+                        os.remove(path + suffix)
+            entries = len(index)
+        finally:
+            index.close()
+        logger.info("Merged %s search index entries of %s shards", merged, len(paths))
+        return {"search_index/merged": merged, "search_index/entries": entries}
+
+    def merge_cooccurrence(self):
+        settings = self.crawl_settings
+        if not settings or not settings.get("COOCCURRENCE_DIR"):
+            return {}
+
+        directory = settings.get("COOCCURRENCE_DIR")
+        paths = [p for p in shard_outputs(directory) if os.path.isfile(os.path.join(p, "meta.json"))]
+        if not paths:
+            return {}
+
+        try:
+            from lsdbcrawler.cooccurrence import CooccurrenceMatrices
+        except ImportError:
+            logger.warning("Can't merge the co-occurrence matrices of the shards without numpy and scipy")
+            return {}
+
+        if os.path.isfile(os.path.join(directory, "meta.json")):
+            matrices = CooccurrenceMatrices.load(directory)
+        else:
+            matrices = CooccurrenceMatrices()
+        updated = sum(matrices.merge(CooccurrenceMatrices.load(path)) for path in paths)
+        matrices.save(directory)
+        for path in paths:
+            shutil.rmtree(path)
+        logger.info("Merged the co-occurrence matrices of %s shards", len(paths))
+        return {"cooccurrence/merged": updated, "cooccurrence/sets": len(matrices.sets)}
+
+    def compact_exports(self):
+        """Compact the export parts of all shards; returns the compaction stats."""
+        settings = self.crawl_settings
+        if not settings or not settings.get("EXPORT_DIR") or not settings.getbool("EXPORT_COMPACT"):
+            return {}
+
+        directory = settings.get("EXPORT_DIR")
+        part_cls = formats[settings.get("EXPORT_FORMAT", "jsonl")]
+        stats = {}
+        for collection, fields in unique_fields().items():
+            if not os.path.isdir(os.path.join(directory, collection)):
+                continue
+            kept, dropped = compact(os.path.join(directory, collection), fields, part_cls)
+            stats[f"export/{collection}/compacted"] = kept
+            stats[f"export/{collection}/duplicates"] = dropped
+        return stats
+
+    def merged_stats(self, compacted=None):
+        shard_stats = []
+        for shard in self.shards:
+            if os.path.isfile(shard.stats_file):
+                with open(shard.stats_file, mode="r", encoding="utf-8") as f:
+                    shard_stats.append(json.load(f))
+
+        merged = merge_stats(shard_stats)
+        merged["shards"] = len(self.shards)
+        merged["shards/restarts"] = sum(shard.restarts for shard in self.shards)
+        merged.update(compacted or {})
+
+        with open(os.path.join(self.directory, "stats.json"), mode="w", encoding="utf-8") as f:
+            json.dump(merged, f, default=str, indent=1, sort_keys=True)
+        return merged
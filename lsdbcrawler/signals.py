@@ -0,0 +1,24 @@
+"""Signals sent by lsdbcrawler components, in addition to scrapy.signals.
+
+callback_parsed(request, response, callback, seconds, spider)
+    A spider callback finished processing a response.
+
+database_write(collection, operations, seconds, spider)
+    The Mongo pipeline wrote ``operations`` documents to ``collection``.
+
+proxy_failed(request, proxy, exception, spider)
+    A request sent through ``proxy`` failed with a download exception.
+
+refresh_failed(request, failure, spider)
+    The download of a refresh job of the refresh daemon failed.
+
+request_done(request, spider)
+    The spider output for the response of a request was consumed, or its
+    download failed and was not retried.
+"""
+
+callback_parsed = object()
+database_write = object()
+proxy_failed = object()
+refresh_failed = object()
+request_done = object()
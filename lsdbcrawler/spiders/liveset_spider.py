@@ -1,14 +1,15 @@
+import os
 import re
-import dateparser
+import json
 import scrapy
 import urllib.parse
 
 from scrapy.linkextractors import LinkExtractor
 from scrapy import Request, exceptions
 from scrapy.crawler import logger
+from w3lib.url import add_or_replace_parameter, url_query_parameter
 
-from markdownify import markdownify
-
+from lsdbcrawler import signals as lsdb_signals
 from lsdbcrawler.items import (
     LivesetItem,
     TrackItem,
@@ -20,10 +21,13 @@ from lsdbcrawler.items import (
     DownloadLinkItem,
     RaitingItem,
     FavoriteItem,
+    LivesetVotesItem,
     CommentItem,
+    compact_items,
 )
 
-from lsdbcrawler.processors import to_int
+from lsdbcrawler.processors import to_int, parse_anomalies, parse_date, html_to_markdown
+from lsdbcrawler.stores import IdStore, ExpiringStore
 
 
 set_submitted_regex = re.compile(
@@ -42,6 +46,9 @@ set_user_description_regex = re.compile(
 
 legacy_track_regex = re.compile(r"^(?P<index>\d{1,3})\s*[-.:]\s*(?P<song>.+?)$")
 
+# /listen/go/<id> may answer with a redirect to the actual download location
+redirect_statuses = [301, 302, 303, 307, 308]
+
 
 def defer_request(seconds: int, request: Request) -> Request:
     meta = dict(request.meta)
@@ -58,19 +65,115 @@ class LivesetSpider(scrapy.Spider):
     # url 'https://lsdb.eu/user/DJTheJoker' returns 500
     handle_httpstatus_list = [500]
 
+    @classmethod
+    def update_settings(cls, settings):
+        super(LivesetSpider, cls).update_settings(settings)
+        # the adaptive throttle replaces AutoThrottle, both would set the slot delays
+        if settings.getbool("ADAPTIVE_THROTTLE_ENABLED"):
+            settings.set("AUTOTHROTTLE_ENABLED", False, priority="spider")
+
     def __init__(self, *args, **kwargs):
         super(LivesetSpider, self).__init__(*args, **kwargs)
 
-        if kwargs.get("start_urls"):
-            self.start_urls = kwargs.get("start_urls").split(",")
+        # an empty start_urls argument starts without any urls (daemon mode)
+        if kwargs.get("start_urls") is not None:
+            self.start_urls = [url for url in kwargs.get("start_urls").split(",") if url]
 
         #self.allowed_domains = list(
         #    set(urllib.parse.urlparse(url).netloc for url in self.start_urls)
         #)
 
+        self.download_link_store = None
+        self.user_cache = None
+        self.compact_items = False
+
+        # shard <shard> of <shards> crawls the index pages shard + 1,
+        # shard + 1 + shards, ... and records the last parsed page in checkpoint
+        self.shard = int(kwargs.get("shard", 0))
+        self.shards = int(kwargs.get("shards", 1))
+        self.checkpoint = kwargs.get("checkpoint")
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(LivesetSpider, cls).from_crawler(crawler, *args, **kwargs)
+
+        spider.compact_items = crawler.settings.getbool("COMPACT_ITEMS")
+
+        store_path = crawler.settings.get("DOWNLOAD_LINK_STORE")
+        if store_path:
+            spider.download_link_store = IdStore(store_path)
+            spider.download_link_store.open()
+
+        user_cache_path = crawler.settings.get("USER_CACHE")
+        if user_cache_path:
+            spider.user_cache = ExpiringStore(
+                user_cache_path,
+                ttl=crawler.settings.getfloat("USER_CACHE_TTL"),
+                negative_ttl=crawler.settings.getfloat("USER_CACHE_NEGATIVE_TTL"),
+                negative_max_ttl=crawler.settings.getfloat(
+                    "USER_CACHE_NEGATIVE_MAX_TTL"
+                ),
+            )
+            spider.user_cache.open()
+
+        return spider
+
+    def closed(self, reason):
+        # a finished shard starts from the beginning next time
+        if reason == "finished" and self.checkpoint and os.path.isfile(self.checkpoint):
+            os.remove(self.checkpoint)
+
+        if self.download_link_store is not None:
+            self.download_link_store.close()
+
+        if self.user_cache is not None:
+            self.user_cache.close()
+
+        stats = self.get_stats()
+        if stats:
+            for call_site, count in parse_anomalies.items():
+                stats.inc_value("parse_anomalies/to_int", count)
+                stats.set_value(f"parse_anomalies/to_int/{call_site}", count)
+            parse_anomalies.clear()
+
+            logger.info(
+                "Download links: %s requested, %s skipped (already resolved), "
+                "%s resolved from Location header, %s resolved from page body",
+                stats.get_value("download_link/requested", 0),
+                stats.get_value("download_link/skipped", 0),
+                stats.get_value("download_link/resolved_location", 0),
+                stats.get_value("download_link/resolved_body", 0),
+            )
+            logger.info(
+                "User pages: %s requested, %s skipped (cached)",
+                stats.get_value("user_cache/requested", 0),
+                stats.get_value("user_cache/skipped", 0),
+            )
+
+    def get_stats(self):
+        crawler = getattr(self, "crawler", None)
+        return crawler.stats if crawler else None
+
+    def inc_stat(self, key, count=1):
+        stats = self.get_stats()
+        if stats:
+            stats.inc_value(key, count)
+
+    def new_item(self, item_cls, **kwargs):
+        """Create an item, using its compact variant when COMPACT_ITEMS is enabled."""
+        if self.compact_items:
+            item_cls = compact_items.get(item_cls, item_cls)
+        return item_cls(**kwargs)
+
     def parse(self, response):
         raise exceptions.IgnoreRequest("")
 
+    def refresh_failed(self, failure):
+        """Errback of the refresh daemon's requests."""
+        self.crawler.signals.send_catch_log(
+            lsdb_signals.refresh_failed, request=failure.request, failure=failure, spider=self
+        )
+
     def start_requests(self):
         logger.info("Starting spider with urls %s", self.start_urls)
 
@@ -80,7 +183,7 @@ class LivesetSpider(scrapy.Spider):
             match page_type:
                 case "livesets":
                     yield scrapy.Request(
-                        url,
+                        self.shard_start_url(url),
                         callback=self.parse_livesets_index,
                         dont_filter=True,
                     )
@@ -114,6 +217,13 @@ class LivesetSpider(scrapy.Spider):
         liveset_links = self.get_liveset_links(response)
         logger.info("Found %s livesets on page %s", len(liveset_links), current_page)
 
+        if self.is_sharded():
+            if not liveset_links:
+                logger.info("Shard %s reached the end of the index at %s", self.shard, response.url)
+                return
+            if next_page_url:
+                next_page_url = self.shard_next_page_url(response)
+
         if not liveset_links:
             logger.info("No livesets found on page %s (URL: %s)", current_page, response.url)
             yield self.next_page(next_page_url, response)
@@ -121,6 +231,9 @@ class LivesetSpider(scrapy.Spider):
     
         yield from self.process_liveset_links(liveset_links)
 
+        if self.checkpoint:
+            self.write_checkpoint(response)
+
         if next_page_url:
             if not self.settings.get("DEBUG"):
                 yield Request(
@@ -130,6 +243,38 @@ class LivesetSpider(scrapy.Spider):
         else:
             logger.info("No more liveset pages found. Crawling finished.")
 
+    def is_sharded(self):
+        return self.shards > 1 or bool(self.checkpoint)
+
+    def index_page_number(self, url):
+        return to_int(url_query_parameter(url, "page", "1"), fallback=1)
+
+    def shard_start_url(self, url):
+        """Index url this shard starts at, resuming from its checkpoint."""
+        if not self.is_sharded():
+            return url
+
+        page = self.shard + 1
+        if self.checkpoint and os.path.isfile(self.checkpoint):
+            with open(self.checkpoint, mode="r", encoding="utf-8") as f:
+                checkpoint_page = json.load(f)["page"]
+            # sets of the page before the checkpoint may still have been in
+            # flight, so resume one page before it
+            page = max(page, checkpoint_page - self.shards)
+            logger.info("Shard %s resuming from index page %s", self.shard, page)
+
+        return add_or_replace_parameter(url, "page", str(page))
+
+    def shard_next_page_url(self, response):
+        page = self.index_page_number(response.url) + self.shards
+        return add_or_replace_parameter(response.url, "page", str(page))
+
+    def write_checkpoint(self, response):
+        checkpoint = {"page": self.index_page_number(response.url), "url": response.url}
+        with open(self.checkpoint + ".tmp", mode="w", encoding="utf-8") as f:
+            json.dump(checkpoint, f)
+        os.replace(self.checkpoint + ".tmp", self.checkpoint)
+
     def get_next_page_url(self, response):
         active_page = response.xpath("(//ul[@class='paging'])[1]/li[@class='active']") or None
         if not active_page:
@@ -179,7 +324,7 @@ class LivesetSpider(scrapy.Spider):
 
         logger.info("Parsing liveset ID %s", liveset_id)
 
-        liveset_date = dateparser.parse(
+        liveset_date = parse_date(
             response.xpath(
                 "//div[contains(@class, 'page_liveset')]//h1/time/@datetime"
             ).get()
@@ -199,7 +344,7 @@ class LivesetSpider(scrapy.Spider):
 
         liveset_artists = list()
         for idx, (artist_obj, seperator) in enumerate(zip(artists, separators)):
-            artist_item = ArtistItem()
+            artist_item = self.new_item(ArtistItem)
 
             artist_text = artist_obj.xpath("./text()").get()
             artist_url = artist_obj.xpath("./@href").get()
@@ -217,7 +362,7 @@ class LivesetSpider(scrapy.Spider):
         liveset_event_href = event_info.xpath("./@href").get()
         liveset_event_id = to_int(liveset_event_href.split("/")[3])
         liveset_event_name = str(event_info.xpath("./text()").get()).strip()
-        event_item = EventItem()
+        event_item = self.new_item(EventItem)
         event_item["event_id"] = liveset_event_id
         event_item["name"] = liveset_event_name
         yield event_item
@@ -236,7 +381,7 @@ class LivesetSpider(scrapy.Spider):
 
         liveset_genres = list()
         for idx, url in enumerate(liveset_genres_urls):
-            genre_item = GenreItem()
+            genre_item = self.new_item(GenreItem)
 
             genre_text = str(url.xpath("./text()").get()).strip()
             genre_url = url.xpath("./@href").get()
@@ -255,7 +400,7 @@ class LivesetSpider(scrapy.Spider):
 
         livset_tags = list()
         for idx, url in enumerate(liveset_tag_urls):
-            tag_item = TagItem()
+            tag_item = self.new_item(TagItem)
 
             tag_text = str(url.xpath("./text()").get()).strip()
             tag_url = url.xpath("./@href").get()
@@ -286,7 +431,7 @@ class LivesetSpider(scrapy.Spider):
         )
 
         liveset_description_markdown = (
-            markdownify(liveset_description_html_fixed).strip().replace(r"\_", "_")
+            html_to_markdown(liveset_description_html_fixed).strip().replace(r"\_", "_")
         )
 
         liveset_submitted_list = re.match(
@@ -304,7 +449,7 @@ class LivesetSpider(scrapy.Spider):
 
             # note that LSDB does not store timestamp with timezone,
             # nor do the timezone change when browsing from another region. Force timezone
-            liveset_submitted_fulldate = dateparser.parse(
+            liveset_submitted_fulldate = parse_date(
                 liveset_submitted_date + " " + liveset_submitted_time,
                 settings={
                     "TIMEZONE": "Europe/Amsterdam",
@@ -313,10 +458,7 @@ class LivesetSpider(scrapy.Spider):
                 },
             )
 
-            yield scrapy.Request(
-                response.urljoin(liveset_submitted_url),
-                callback=self.parse_user,
-            )
+            yield from self.user_request(response.urljoin(liveset_submitted_url))
 
             liveset_submitted_info = {
                 "date": liveset_submitted_fulldate,
@@ -339,7 +481,7 @@ class LivesetSpider(scrapy.Spider):
 
             # note that LSDB does not store timestamp with timezone,
             # nor do the timezone change when browsing from another region. Force timezone
-            liveset_edited_fulldate = dateparser.parse(
+            liveset_edited_fulldate = parse_date(
                 liveset_edited_date + " " + liveset_edited_time,
                 settings={
                     "TIMEZONE": "Europe/Amsterdam",
@@ -348,10 +490,7 @@ class LivesetSpider(scrapy.Spider):
                 },
             )
 
-            yield scrapy.Request(
-                response.urljoin(liveset_edited_url),
-                callback=self.parse_user,
-            )
+            yield from self.user_request(response.urljoin(liveset_edited_url))
 
             liveset_edited_info = {
                 "date": liveset_edited_fulldate,
@@ -365,22 +504,37 @@ class LivesetSpider(scrapy.Spider):
             "//span[contains(@id, 'favorites_first') or contains(@id, 'favorites_all')]/a/@href"
         )
 
+        # with VOTES_SNAPSHOT all votes of the set are collected into one item
+        votes_snapshot = self.settings.getbool("VOTES_SNAPSHOT")
+        liveset_votes = LivesetVotesItem(
+            liveset_set_id=liveset_id, ratings=[], favorites=[]
+        )
+
         for idx, user_url in enumerate(liveset_favorited_users):
-            favorite_item = FavoriteItem()
+            favorite_item = self.new_item(FavoriteItem)
             favorite_item["liveset_set_id"] = liveset_id
             favorite_item["user_name"] = user_url.get().split("/")[-1]
-            yield favorite_item
+            if votes_snapshot:
+                liveset_votes["favorites"].append(dict(favorite_item))
+            else:
+                yield favorite_item
 
         liveset_ratings = response.xpath(
             "//span[contains(@id, 'ratings_first') or contains(@id, 'ratings_all')]/a"
         )
         for idx, ratings in enumerate(liveset_ratings):
-            rating_item = RaitingItem()
+            rating_item = self.new_item(RaitingItem)
             rating = ratings.xpath("@class").get().split(" ")[1]
             rating_item["liveset_set_id"] = liveset_id
             rating_item["rating"] = to_int(rating.replace("rating-", ""))
             rating_item["user_name"] = ratings.xpath("@href").get().split("/")[-1]
-            yield rating_item
+            if votes_snapshot:
+                liveset_votes["ratings"].append(dict(rating_item))
+            else:
+                yield rating_item
+
+        if votes_snapshot:
+            yield liveset_votes
 
         liveset_real_description_markdown = ""
         liveset_real_description_markdown_search = re.findall(
@@ -405,8 +559,10 @@ class LivesetSpider(scrapy.Spider):
 
             for track in tracklist_data:
                 if track["track_type"] == "w" or track["track_type"] == "track":
-                    track_item = TrackItem(
-                        track_id=track["track_id"], track_name=track["track_name"]
+                    track_item = self.new_item(
+                        TrackItem,
+                        track_id=track["track_id"],
+                        track_name=track["track_name"],
                     )
                     yield track_item
                     del track["track_name"]
@@ -445,29 +601,87 @@ class LivesetSpider(scrapy.Spider):
         ).extract_links(response)
 
         for link in liveset_download_links:
-            yield Request(
-                link.url,
-                callback=self.parse_download_link,
-                meta={"liveset": liveset},
-            )
             download_id = to_int(link.url.split("/")[-1])
             liveset["download_ids"].append(download_id)
 
+            if (
+                self.download_link_store is not None
+                and download_id in self.download_link_store
+            ):
+                self.inc_stat("download_link/skipped")
+                continue
+
+            self.inc_stat("download_link/requested")
+            yield self.download_link_request(link.url, liveset_id)
+
         yield liveset
 
+    def download_link_request(self, url, liveset_id, method=None):
+        """Build a request resolving a /listen/go/<id> link.
+
+        Only the set id travels in meta so the liveset item is not kept alive
+        until every download link has been resolved. Redirects are not
+        followed, the target is read from the Location header instead.
+        """
+        if method is None:
+            method = "HEAD" if self.settings.getbool("DOWNLOAD_LINK_HEAD") else "GET"
+
+        return Request(
+            url,
+            method=method,
+            callback=self.parse_download_link,
+            meta={
+                "liveset_set_id": liveset_id,
+                "dont_redirect": True,
+                "handle_httpstatus_list": redirect_statuses,
+            },
+        )
+
     def parse_download_link(self, response):
+        download_link_id = to_int(response.url.split("/")[-1])
+        liveset_id = response.meta["liveset_set_id"]
+
+        location = response.headers.get("Location")
+        if response.status in redirect_statuses and location:
+            download_url = response.urljoin(location.decode("latin1"))
+            self.inc_stat("download_link/resolved_location")
+        elif response.request.method == "HEAD":
+            # no redirect, the link is only available in the page body
+            self.inc_stat("download_link/head_fallback")
+            yield self.download_link_request(response.url, liveset_id, method="GET")
+            return
+        else:
+            download_url = response.xpath("//div/a[1]").xpath("@href").get()
+            self.inc_stat("download_link/resolved_body")
+
         download_item = DownloadLinkItem()
-        download_item["download_link_id"] = to_int(response.url.split("/")[-1])
-        download_item["download_url"] = (
-            response.xpath("//div/a[1]").xpath("@href").get()
-        )
-        download_item["liveset_set_id"] = response.meta["liveset"]["set_id"]
+        download_item["download_link_id"] = download_link_id
+        download_item["download_url"] = download_url
+        download_item["liveset_set_id"] = liveset_id
+
+        if self.download_link_store is not None and download_url:
+            self.download_link_store.add(download_link_id)
 
         yield download_item
 
+    def user_request(self, url):
+        """Request a user page unless the user is in the user cache."""
+        # cache users by profile path, the host may be lsdb.eu or lsdb.nl
+        key = urllib.parse.urlparse(url).path
+        if self.user_cache is not None and key in self.user_cache:
+            self.inc_stat("user_cache/skipped")
+            return
+
+        self.inc_stat("user_cache/requested")
+        yield scrapy.Request(
+            url, callback=self.parse_user, meta={"user_cache_key": key}
+        )
+
     def parse_user(self, response):
         if response.status == 500:
             logger.warning("User page for user %s returned 500", response.url)
+            if self.user_cache is not None:
+                self.user_cache.add_failure(response.meta["user_cache_key"])
             # raise exceptions.IgnoreRequest("skipping user page")
             return
         user = UserItem()
@@ -482,7 +696,10 @@ class LivesetSpider(scrapy.Spider):
         user_details = response.xpath("/html/body/div[3]/div[2]/div[1]").get()
         registered = re.search(r"(\d{4}|\d{2}-\d{2}-\d{4})", user_details)
         if registered:
-            user["registered"] = dateparser.parse(registered.group())
+            user["registered"] = parse_date(registered.group())
+
+        if self.user_cache is not None:
+            self.user_cache.add_success(response.meta["user_cache_key"])
 
         yield user
 
@@ -500,7 +717,7 @@ class LivesetSpider(scrapy.Spider):
             comment_user_href = comment_head.xpath(".//a[contains(@href, '/user/')]")
             comment_user_name = comment_user_href.xpath("@href").get().split("/")[-1]
             comment_date = comment.xpath(".//time/@datetime").get()
-            comment_date = dateparser.parse(
+            comment_date = parse_date(
                 comment_date,
                 settings={
                     "TIMEZONE": "Europe/Amsterdam",
@@ -512,7 +729,7 @@ class LivesetSpider(scrapy.Spider):
             comment_body = comment.xpath("./div[2]")
             comment_text = comment_body.xpath("./div").get()
             comment_text = re.sub(r"\n\s+", "", comment_text.strip())
-            comment_text = markdownify(comment_text.strip())
+            comment_text = html_to_markdown(comment_text.strip())
 
             comment_item = CommentItem()
             comment_item["comment_id"] = comment_id
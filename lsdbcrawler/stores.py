@@ -0,0 +1,182 @@
+import os
+import time
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows, the cache file is never compacted
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class IdStore(object):
+    """Append-only set of ids persisted to a text file, one id per line.
+
+    The whole file is loaded into memory when the store is opened so lookups
+    are plain set membership tests; new ids are appended as they are added.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._ids = set()
+        self._file = None
+
+    def open(self):
+        if os.path.isfile(self.path):
+            with open(self.path, mode="r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        self._ids.add(line)
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._file = open(self.path, mode="a", encoding="utf-8")
+        logger.info("Loaded %s ids from %s", len(self._ids), self.path)
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def add(self, key):
+        key = str(key)
+        if key in self._ids:
+            return False
+
+        self._ids.add(key)
+        if self._file:
+            self._file.write(key + "\n")
+            self._file.flush()
+        return True
+
+    def __contains__(self, key):
+        return str(key) in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+
+class ExpiringStore(object):
+    """Positive and negative cache of keys persisted to a tab separated file.
+
+    Each line records ``key, ok|fail, timestamp, failures``; the last line for
+    a key wins. Successful keys are cached for ``ttl`` seconds. Failed keys
+    are cached for ``negative_ttl`` seconds, doubled for every consecutive
+    failure up to ``negative_max_ttl``.
+
+    On open the keys that are still valid are kept in a plain set, so lookups
+    during the crawl do not look at timestamps at all.
+
+    Several processes may append to the same file. Each holds a shared lock
+    on ``<path>.lock`` while it is open; on close the file is compacted to
+    the latest entry per key, into a new file replacing the old one, only if
+    no other process holds the lock.
+    """
+
+    def __init__(self, path, ttl, negative_ttl, negative_max_ttl):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.negative_max_ttl = negative_max_ttl
+        self._cached = set()
+        self._failures = {}
+        self._file = None
+        self._lock = None
+
+    def _read(self):
+        entries = {}
+        if os.path.isfile(self.path):
+            with open(self.path, mode="r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) != 4:
+                        continue
+                    key, status, timestamp, failures = parts
+                    entries[key] = (status, float(timestamp), int(failures))
+        return entries
+
+    def open(self, now=None):
+        now = time.time() if now is None else now
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        if fcntl is not None:
+            # held while the file is open, waits for a compaction to finish
+            self._lock = open(self.path + ".lock", mode="a")
+            fcntl.flock(self._lock, fcntl.LOCK_SH)
+
+        entries = self._read()
+        for key, (status, timestamp, failures) in entries.items():
+            if status == "fail":
+                self._failures[key] = failures
+                expires = timestamp + self.backoff(failures)
+            else:
+                expires = timestamp + self.ttl
+
+            if expires > now:
+                self._cached.add(key)
+
+        self._file = open(self.path, mode="a", encoding="utf-8")
+        logger.info(
+            "Loaded %s cached keys (%s failed) from %s",
+            len(self._cached),
+            len(self._failures),
+            self.path,
+        )
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+        if self._lock is not None:
+            try:
+                # fails while another process has the file open
+                fcntl.flock(self._lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                pass
+            else:
+                self.compact()
+            finally:
+                self._lock.close()
+                self._lock = None
+
+    def compact(self):
+        """Rewrite the file with only the latest entry per key."""
+        entries = self._read()
+        with open(self.path + ".new", mode="w", encoding="utf-8") as f:
+            for key, (status, timestamp, failures) in entries.items():
+                f.write(f"{key}\t{status}\t{timestamp}\t{failures}\n")
+        os.replace(self.path + ".new", self.path)
+
+    def backoff(self, failures):
+        return min(
+            self.negative_ttl * 2 ** max(failures - 1, 0), self.negative_max_ttl
+        )
+
+    def add_success(self, key):
+        self._failures.pop(key, None)
+        self._write(key, "ok", 0)
+
+    def add_failure(self, key):
+        failures = self._failures.get(key, 0) + 1
+        self._failures[key] = failures
+        self._write(key, "fail", failures)
+
+    def _write(self, key, status, failures):
+        self._cached.add(key)
+        if self._file:
+            self._file.write(f"{key}\t{status}\t{time.time()}\t{failures}\n")
+            self._file.flush()
+
+    def __contains__(self, key):
+        return key in self._cached
+
+    def __len__(self):
+        return len(self._cached)
@@ -0,0 +1,81 @@
+import datetime
+import unittest
+from collections import defaultdict
+from unittest.mock import MagicMock
+
+from lsdbcrawler.aggregates import AggregateStore, contribution, delta, encode
+
+
+def liveset(tracks, artists=(1,), genres=("techno",)):
+    return {
+        "set_id": 7,
+        "set_date": datetime.datetime(2024, 5, 1),
+        "artists": [{"artist": artist, "separator": ""} for artist in artists],
+        "event_id": 3,
+        "genres": list(genres),
+        "tracklist": {
+            "type": "modern",
+            "tracks": [{"track_id": track, "track_type": "track"} for track in tracks]
+            + [{"track_id": 0, "track_type": "ID"}],
+        },
+    }
+
+
+class TestContribution(unittest.TestCase):
+    def test_contribution(self):
+        counters = contribution(liveset([10, 11, 10], artists=(1, 2)))
+
+        self.assertEqual(counters["artist_stats", (1,)], 1)
+        self.assertEqual(counters["event_stats", (3,)], 1)
+        self.assertEqual(counters["genre_artists", ("techno", 2)], 1)
+        self.assertEqual(counters["track_stats", (10,)], 2)
+        self.assertEqual(counters["artist_tracks", (2, 10)], 2)
+        self.assertEqual(counters["track_years", (2024, 11)], 1)
+        self.assertNotIn(("track_stats", (0,)), counters)
+
+    def test_delta_of_changed_tracklist(self):
+        old = contribution(liveset([10, 11]))
+        new = contribution(liveset([10, 12], genres=()))
+        changes = delta(old, new)
+
+        self.assertEqual(changes["track_stats", (11,)], -1)
+        self.assertEqual(changes["track_stats", (12,)], 1)
+        self.assertEqual(changes["genre_stats", ("techno",)], -1)
+        self.assertNotIn(("track_stats", (10,)), changes)
+        self.assertNotIn(("artist_stats", (1,)), changes)
+
+
+class TestAggregateStore(unittest.TestCase):
+    def setUp(self):
+        self.collections = defaultdict(MagicMock)
+        self.database = MagicMock()
+        self.database.__getitem__.side_effect = self.collections.__getitem__
+        self.store = AggregateStore(self.database)
+
+    def test_recrawl_applies_delta(self):
+        contributions = self.database["aggregate_contributions"]
+        contributions.find_one.return_value = {
+            "_id": 7, "entries": encode(contribution(liveset([10, 11])))
+        }
+
+        self.assertEqual(self.store.apply(liveset([10, 12])), 6)
+
+        operations = [
+            (op._filter, getattr(op, "_doc", None))
+            for call in self.database["track_stats"].bulk_write.call_args_list
+            for op in call.args[0]
+        ]
+        self.assertIn(({"track_id": 11}, {"$inc": {"plays": -1}}), operations)
+        self.assertIn(({"track_id": 11, "plays": {"$lte": 0}}, None), operations)
+        self.assertIn(({"track_id": 12}, {"$inc": {"plays": 1}}), operations)
+        contributions.replace_one.assert_called_once()
+
+    def test_unchanged_recrawl_writes_nothing(self):
+        contributions = self.database["aggregate_contributions"]
+        contributions.find_one.return_value = {
+            "_id": 7, "entries": encode(contribution(liveset([10])))
+        }
+
+        self.assertEqual(self.store.apply(liveset([10])), 0)
+        self.database["track_stats"].bulk_write.assert_not_called()
+        contributions.replace_one.assert_not_called()
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+
+import pytest
+
+pytest.importorskip("scipy")
+
+from scrapy.settings import Settings  # noqa: E402
+
+from lsdbcrawler.cooccurrence import CooccurrenceMatrices  # noqa: E402
+from lsdbcrawler.shards import ShardSupervisor, shard_outputs, shard_path  # noqa: E402
+
+
+def liveset(set_id, artists, tracks):
+    return {
+        "set_id": set_id,
+        "artists": [{"artist": artist, "separator": ""} for artist in artists],
+        "tracklist": {
+            "type": "modern",
+            "tracks": [{"track_id": track, "track_type": "track"} for track in tracks],
+        },
+    }
+
+
+class TestCooccurrenceMatrices(unittest.TestCase):
+    def setUp(self):
+        self.matrices = CooccurrenceMatrices()
+        self.matrices.update([
+            liveset(1, [100], [10, 11, 12]),
+            liveset(2, [100], [10, 11]),
+            liveset(3, [200], [10, 11, 13]),
+        ])
+        self.matrices.update([liveset(4, [300], [20])])
+
+    def test_cooccurring_tracks(self):
+        self.assertEqual(self.matrices.cooccurring_tracks(10), [(11, 3), (12, 1), (13, 1)])
+        self.assertEqual(self.matrices.cooccurring_tracks(99), [])
+
+    def test_similar_artists(self):
+        similar = self.matrices.similar_artists(100)
+        self.assertEqual([artist for artist, _ in similar], [200])
+        self.assertAlmostEqual(similar[0][1], 2 / 3)
+
+    def test_recrawl_replaces_set(self):
+        self.assertEqual(self.matrices.update([liveset(3, [200], [10, 11, 13])]), 0)
+        self.matrices.update([liveset(3, [200], [13, 20])])
+
+        self.assertEqual(self.matrices.cooccurring_tracks(10), [(11, 2), (12, 1)])
+        self.assertEqual(self.matrices.cooccurring_tracks(13), [(20, 1)])
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "cooccurrence")
+            self.matrices.save(path)
+            loaded = CooccurrenceMatrices.load(path)
+
+            self.assertEqual(loaded.cooccurring_tracks(10), [(11, 3), (12, 1), (13, 1)])
+            loaded.update([liveset(1, [100], [10])])
+            self.assertEqual(loaded.cooccurring_tracks(10), [(11, 2), (13, 1)])
+            # saving over the memory-mapped version
+            loaded.save(path)
+            self.assertEqual(CooccurrenceMatrices.load(path).cooccurring_tracks(11), [(10, 2), (13, 1)])
+
+    def test_merge_shards(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "cooccurrence")
+            self.matrices.save(path)
+            # shard 0 recrawls set 3, shard 1 finds a new set
+            shards = [[liveset(3, [200], [13, 20])], [liveset(5, [400], [21, 10])]]
+            for shard, livesets in enumerate(shards):
+                matrices = CooccurrenceMatrices()
+                matrices.update(livesets)
+                matrices.save(shard_path(path, shard))
+
+            supervisor = ShardSupervisor(2, os.path.join(tmpdir, "shards"), crawl_settings=Settings({"COOCCURRENCE_DIR": path}))
+            self.assertEqual(supervisor.merge_outputs(), {"cooccurrence/merged": 2, "cooccurrence/sets": 5})
+            self.assertEqual(shard_outputs(path), [])
+
+            merged = CooccurrenceMatrices.load(path)
+            self.assertEqual(merged.cooccurring_tracks(10), [(11, 2), (12, 1), (21, 1)])
+            self.assertEqual(merged.cooccurring_tracks(13), [(20, 1)])
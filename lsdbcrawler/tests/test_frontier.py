@@ -0,0 +1,173 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from scrapy.exceptions import NotConfigured
+from scrapy.http import HtmlResponse, Request
+from scrapy.utils.test import get_crawler
+
+from lsdbcrawler import signals as lsdb_signals
+from lsdbcrawler.frontier import MemoryFrontierStore, MongoFrontierStore, SharedDupeFilter
+from lsdbcrawler.middlewares import FrontierMiddleware
+from lsdbcrawler.scheduler import SharedScheduler
+from lsdbcrawler.spiders.liveset_spider import LivesetSpider
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestSharedScheduler(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.store = MemoryFrontierStore(clock=self.clock)
+        crawler = get_crawler(LivesetSpider)
+        self.spider = crawler._create_spider()
+        self.nodes = [self.node(crawler, name) for name in ("a", "b")]
+
+    def node(self, crawler, name):
+        dupefilter = SharedDupeFilter(self.store, crawler.request_fingerprinter)
+        scheduler = SharedScheduler(
+            self.store, dupefilter, crawler.request_fingerprinter, name, 60
+        )
+        scheduler.spider = self.spider
+        return scheduler
+
+    def test_requests_are_claimed_once(self):
+        a, b = self.nodes
+        self.assertTrue(a.enqueue_request(Request("https://lsdb.eu/set/1")))
+        self.assertTrue(b.enqueue_request(Request("https://lsdb.eu/set/2", priority=5)))
+        # duplicates are filtered across nodes
+        self.assertFalse(b.enqueue_request(Request("https://lsdb.eu/set/1")))
+
+        first = a.next_request()
+        second = b.next_request()
+        self.assertEqual(first.url, "https://lsdb.eu/set/2")
+        self.assertEqual(second.url, "https://lsdb.eu/set/1")
+        self.assertIsNone(a.next_request())
+        self.assertTrue(a.has_pending_requests())
+
+        a.request_done(first, self.spider)
+        b.request_done(second, self.spider)
+        self.assertFalse(a.has_pending_requests())
+        self.assertEqual(a.counts["completed"], 1)
+
+    def test_expired_lease_is_reclaimed(self):
+        a, b = self.nodes
+        a.enqueue_request(Request("https://lsdb.eu/set/1"))
+        request = a.next_request()
+        self.assertIsNone(b.next_request())
+
+        # node a stops renewing its lease
+        self.clock.now += 61
+        reclaimed = b.next_request()
+        self.assertEqual(reclaimed.url, request.url)
+        self.assertEqual(b.counts["reclaimed"], 1)
+
+        # the late completion of node a doesn't remove b's lease
+        a.request_done(request, self.spider)
+        self.assertTrue(b.has_pending_requests())
+        b.request_done(reclaimed, self.spider)
+        self.assertFalse(b.has_pending_requests())
+
+    def test_second_crawl_starts_unfiltered(self):
+        a, b = self.nodes
+        a.open(self.spider)
+        a.enqueue_request(Request("https://lsdb.eu/set/1"))
+        # b joins the running crawl and shares its fingerprints
+        b.open(self.spider)
+        self.assertFalse(b.enqueue_request(Request("https://lsdb.eu/set/1")))
+        a.request_done(a.next_request(), self.spider)
+        a.close("finished")
+        b.close("finished")
+
+        self.clock.now += 1
+        a.open(self.spider)
+        self.assertTrue(a.enqueue_request(Request("https://lsdb.eu/set/1")))
+        a.close("shutdown")
+
+    def test_release_on_close(self):
+        a, b = self.nodes
+        a.enqueue_request(Request("https://lsdb.eu/set/1", dont_filter=True))
+        a.next_request()
+        self.assertEqual(self.store.release("a"), 1)
+        self.assertEqual(b.next_request().url, "https://lsdb.eu/set/1")
+
+    def test_retry_replaces_claimed_request(self):
+        a, b = self.nodes
+        a.enqueue_request(Request("https://lsdb.eu/set/1"))
+        request = a.next_request()
+
+        retry = request.replace(dont_filter=True)
+        self.assertTrue(a.enqueue_request(retry))
+        self.assertEqual(a.counts["completed"], 1)
+        claimed = b.next_request()
+        self.assertEqual(claimed.url, "https://lsdb.eu/set/1")
+        self.assertNotEqual(claimed.meta["frontier_key"], request.meta["frontier_key"])
+
+    def test_done_once_spider_output_consumed(self):
+        a, _ = self.nodes
+        crawler = get_crawler(LivesetSpider, {"SCHEDULER": "lsdbcrawler.scheduler.SharedScheduler"})
+        crawler.signals.connect(a.request_done, signal=lsdb_signals.request_done)
+        middleware = FrontierMiddleware.from_crawler(crawler)
+
+        a.enqueue_request(Request("https://lsdb.eu/set/1"))
+        request = a.next_request()
+        response = HtmlResponse(request.url, request=request)
+
+        output = middleware.process_spider_output(response, iter([Request("https://lsdb.eu/set/2")]), self.spider)
+        a.enqueue_request(next(output))
+        # the parent stays leased while its output is consumed
+        self.assertEqual(a.counts["completed"], 0)
+        self.assertEqual(list(output), [])
+        self.assertEqual(a.counts["completed"], 1)
+        self.assertEqual(a.next_request().url, "https://lsdb.eu/set/2")
+
+    def test_middleware_requires_shared_scheduler(self):
+        with self.assertRaises(NotConfigured):
+            FrontierMiddleware.from_crawler(get_crawler(LivesetSpider))
+
+    def test_unserializable_request_kept_locally(self):
+        a, b = self.nodes
+        a.enqueue_request(Request("https://lsdb.eu/set/1"))
+        self.assertTrue(a.enqueue_request(Request("https://lsdb.eu/set/2", callback=lambda response: None)))
+        self.assertEqual(a.counts["unserializable"], 1)
+
+        self.assertEqual(len(a), 2)
+        self.assertEqual(len(b), 1)
+
+        self.assertEqual(a.next_request().url, "https://lsdb.eu/set/2")
+        self.assertEqual(b.next_request().url, "https://lsdb.eu/set/1")
+        self.assertIsNone(b.next_request())
+
+
+class TestMongoFrontierStore(unittest.TestCase):
+    def test_pending_count_reused_while_non_zero(self):
+        clock = Clock()
+        store = MongoFrontierStore("mongodb://localhost", "lsdb", clock=clock)
+        store.requests = MagicMock()
+        store.requests.count_documents.return_value = 1
+
+        self.assertEqual(store.pending(), 1)
+        clock.now += 0.5
+        self.assertEqual(store.pending(), 1)
+        self.assertEqual(store.requests.count_documents.call_count, 1)
+
+        clock.now += 1
+        store.requests.count_documents.return_value = 0
+        self.assertEqual(store.pending(), 0)
+        self.assertEqual(store.pending(), 0)
+        self.assertEqual(store.requests.count_documents.call_count, 3)
+
+    def test_opened_once(self):
+        store = MongoFrontierStore("mongodb://localhost", "lsdb")
+        with patch("pymongo.MongoClient") as client:
+            store.open()
+            store.open()
+        self.assertEqual(client.call_count, 1)
+        store.close()
+        store.close()
+        client.return_value.close.assert_called_once_with()
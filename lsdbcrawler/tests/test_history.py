@@ -0,0 +1,122 @@
+import random
+import unittest
+from unittest.mock import MagicMock
+
+from pymongo.errors import DuplicateKeyError
+
+from lsdbcrawler.history import TracklistHistory, apply_delta, diff_tracks
+
+
+def track(i, name=None):
+    return {"track_id": i, "track_name": name or f"Track {i}", "track_type": "track"}
+
+
+class TestDiffTracks(unittest.TestCase):
+    def test_positional_operations(self):
+        old = [track(1), track(2), track(3), track(4), track(5)]
+        new = [track(1), track(3, "Renamed"), track(4), track(5), track(6)]
+
+        delta = diff_tracks(old, new)
+        self.assertEqual(delta, [
+            ["d", 1, 1],
+            ["r", 2, [{"track_name": "Renamed"}]],
+            ["i", 5, [track(6)]],
+        ])
+        self.assertEqual(apply_delta(old, delta), new)
+        self.assertEqual(diff_tracks(new, new), [])
+
+    def test_insertion_into_legacy_tracklist(self):
+        old = [{"track_index": str(i), "track_name": f"Artist {i} - Title", "track_type": "track"}
+               for i in range(1, 21)]
+        new = old[:5] + [{"track_index": "6", "track_name": "New - Track", "track_type": "track"}] + [
+            dict(t, track_index=str(int(t["track_index"]) + 1)) for t in old[5:]
+        ]
+
+        delta = diff_tracks(old, new)
+        # the renumbered tracks are renames of their index only
+        self.assertEqual(delta[0], ["i", 5, [new[5]]])
+        self.assertEqual(delta[1][2][0], {"track_index": "7"})
+        self.assertEqual(apply_delta(old, delta), new)
+
+    def test_removed_fields(self):
+        old = [dict(track(1), match_confidence=0.9)]
+        new = [track(1)]
+        self.assertEqual(apply_delta(old, diff_tracks(old, new)), new)
+
+    def test_random_edits_round_trip(self):
+        rng = random.Random(7)
+        tracks = [track(i) for i in range(30)]
+        for _ in range(200):
+            edited = [dict(t) for t in tracks]
+            for _ in range(rng.randint(1, 4)):
+                position = rng.randrange(len(edited) + 1)
+                action = rng.choice("dir")
+                if action == "d" and edited:
+                    del edited[min(position, len(edited) - 1)]
+                elif action == "i":
+                    edited.insert(position, track(rng.randrange(1000)))
+                elif edited:
+                    edited[min(position, len(edited) - 1)]["track_name"] = f"Edit {rng.random()}"
+            self.assertEqual(apply_delta(tracks, diff_tracks(tracks, edited)), edited)
+            tracks = edited
+
+
+class TestTracklistHistory(unittest.TestCase):
+    def setUp(self):
+        self.documents = []
+        collection = MagicMock()
+        collection.insert_many.side_effect = self.documents.extend
+        collection.find_one.side_effect = lambda *args, **kwargs: (
+            max(self.documents, key=lambda d: d["version"]) if self.documents else None
+        )
+        collection.find.side_effect = lambda query, projection: MagicMock(
+            sort=lambda *args: [
+                d for d in self.documents
+                if d["version"] <= query.get("version", {}).get("$lte", float("inf"))
+            ]
+        )
+        self.history = TracklistHistory({"tracklist_history": collection})
+
+    def test_record_and_reconstruct(self):
+        v1 = [track(1), track(2)]
+        v2 = [track(1), track(2, "Renamed"), track(3)]
+
+        # the stored tracklist from before the history was enabled becomes version 0
+        self.assertEqual(self.history.record(7, v1, v1), 0)
+        self.assertEqual(self.history.record(7, v1, v1), None)
+        self.assertEqual(self.history.record(7, v1, v2), 1)
+
+        self.assertEqual([d["version"] for d in self.documents], [0, 1])
+        self.assertEqual(self.history.reconstruct(7, 0), v1)
+        self.assertEqual(self.history.reconstruct(7), v2)
+
+    def test_rematched_set_records_no_version(self):
+        legacy = [{"track_index": "1", "track_name": "Sasha - Xpander", "track_type": "track"}]
+        matched = [dict(legacy[0], track_id=5, match_confidence=0.8)]
+        rematched = [dict(legacy[0], track_id=9, match_confidence=0.9)]
+
+        self.assertEqual(self.history.record(7, None, matched), 0)
+        self.assertEqual(self.history.record(7, matched, rematched), None)
+        self.assertEqual(self.history.reconstruct(7), legacy)
+
+        edited = [dict(rematched[0], track_name="Sasha - Xpander (Remix)")]
+        self.assertEqual(self.history.record(7, rematched, edited), 1)
+        self.assertEqual(self.documents[-1]["delta"], [["r", 0, [{"track_name": "Sasha - Xpander (Remix)"}]]])
+
+    def test_concurrent_version_is_rediffed(self):
+        v1 = [track(1)]
+        v2 = [track(1), track(2)]
+        self.history.record(7, None, v1)
+
+        # another node records v2 between our last_version and insert
+        insert = self.history.collection.insert_many.side_effect
+
+        def concurrent_insert(documents):
+            self.history.collection.insert_many.side_effect = insert
+            self.documents.append(self.history.document(7, 1, diff_tracks(v1, v2)))
+            raise DuplicateKeyError("E11000")
+
+        self.history.collection.insert_many.side_effect = concurrent_insert
+        self.assertEqual(self.history.record(7, v1, v2 + [track(3)]), 2)
+        self.assertEqual(self.documents[-1]["delta"], [["i", 2, [track(3)]]])
+        self.assertEqual(self.history.reconstruct(7), v2 + [track(3)])
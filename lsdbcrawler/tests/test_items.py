@@ -0,0 +1,48 @@
+import unittest
+
+import scrapy
+from itemadapter import ItemAdapter
+
+from lsdbcrawler.items import BaseItem, CompactArtistItem
+
+
+class TestItems(unittest.TestCase):
+    def test_schema_checked_at_class_creation(self):
+        with self.assertRaises(NotImplementedError):
+
+            class MissingCollectionItem(BaseItem):
+                unique_fields = ["id"]
+                id = scrapy.Field()
+
+        with self.assertRaises(TypeError):
+
+            class WrongUniqueFieldsItem(BaseItem):
+                collection = "wrong"
+                unique_fields = "id"
+                id = scrapy.Field()
+
+    def test_subclass_hooks_of_other_bases_run(self):
+        class Registered(object):
+            registered = []
+
+            def __init_subclass__(cls, **kwargs):
+                super().__init_subclass__(**kwargs)
+                cls.registered.append(cls.__name__)
+
+        class RegisteredItem(BaseItem, Registered):
+            collection = "registered"
+            unique_fields = ["id"]
+            id = scrapy.Field()
+
+        self.assertEqual(Registered.registered, ["RegisteredItem"])
+
+    def test_compact_item(self):
+        item = CompactArtistItem()
+        item["artist_id"] = 1
+        item["name"] = "Artist"
+
+        self.assertFalse(hasattr(item, "__dict__"))
+        self.assertEqual(item.collection, "artist")
+        self.assertEqual(ItemAdapter(item).asdict(), {"artist_id": 1, "name": "Artist"})
+        with self.assertRaises(KeyError):
+            item["unknown"] = 1
@@ -1,8 +1,9 @@
 import os
 import pytest
+import tempfile
 import unittest
 from scrapy.settings import Settings
-from scrapy.http import HtmlResponse
+from scrapy.http import HtmlResponse, Request
 from lsdbcrawler.spiders.liveset_spider import LivesetSpider
 
 from unittest.mock import MagicMock, patch
@@ -45,6 +46,68 @@ class TestLivesetSpider(unittest.TestCase):
         requests = list(generator)
         self.assertEqual(len(requests), 1)
 
+    def _download_response(self, status=200, headers=None, body=b"", method="GET"):
+        request = Request(
+            "https://lsdb.eu/listen/go/42",
+            method=method,
+            meta={"liveset_set_id": 7},
+        )
+        return HtmlResponse(
+            url=request.url,
+            status=status,
+            headers=headers,
+            body=body,
+            encoding="utf-8",
+            request=request,
+        )
+
+    def test_parse_download_link_from_location(self):
+        response = self._download_response(
+            status=302, headers={"Location": "https://example.com/set.mp3"}
+        )
+        items = list(self.spider.parse_download_link(response))
+        self.assertEqual(len(items), 1)
+        self.assertEqual(items[0]["download_link_id"], 42)
+        self.assertEqual(items[0]["liveset_set_id"], 7)
+        self.assertEqual(items[0]["download_url"], "https://example.com/set.mp3")
+
+    def test_parse_download_link_from_body(self):
+        response = self._download_response(
+            body=b"<html><body><div><a href='https://example.com/set.mp3'>x</a></div></body></html>"
+        )
+        items = list(self.spider.parse_download_link(response))
+        self.assertEqual(items[0]["download_url"], "https://example.com/set.mp3")
+
+    def test_parse_download_link_head_fallback(self):
+        response = self._download_response(method="HEAD")
+        requests = list(self.spider.parse_download_link(response))
+        self.assertEqual(len(requests), 1)
+        self.assertEqual(requests[0].method, "GET")
+        self.assertEqual(requests[0].meta["liveset_set_id"], 7)
+
 
+    def test_user_request_skips_cached_user(self):
+        self.spider.user_cache = {"/user/cached"}
+        self.assertEqual(list(self.spider.user_request("https://lsdb.eu/user/cached")), [])
+
+        requests = list(self.spider.user_request("https://lsdb.eu/user/other"))
+        self.assertEqual(len(requests), 1)
+        self.assertEqual(requests[0].meta["user_cache_key"], "/user/other")
 
+    def test_shard_start_url_resumes_from_checkpoint(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            spider = LivesetSpider(shard="1", shards="3", checkpoint=os.path.join(tmpdir, "shard.json"))
+            self.assertEqual(
+                spider.shard_start_url("https://lsdb.eu/livesets?page=1"),
+                "https://lsdb.eu/livesets?page=2",
+            )
 
+            spider.write_checkpoint(HtmlResponse(url="https://lsdb.eu/livesets?page=11"))
+            self.assertEqual(
+                spider.shard_start_url("https://lsdb.eu/livesets?page=1"),
+                "https://lsdb.eu/livesets?page=8",
+            )
+            self.assertEqual(
+                spider.shard_next_page_url(HtmlResponse(url="https://lsdb.eu/livesets?page=8")),
+                "https://lsdb.eu/livesets?page=11",
+            )
@@ -0,0 +1,77 @@
+import io
+import logging
+import time
+import unittest
+
+from lsdbcrawler.logs import BackgroundLogging, RateLimitFilter
+from lsdbcrawler.processors import to_int, parse_anomalies
+
+
+class TestLogs(unittest.TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger("lsdbcrawler.tests.logs")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+        self.stream = io.StringIO()
+        self.handler = logging.StreamHandler(self.stream)
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+
+    def test_rate_limit(self):
+        rate_limit = RateLimitFilter(limit=2, interval=60)
+        self.handler.addFilter(rate_limit)
+        for i in range(5):
+            self.logger.info("Adding liveset to queue: %s", i)
+        self.logger.warning("never limited")
+
+        lines = self.stream.getvalue().splitlines()
+        self.assertEqual(lines, ["Adding liveset to queue: 0", "Adding liveset to queue: 1", "never limited"])
+        self.assertEqual(rate_limit.suppressed, 3)
+        self.assertEqual(rate_limit.pending()[0][2], 3)
+
+    def test_rate_limit_drops_expired_windows(self):
+        rate_limit = RateLimitFilter(limit=1, interval=60)
+        self.handler.addFilter(rate_limit)
+        for i in range(3):
+            self.logger.info(f"Set {i} not found")
+        self.logger.info("Adding liveset to queue: %s", 1)
+        self.logger.info("Adding liveset to queue: %s", 2)
+        self.assertEqual(len(rate_limit.windows), 4)
+
+        rate_limit.evict(time.monotonic() + 60)
+        self.assertEqual(rate_limit.windows, {})
+        self.assertEqual(rate_limit.pending(), [("lsdbcrawler.tests.logs", "Adding liveset to queue: %s", 1)])
+
+        # the suppressed records are reported with the next record let through
+        self.logger.info("Adding liveset to queue: %s", 3)
+        self.assertTrue(self.stream.getvalue().endswith("Adding liveset to queue: 3 [1 similar messages suppressed]\n"))
+        self.assertEqual(rate_limit.pending(), [])
+
+    def test_background_logging(self):
+        background = BackgroundLogging(logger=self.logger)
+        background.start()
+        self.assertNotIn(self.handler, self.logger.handlers)
+
+        args = {"set_id": 1}
+        self.logger.info("item %s", args)
+        # later changes to the arguments do not change the message
+        args["set_id"] = 2
+        background.stop()
+
+        self.assertIn(self.handler, self.logger.handlers)
+        self.assertEqual(self.stream.getvalue(), "item {'set_id': 1}\n")
+
+
+class TestToInt(unittest.TestCase):
+    def test_failures_counted_per_call_site(self):
+        parse_anomalies.clear()
+        with self.assertLogs("lsdbcrawler.processors", level="DEBUG") as logs:
+            for _ in range(3):
+                self.assertEqual(to_int("x", fallback=-1), -1)
+
+        self.assertEqual(list(parse_anomalies.values()), [3])
+        self.assertTrue(next(iter(parse_anomalies)).startswith("lsdbcrawler.tests.test_logs:"))
+        self.assertEqual(len([r for r in logs.records if r.levelno == logging.ERROR]), 1)
+        parse_anomalies.clear()
@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from scrapy.settings import Settings
+from scrapy.statscollectors import MemoryStatsCollector
+
+from lsdbcrawler.items import LivesetItem, TrackItem
+from lsdbcrawler.matching import TrackIndex, normalize
+from lsdbcrawler.pipelines import TrackMatchPipeline
+
+
+class TestTrackIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = TrackIndex()
+        self.index.add(1, "Underworld - Born Slippy (Nuxx)")
+        self.index.add(2, "Sasha - Xpander")
+        self.index.add(3, "Orbital - Halcyon On + On")
+
+    def test_normalize(self):
+        self.assertEqual(normalize("Röyksopp - Eple (Original Mix)"), "royksopp eple original mix")
+
+    def test_match(self):
+        track_id, confidence = self.index.match("underworld - born slippy .nuxx")
+        self.assertEqual(track_id, 1)
+        self.assertGreater(confidence, 0.9)
+        self.assertEqual(self.index.match("SASHA – Xpander!")[0], 2)
+        self.assertIsNone(self.index.match("Leftfield - Open Up"))
+
+    def test_persisted_and_reloaded(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "tracks.tsv")
+            index = TrackIndex(path)
+            index.open()
+            self.assertTrue(index.add(2, "Sasha - Xpander"))
+            self.assertFalse(index.add(2, "Sasha - Xpander"))
+            index.close()
+
+            index = TrackIndex(path)
+            index.open()
+            index.close()
+            self.assertEqual(len(index), 1)
+            self.assertEqual(index.match("Sasha - Xpander")[0], 2)
+
+
+class TestTrackMatchPipeline(unittest.TestCase):
+    def test_annotates_legacy_tracklist(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            settings = Settings({"TRACK_MATCH_INDEX": os.path.join(tmpdir, "tracks.tsv")})
+            stats = MemoryStatsCollector(MagicMock())
+            pipeline = TrackMatchPipeline(settings, stats)
+            spider = MagicMock()
+            pipeline.open_spider(spider)
+
+            pipeline.process_item(TrackItem(track_id=2, track_name="Sasha - Xpander"), spider)
+            liveset = LivesetItem(set_id=1, tracklist={"type": "old", "tracks": [
+                {"track_index": "1", "track_name": "Sasha - Xpander", "track_type": "track"},
+                {"track_index": "2", "track_name": "ID - ID", "track_type": "ID"},
+                {"track_index": "3", "track_name": "Unknown - Song", "track_type": "track"},
+            ]})
+            pipeline.process_item(liveset, spider)
+            pipeline.close_spider(spider)
+
+            tracks = liveset["tracklist"]["tracks"]
+            self.assertEqual(tracks[0]["track_id"], 2)
+            self.assertEqual(tracks[0]["match_confidence"], 1.0)
+            self.assertNotIn("track_id", tracks[1])
+            self.assertNotIn("track_id", tracks[2])
+            self.assertEqual(stats.get_value("track_match/unmatched"), 1)
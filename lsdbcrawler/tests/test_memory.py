@@ -0,0 +1,34 @@
+import tracemalloc
+import unittest
+
+from scrapy.http import Request
+
+from lsdbcrawler.memory import FunctionIndex, attribute_snapshot, deep_sizeof, live_objects
+from lsdbcrawler.utils import callback_name
+
+
+class TestMemory(unittest.TestCase):
+    def test_deep_sizeof_counts_nested_values(self):
+        self.assertGreater(deep_sizeof({"a": [1, 2, "x" * 1000]}), 1000)
+
+    def test_live_objects_meta_per_callback(self):
+        requests = [Request("https://lsdb.eu/set/1", meta={"liveset_set_id": 1})]
+        types, meta = live_objects(requests)
+        self.assertEqual(types[0][0], "Request")
+        self.assertEqual(meta[0][:2], ("parse", 1))
+
+    def test_attribute_snapshot_to_function(self):
+        # e.g. PYTHONTRACEMALLOC or the memory profiler may trace already
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start(10)
+        try:
+            retained = [callback_name(Request(f"https://lsdb.eu/{i}")) for i in range(100)]
+            snapshot = tracemalloc.take_snapshot()
+        finally:
+            if started:
+                tracemalloc.stop()
+
+        owners = dict(attribute_snapshot(snapshot, FunctionIndex(), top=50))
+        self.assertIn("tests.test_memory.test_attribute_snapshot_to_function", owners)
+        self.assertTrue(retained)
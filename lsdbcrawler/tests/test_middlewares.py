@@ -0,0 +1,176 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from scrapy.http import HtmlResponse, Request
+from scrapy.utils.test import get_crawler
+
+from lsdbcrawler.middlewares import (
+    AdaptiveThrottleMiddleware,
+    CallbackPriorityMiddleware,
+    TracingMiddleware,
+)
+from lsdbcrawler.items import LivesetItem
+from lsdbcrawler.spiders.liveset_spider import LivesetSpider
+
+
+class TestCallbackPriorityMiddleware(unittest.TestCase):
+    def setUp(self):
+        self.crawler = get_crawler(
+            LivesetSpider,
+            {
+                "PRIORITY_ENABLED": True,
+                "CALLBACK_PRIORITIES": {"parse_liveset": 10, "parse_user": 1},
+            },
+        )
+        self.spider = self.crawler._create_spider()
+        self.crawler.stats.open_spider(self.spider)
+        self.middleware = CallbackPriorityMiddleware.from_crawler(self.crawler)
+
+    def _response(self, callback, priority=0):
+        request = Request("https://lsdb.eu/set/1", callback=callback, priority=priority)
+        return HtmlResponse(url=request.url, body=b"", request=request)
+
+    def test_priority_by_callback(self):
+        response = self._response(self.spider.parse_livesets_index)
+        result = [Request("https://lsdb.eu/set/1", callback=self.spider.parse_liveset)]
+        output = list(self.middleware.process_spider_output(response, result, self.spider))
+        self.assertEqual(output[0].priority, 10)
+
+    def test_children_scheduled_above_parent(self):
+        response = self._response(self.spider.parse_liveset, priority=10)
+        result = [
+            Request("https://lsdb.eu/user/a", callback=self.spider.parse_user),
+            Request("https://lsdb.eu/set/1?page=2", callback=self.spider.parse_comments),
+        ]
+        output = list(self.middleware.process_spider_output(response, result, self.spider))
+        self.assertEqual([r.priority for r in output], [11, 11])
+
+    def test_same_callback_keeps_parent_priority(self):
+        response = self._response(self.spider.parse_comments, priority=11)
+        result = [Request("https://lsdb.eu/set/1?page=3", callback=self.spider.parse_comments)]
+        output = list(self.middleware.process_spider_output(response, result, self.spider))
+        self.assertEqual(output[0].priority, 11)
+
+    def test_time_to_first_set(self):
+        response = self._response(self.spider.parse_liveset)
+        item = LivesetItem(set_id=1)
+        list(self.middleware.process_spider_output(response, [item], self.spider))
+        self.assertIsNotNone(
+            self.crawler.stats.get_value("priority/time_to_first_set")
+        )
+
+
+class TestTracingMiddleware(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "traces.jsonl")
+        crawler = get_crawler(
+            LivesetSpider, {"TRACE_ENABLED": True, "TRACE_FILE": self.path}
+        )
+        self.spider = crawler._create_spider()
+        self.middleware = TracingMiddleware.from_crawler(crawler)
+        self.middleware.spider_opened(self.spider)
+
+    def tearDown(self):
+        self.middleware.spider_closed(self.spider)
+        self.tmpdir.cleanup()
+
+    def test_trace_propagates_to_children_and_items(self):
+        index = Request("https://lsdb.eu/livesets", callback=self.spider.parse_livesets_index)
+        response = HtmlResponse(url=index.url, body=b"", request=index)
+        liveset = Request("https://lsdb.eu/set/1", callback=self.spider.parse_liveset)
+        output = list(self.middleware.process_spider_output(response, [liveset], self.spider))
+        trace_id = output[0].meta["trace_id"]
+
+        response = HtmlResponse(url=liveset.url, body=b"", request=liveset)
+        user = Request("https://lsdb.eu/user/a", callback=self.spider.parse_user)
+        item = LivesetItem(set_id=1)
+        output = list(
+            self.middleware.process_spider_output(response, [user, item], self.spider)
+        )
+        self.assertEqual(output[0].meta["trace_id"], trace_id)
+
+        self.middleware.callback_parsed(request=liveset, callback="parse_liveset", seconds=0.1)
+        self.middleware.item_done(item, self.spider)
+        self.middleware.spider_closed(self.spider)
+
+        with open(self.path, encoding="utf-8") as f:
+            spans = [json.loads(line) for line in f]
+        self.assertEqual([span["stage"] for span in spans], ["parse", "pipeline"])
+        self.assertTrue(all(span["trace_id"] == trace_id for span in spans))
+        self.assertEqual(spans[1]["name"], "liveset")
+
+    def test_pending_items_are_bounded(self):
+        self.middleware.max_pending_items = 2
+        liveset = self.middleware.trace_request(
+            Request("https://lsdb.eu/set/1", callback=self.spider.parse_liveset), parent=None
+        )
+        response = HtmlResponse(url=liveset.url, body=b"", request=liveset)
+        items = [LivesetItem(set_id=i) for i in range(3)]
+        list(self.middleware.process_spider_output(response, items, self.spider))
+        self.assertEqual([entry[0] for entry in self.middleware.pending_items.values()], items[1:])
+
+        # an equal item that wasn't traced doesn't end the span of a traced one
+        self.middleware.item_done(LivesetItem(set_id=1), self.spider)
+        self.assertEqual(len(self.middleware.pending_items), 2)
+        self.middleware.item_done(items[1], self.spider)
+        self.assertEqual(len(self.middleware.pending_items), 1)
+        self.middleware.spider_closed(self.spider)
+        self.assertEqual(len(self.middleware.pending_items), 0)
+
+
+class TestAdaptiveThrottleMiddleware(unittest.TestCase):
+    def setUp(self):
+        crawler = get_crawler(
+            LivesetSpider,
+            {
+                "ADAPTIVE_THROTTLE_ENABLED": True,
+                "ADAPTIVE_THROTTLE_WINDOW": 4,
+                "ADAPTIVE_THROTTLE_BAN_MARKERS": ["temporarily banned"],
+            },
+        )
+        self.slot = MagicMock(concurrency=8)
+        crawler.engine = MagicMock()
+        crawler.engine.downloader.slots = {"lsdb.eu": self.slot}
+        self.spider = crawler._create_spider()
+        self.stats = crawler.stats
+        self.middleware = AdaptiveThrottleMiddleware.from_crawler(crawler)
+
+    def response(self, status=200, body=b"", meta=None):
+        request = Request("https://lsdb.eu/set/1", meta=dict(meta or {}, download_slot="lsdb.eu"))
+        request.meta["download_latency"] = 0.1
+        return HtmlResponse(url=request.url, status=status, body=body, request=request)
+
+    def test_errors_and_ban_pages_decrease_concurrency(self):
+        request = self.response().request
+        self.middleware.process_request(request, self.spider)
+        self.assertEqual(self.slot.concurrency, 2)
+
+        responses = [
+            self.response(),
+            self.response(status=503),
+            self.response(body=b"<html>You are temporarily banned</html>"),
+        ]
+        for response in responses:
+            self.middleware.process_response(response.request, response, self.spider)
+        self.middleware.process_exception(request, ConnectionResetError(), self.spider)
+
+        self.assertEqual(self.slot.concurrency, 1)
+        self.assertEqual(self.stats.get_value("throttle/lsdb.eu/errors"), 3)
+        self.assertEqual(self.stats.get_value("throttle/lsdb.eu/decreases"), 1)
+
+    def test_handled_status_is_no_error(self):
+        response = self.response(status=503, meta={"handle_httpstatus_list": [503]})
+        self.middleware.process_response(response.request, response, self.spider)
+        response = self.response(status=500)
+        self.middleware.process_response(response.request, response, self.spider)
+        self.assertIsNone(self.stats.get_value("throttle/lsdb.eu/errors"))
+
+    def test_replaces_autothrottle(self):
+        settings = {"AUTOTHROTTLE_ENABLED": True, "ADAPTIVE_THROTTLE_ENABLED": True}
+        self.assertFalse(get_crawler(LivesetSpider, settings).settings.getbool("AUTOTHROTTLE_ENABLED"))
+        settings["ADAPTIVE_THROTTLE_ENABLED"] = False
+        self.assertTrue(get_crawler(LivesetSpider, settings).settings.getbool("AUTOTHROTTLE_ENABLED"))
@@ -0,0 +1,141 @@
+import glob
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+import pymongo
+from scrapy.settings import Settings
+from scrapy.statscollectors import MemoryStatsCollector
+
+from lsdbcrawler.exports import JsonLinesPart, ParquetPart, compact
+from lsdbcrawler.items import CompactTrackItem, LivesetVotesItem, TrackItem
+from lsdbcrawler.pipelines import ExportPipeline, MongoPipeline
+
+
+class TestMongoPipelineVotes(unittest.TestCase):
+    def setUp(self):
+        settings = Settings(
+            {"MONGODB_URI": "mongodb://localhost:27017", "MONGODB_DATABASE": "test"}
+        )
+        self.stats = MemoryStatsCollector(MagicMock())
+        self.pipeline = MongoPipeline(settings, self.stats)
+        self.collections = {"rating": MagicMock(), "favorite": MagicMock()}
+        self.pipeline.database = self.collections
+        self.spider = MagicMock()
+
+    def test_votes_only_write_differences(self):
+        self.collections["rating"].find.return_value = [
+            {"liveset_set_id": 1, "user_name": "same", "rating": 5},
+            {"liveset_set_id": 1, "user_name": "changed", "rating": 1},
+            {"liveset_set_id": 1, "user_name": "withdrawn", "rating": 3},
+        ]
+        self.collections["favorite"].find.return_value = [
+            {"liveset_set_id": 1, "user_name": "fan"},
+        ]
+
+        item = LivesetVotesItem(
+            liveset_set_id=1,
+            ratings=[
+                {"liveset_set_id": 1, "user_name": "same", "rating": 5},
+                {"liveset_set_id": 1, "user_name": "changed", "rating": 2},
+                {"liveset_set_id": 1, "user_name": "new", "rating": 4},
+            ],
+            favorites=[{"liveset_set_id": 1, "user_name": "fan"}],
+        )
+        self.pipeline.process_item(item, self.spider)
+
+        operations = self.collections["rating"].bulk_write.call_args[0][0]
+        self.assertEqual(
+            [type(op) for op in operations],
+            [pymongo.UpdateOne, pymongo.UpdateOne, pymongo.DeleteOne],
+        )
+        self.collections["favorite"].bulk_write.assert_not_called()
+        self.assertEqual(self.stats.get_value("votes/rating/upserted"), 2)
+        self.assertEqual(self.stats.get_value("votes/rating/deleted"), 1)
+        self.assertEqual(self.stats.get_value("votes/favorite/unchanged"), 1)
+
+
+class TestExportPipeline(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.stats = MemoryStatsCollector(MagicMock())
+        self.spider = MagicMock()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def pipeline(self, **settings):
+        settings = Settings(dict(
+            {"EXPORT_DIR": self.tmpdir.name, "EXPORT_BUFFER_SIZE": 2, "EXPORT_COMPACT": True},
+            **settings,
+        ))
+        return ExportPipeline(settings, self.stats)
+
+    def export_tracks(self, pipeline):
+        pipeline.process_item(TrackItem(track_id=1, track_name="old name"), self.spider)
+        pipeline.process_item(TrackItem(track_id=2), self.spider)
+        pipeline.process_item(CompactTrackItem(track_id=1, track_name="new name"), self.spider)
+        pipeline.close_spider(self.spider)
+
+    def test_jsonl_rotates_and_compacts(self):
+        pipeline = self.pipeline(EXPORT_ROTATE_BYTES=1)
+        self.export_tracks(pipeline)
+
+        self.assertEqual(self.stats.get_value("export/track/parts"), 2)
+        self.assertEqual(self.stats.get_value("export/track/duplicates"), 1)
+        directory = os.path.join(self.tmpdir.name, "track")
+        self.assertEqual(os.listdir(directory), ["compacted.jsonl.gz"])
+        rows = list(JsonLinesPart.read(os.path.join(directory, "compacted.jsonl.gz")))
+        # in the order of the last rows
+        self.assertEqual(
+            rows,
+            [{"track_id": 2, "track_name": None}, {"track_id": 1, "track_name": "new name"}],
+        )
+
+    def test_parquet_rotates_on_schema_change(self):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            self.skipTest("pyarrow is not installed")
+
+        pipeline = self.pipeline(EXPORT_FORMAT="parquet", EXPORT_COMPACT=False)
+        pipeline.process_item(TrackItem(track_id=1), self.spider)
+        pipeline.process_item(TrackItem(track_id=2), self.spider)
+        pipeline.process_item(TrackItem(track_id=3, track_name="name"), self.spider)
+        pipeline.close_spider(self.spider)
+
+        # the names of the first batch are all null and can't hold strings
+        parts = sorted(glob.glob(os.path.join(self.tmpdir.name, "track", "*.parquet")))
+        self.assertEqual(len(parts), 2)
+        rows = [row for path in parts for row in ParquetPart.read(path)]
+        self.assertEqual([row["track_name"] for row in rows], [None, None, "name"])
+
+    def test_parquet_compacts_in_write_order(self):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            self.skipTest("pyarrow is not installed")
+
+        directory = os.path.join(self.tmpdir.name, "track")
+        os.makedirs(directory)
+        # part names of different processes don't sort by write time, and the
+        # names of the last part are all null
+        parts = {
+            "part-2": [{"track_id": 1, "track_name": "old name"}],
+            "part-1": [{"track_id": 1, "track_name": "new name"}, {"track_id": 2, "track_name": None}],
+            "part-0": [{"track_id": 3, "track_name": None}],
+        }
+        for written, (name, rows) in enumerate(parts.items()):
+            part = ParquetPart(os.path.join(directory, name + ParquetPart.extension))
+            part.write(rows)
+            part.close()
+            os.utime(part.path, ns=(written * 10 ** 9, written * 10 ** 9))
+
+        self.assertEqual(compact(directory, ["track_id"], ParquetPart, batch_size=2), (3, 1))
+        compacted = pq.ParquetFile(os.path.join(directory, "compacted.parquet"))
+        self.assertEqual(compacted.num_row_groups, 2)
+        self.assertEqual(
+            [(row["track_id"], row["track_name"]) for row in compacted.read().to_pylist()],
+            [(1, "new name"), (2, None), (3, None)],
+        )
@@ -0,0 +1,77 @@
+import unittest
+
+from scrapy.http import Request
+from scrapy.utils.test import get_crawler
+
+from lsdbcrawler.scheduler import CallbackScheduler
+from lsdbcrawler.spiders.liveset_spider import LivesetSpider
+
+
+class TestCallbackScheduler(unittest.TestCase):
+    def setUp(self):
+        crawler = get_crawler(
+            LivesetSpider, {"CALLBACK_CONCURRENCY": {"parse_user": 1}, "CALLBACK_MAX_HELD": 2}
+        )
+        self.spider = crawler._create_spider()
+        self.scheduler = CallbackScheduler.from_crawler(crawler)
+        self.scheduler.open(self.spider)
+
+    def tearDown(self):
+        self.scheduler.close("finished")
+
+    def test_caps_callback_concurrency(self):
+        users = [
+            Request(
+                f"https://lsdb.eu/user/{i}", callback=self.spider.parse_user, priority=1
+            )
+            for i in range(2)
+        ]
+        liveset = Request("https://lsdb.eu/set/1", callback=self.spider.parse_liveset)
+        for request in users + [liveset]:
+            self.scheduler.enqueue_request(request)
+
+        first = self.scheduler.next_request()
+        self.assertIn(first, users)
+        self.scheduler.request_reached_downloader(first, self.spider)
+
+        # second user request is held back while the first is in flight
+        self.assertIs(self.scheduler.next_request(), liveset)
+        self.assertIsNone(self.scheduler.next_request())
+        self.assertEqual(len(self.scheduler), 1)
+
+        self.scheduler.request_left_downloader(first, self.spider)
+        second = self.scheduler.next_request()
+        self.assertIn(second, users)
+        self.assertIsNot(second, first)
+        self.assertEqual(len(self.scheduler), 0)
+
+    def user(self, i, priority=1):
+        return Request(f"https://lsdb.eu/user/{i}", callback=self.spider.parse_user, priority=priority)
+
+    def test_held_requests_keep_their_priority(self):
+        first, held = self.user(0, priority=5), self.user(1)
+        self.scheduler.enqueue_request(first)
+        self.scheduler.enqueue_request(held)
+        self.assertIs(self.scheduler.next_request(), first)
+        self.scheduler.request_reached_downloader(first, self.spider)
+        self.assertIsNone(self.scheduler.next_request())
+        self.scheduler.request_left_downloader(first, self.spider)
+
+        liveset = Request("https://lsdb.eu/set/1", callback=self.spider.parse_liveset, priority=10)
+        self.scheduler.enqueue_request(liveset)
+        self.scheduler.enqueue_request(Request("https://lsdb.eu/set/2", callback=self.spider.parse_liveset))
+        self.assertIs(self.scheduler.next_request(), liveset)
+        self.assertIs(self.scheduler.next_request(), held)
+        self.assertEqual(self.scheduler.next_request().url, "https://lsdb.eu/set/2")
+
+    def test_held_requests_are_bounded(self):
+        first = self.user(0, priority=5)
+        self.scheduler.enqueue_request(first)
+        for i in range(1, 5):
+            self.scheduler.enqueue_request(self.user(i))
+        self.assertIs(self.scheduler.next_request(), first)
+        self.scheduler.request_reached_downloader(first, self.spider)
+
+        self.assertIsNone(self.scheduler.next_request())
+        self.assertEqual(self.scheduler.held_count(), 2)
+        self.assertEqual(len(self.scheduler), 4)
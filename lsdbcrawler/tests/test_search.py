@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from scrapy.settings import Settings
+from scrapy.statscollectors import MemoryStatsCollector
+
+from lsdbcrawler.items import CommentItem, CompactArtistItem, GenreItem, LivesetItem, TrackItem
+from lsdbcrawler.pipelines import SearchIndexPipeline
+from lsdbcrawler.search import SearchIndex, entries
+
+
+class TestSearchIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.index = SearchIndex(os.path.join(self.tmpdir.name, "search.db"), batch_size=2)
+        self.index.open()
+
+    def tearDown(self):
+        self.index.close()
+        self.tmpdir.cleanup()
+
+    def test_entries(self):
+        liveset = LivesetItem(set_id=7, description="Live at Fabric", tracklist={"tracks": [
+            {"track_name": "Underworld - Born Slippy"},
+            {"track_name": "Sasha - Xpander"},
+        ]})
+        self.assertEqual(entries(liveset), [
+            ("description", "7", "Live at Fabric"),
+            ("tracklist", "7", "Underworld - Born Slippy\nSasha - Xpander"),
+        ])
+        self.assertEqual(entries(CompactArtistItem(artist_id=3, name="Sasha")), [("artist", "3", "Sasha")])
+        self.assertEqual(entries(GenreItem(genre_id="trance", name="Trance")), [])
+
+    def test_modern_tracklist_names(self):
+        self.index.add_item(TrackItem(track_id=11, track_name="Underworld - Born Slippy"))
+        self.index.add_item(TrackItem(track_id=12, track_name="Sasha - Xpander"))
+        self.index.add_item(TrackItem(track_id=13, track_name="Orbital - Halcyon"))
+        # the linked tracks of modern tracklists have no name
+        self.index.add_item(LivesetItem(set_id=7, description="", tracklist={"type": "modern", "tracks": [
+            {"track_index": 1, "track_id": 11, "track_type": "track"},
+            {"track_index": 1, "track_id": 13, "track_type": "w"},
+            {"track_index": 2, "track_id": 0, "track_name": "ID - ID", "track_type": "ID"},
+        ]}))
+        self.index.flush()
+
+        self.assertEqual(self.index.search("slippy", kinds=["tracklist"])[0][:2], ("tracklist", "7"))
+        self.assertEqual(self.index.search("halcyon", kinds=["tracklist"])[0][:2], ("tracklist", "7"))
+        self.assertEqual(self.index.search("xpander", kinds=["tracklist"]), [])
+
+    def test_search_and_update(self):
+        self.index.add("comment", "1", "Great set, loved the Born Slippy edit")
+        self.index.add("track", "2", "Underworld - Born Slippy (Nuxx)")
+        self.index.add("artist", "3", "Röyksopp")
+        self.index.flush()
+
+        self.assertEqual([key for _, key, _ in self.index.search("born slippy")][:2], ["2", "1"])
+        self.assertEqual(self.index.search("royksopp")[0][:2], ("artist", "3"))
+        self.assertEqual(self.index.search("slip*", kinds=["comment"])[0][2],
+                         "Great set, loved the Born [Slippy] edit")
+
+        # the last text of a batch wins and an empty text deletes the entry
+        self.index.add("track", "2", "Underworld - Rez")
+        self.index.add("track", "2", "Underworld - Cowgirl")
+        self.index.add("comment", "1", "")
+        self.index.flush()
+        self.assertEqual(self.index.search("slippy"), [])
+        self.assertEqual(self.index.search("cowgirl")[0][:2], ("track", "2"))
+        self.assertEqual(len(self.index), 2)
+
+
+class TestSearchIndexPipeline(unittest.TestCase):
+    def test_indexes_items(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            settings = Settings({"SEARCH_INDEX": os.path.join(tmpdir, "search.db")})
+            stats = MemoryStatsCollector(MagicMock())
+            pipeline = SearchIndexPipeline(settings, stats)
+            spider = MagicMock()
+            pipeline.open_spider(spider)
+
+            pipeline.process_item(LivesetItem(set_id=1, description="Essential Mix", tracklist={}), spider)
+            pipeline.process_item(CommentItem(comment_id=5, liveset_set_id=1, text="What a mix"), spider)
+            pipeline.process_item(TrackItem(track_id=2, track_name="Sasha - Xpander"), spider)
+            pipeline.close_spider(spider)
+
+            self.assertEqual(stats.get_value("search_index/entries", spider=spider), 3)
+
+            index = SearchIndex(settings.get("SEARCH_INDEX"))
+            index.open()
+            self.assertEqual(sorted(kind for kind, _, _ in index.search("mix")), ["comment", "description"])
+            index.close()
@@ -0,0 +1,115 @@
+import os
+import tempfile
+import unittest
+
+from scrapy.settings import Settings
+
+from lsdbcrawler.exports import CollectionExport, JsonLinesPart
+from lsdbcrawler.search import SearchIndex
+from lsdbcrawler.shards import Shard, ShardSupervisor, merge_stats, shard_outputs, shard_path, shard_paths
+
+
+class TestMergeStats(unittest.TestCase):
+    def test_merge_stats(self):
+        merged = merge_stats([
+            {
+                "item_scraped_count": 3,
+                "memusage/max": 100,
+                "start_time": "2024-01-01 10:00:00",
+                "finish_time": "2024-01-01 11:00:00",
+                "finish_reason": "finished",
+            },
+            {
+                "item_scraped_count": 4,
+                "memusage/max": 300,
+                "start_time": "2024-01-01 09:00:00",
+                "finish_time": "2024-01-01 10:30:00",
+                "finish_reason": "finished",
+            },
+        ])
+
+        self.assertEqual(merged["item_scraped_count"], 7)
+        self.assertEqual(merged["memusage/max"], 300)
+        self.assertEqual(merged["start_time"], "2024-01-01 09:00:00")
+        self.assertEqual(merged["finish_time"], "2024-01-01 11:00:00")
+        self.assertEqual(merged["finish_reason"], {"finished": 2})
+
+
+class TestShard(unittest.TestCase):
+    def test_command(self):
+        command = Shard(1, 4, "shards", ["restart=1"], ["LOG_LEVEL=INFO"]).command()
+
+        self.assertIn("shard=1", command)
+        self.assertIn("shards=4", command)
+        self.assertIn("checkpoint=shards/shard-1.checkpoint.json", command)
+        self.assertIn("STATS_FILE=shards/shard-1.stats.json", command)
+        self.assertEqual(command[-6:-2], ["-a", "restart=1", "-s", "LOG_LEVEL=INFO"])
+
+    def test_per_shard_paths(self):
+        settings = Settings({
+            "USER_CACHE": "cache/users.tsv",
+            "MEMPROF_DIR": "memprof/",
+            "SEARCH_INDEX": "search.db",
+            "COOCCURRENCE_DIR": None,
+        })
+        command = Shard(1, 4, "shards", [], ["SEARCH_INDEX=ignored.db"], paths=shard_paths(settings, 1)).command()
+
+        self.assertIn("MEMPROF_DIR=memprof.shard-1", command)
+        self.assertIn("SEARCH_INDEX=search.shard-1.db", command)
+        self.assertFalse(any(arg.startswith("COOCCURRENCE_DIR=") for arg in command))
+        # flock safe and append-only stores are shared by all shards
+        self.assertFalse(any(arg.startswith("USER_CACHE=") for arg in command))
+        # the per shard settings come after, and override, the passed ones
+        self.assertGreater(command.index("SEARCH_INDEX=search.shard-1.db"), command.index("SEARCH_INDEX=ignored.db"))
+        self.assertEqual(command[-2:], ["-s", "EXPORT_COMPACT=False"])
+
+
+class TestShardSupervisor(unittest.TestCase):
+    def test_compacts_exports_of_all_shards(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            settings = Settings({"EXPORT_DIR": tmpdir, "EXPORT_COMPACT": True})
+            for shard in range(2):
+                export = CollectionExport(tmpdir, "track", ["track_id"], JsonLinesPart)
+                # shards have different pids, keep the part names apart
+                export.parts = shard
+                export.add({"track_id": 1, "track_name": f"Name {shard}"})
+                export.add({"track_id": shard + 2, "track_name": "Other"})
+                export.close()
+
+            supervisor = ShardSupervisor(2, os.path.join(tmpdir, "shards"), crawl_settings=settings)
+            self.assertEqual(supervisor.compact_exports(), {
+                "export/track/compacted": 3, "export/track/duplicates": 1,
+            })
+            self.assertEqual(os.listdir(os.path.join(tmpdir, "track")), ["compacted.jsonl.gz"])
+
+    def test_merges_search_indexes_of_all_shards(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "search.db")
+            index = SearchIndex(path)
+            index.open()
+            index.add("description", "1", "Old description")
+            index.add("description", "2", "Removed description")
+            index.close()
+
+            shard_entries = [
+                [("description", "1", "New description"), ("description", "2", "")],
+                [("comment", "5", "Great mix")],
+            ]
+            for shard, entries in enumerate(shard_entries):
+                index = SearchIndex(shard_path(path, shard))
+                index.open()
+                for entry in entries:
+                    index.add(*entry)
+                index.close()
+
+            supervisor = ShardSupervisor(2, os.path.join(tmpdir, "shards"), crawl_settings=Settings({"SEARCH_INDEX": path}))
+            self.assertEqual(supervisor.merge_outputs(), {"search_index/merged": 2, "search_index/entries": 2})
+            self.assertEqual(shard_outputs(path), [])
+
+            index = SearchIndex(path)
+            index.open()
+            self.assertEqual([key for _, key, _ in index.search("description")], ["1"])
+            self.assertEqual(index.search("old"), [])
+            self.assertEqual(index.search("mix")[0][:2], ("comment", "5"))
+            index.close()
+
@@ -0,0 +1,103 @@
+import os
+import tempfile
+import time
+import unittest
+
+from lsdbcrawler.stores import IdStore, ExpiringStore
+
+
+class TestIdStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "ids.txt")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_add_and_reload(self):
+        store = IdStore(self.path)
+        store.open()
+        self.assertTrue(store.add(1))
+        self.assertFalse(store.add(1))
+        self.assertIn(1, store)
+        store.close()
+
+        store = IdStore(self.path)
+        store.open()
+        self.assertIn("1", store)
+        self.assertEqual(len(store), 1)
+        store.close()
+
+
+class TestExpiringStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "users.tsv")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _store(self, now=None):
+        store = ExpiringStore(self.path, ttl=100, negative_ttl=10, negative_max_ttl=30)
+        store.open(now=now)
+        return store
+
+    def test_success_expires_after_ttl(self):
+        store = self._store()
+        store.add_success("/user/a")
+        self.assertIn("/user/a", store)
+        store.close()
+
+        now = time.time()
+        store = self._store(now=now + 50)
+        self.assertIn("/user/a", store)
+        store.close()
+
+        store = self._store(now=now + 150)
+        self.assertNotIn("/user/a", store)
+        store.close()
+
+    def test_failure_backoff(self):
+        store = self._store()
+        store.add_failure("/user/b")
+        store.add_failure("/user/b")
+        store.close()
+
+        # two failures double the negative ttl to 20 seconds
+        now = time.time()
+        store = self._store(now=now + 15)
+        self.assertIn("/user/b", store)
+        store.close()
+
+        store = self._store(now=now + 25)
+        self.assertNotIn("/user/b", store)
+        self.assertEqual(store.backoff(5), 30)
+        store.close()
+
+    def test_compacted_on_close(self):
+        store = self._store()
+        store.add_failure("/user/c")
+        store.add_success("/user/c")
+        store.close()
+
+        with open(self.path, encoding="utf-8") as f:
+            self.assertEqual([line.split("\t")[:2] for line in f], [["/user/c", "ok"]])
+
+    def test_not_compacted_while_another_writer_is_open(self):
+        first = self._store()
+        second = self._store()
+        first.add_success("/user/d")
+        first.add_success("/user/d")
+        first.close()
+        second.add_success("/user/e")
+        with open(self.path, encoding="utf-8") as f:
+            self.assertEqual(len(f.readlines()), 3)
+
+        # the last writer compacts, keeping the lines of both
+        second.close()
+        store = self._store()
+        self.assertIn("/user/d", store)
+        self.assertIn("/user/e", store)
+        store.close()
+        with open(self.path, encoding="utf-8") as f:
+            self.assertEqual(len(f.readlines()), 2)
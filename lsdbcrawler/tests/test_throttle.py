@@ -0,0 +1,73 @@
+import unittest
+
+from lsdbcrawler.throttle import SlotThrottle, TokenBucket
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_bursts_then_spaces_requests(self):
+        clock = Clock()
+        bucket = TokenBucket(rate=2, burst=3, clock=clock)
+
+        self.assertEqual([bucket.reserve() for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertEqual(bucket.reserve(), 0.5)
+        self.assertEqual(bucket.reserve(), 1.0)
+
+        clock.now = 10
+        self.assertEqual(bucket.reserve(), 0.0)
+
+
+class TestSlotThrottle(unittest.TestCase):
+    def throttle(self, **kwargs):
+        settings = {
+            "start_concurrency": 2,
+            "min_concurrency": 1,
+            "max_concurrency": 32,
+            "error_budget": 0.05,
+            "target_latency": 2.0,
+            "window": 10,
+        }
+        settings.update(kwargs)
+        return SlotThrottle(**settings)
+
+    def test_increases_while_healthy(self):
+        throttle = self.throttle()
+        for _ in range(30):
+            throttle.record(0.5)
+        self.assertEqual(throttle.slot_concurrency, 5)
+        self.assertEqual(throttle.increases, 3)
+
+    def test_decreases_on_errors_and_latency(self):
+        throttle = self.throttle(start_concurrency=8)
+        for i in range(10):
+            throttle.record(0.5, error=i < 2)
+        self.assertEqual(throttle.slot_concurrency, 4)
+        self.assertEqual(throttle.state()["error_rate"], 0.2)
+
+        for _ in range(10):
+            throttle.record(3.0)
+        self.assertEqual(throttle.slot_concurrency, 2)
+        self.assertEqual(throttle.decreases, 2)
+
+    def test_converges_below_server_capacity(self):
+        # a stand-in server failing the requests above its capacity of 12
+        capacity = 12
+        throttle = self.throttle(error_budget=0.02, window=capacity)
+        history = []
+        for _ in range(200):
+            concurrency = throttle.slot_concurrency
+            for i in range(throttle.window):
+                throttle.record(0.2, error=i < concurrency - capacity)
+            history.append(concurrency)
+
+        steady = history[50:]
+        self.assertLessEqual(max(steady), capacity + 1)
+        # average throughput stays within the AIMD sawtooth below capacity
+        self.assertGreater(sum(steady) / len(steady), capacity * 0.7)
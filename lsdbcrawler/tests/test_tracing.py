@@ -0,0 +1,23 @@
+import unittest
+
+from lsdbcrawler.tracing import percentile, summarize
+
+
+class TestTracing(unittest.TestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([], 50), 0.0)
+
+    def test_summarize(self):
+        spans = [
+            {"trace_id": "a", "set_url": "/set/1", "stage": "download", "start": 0, "duration": 1},
+            {"trace_id": "a", "set_url": "/set/1", "stage": "parse", "start": 1, "duration": 0.5},
+            {"trace_id": "b", "set_url": "/set/2", "stage": "download", "start": 0, "duration": 3},
+        ]
+        stages, sets = summarize(spans)
+        self.assertEqual(stages["download"]["count"], 2)
+        self.assertEqual(stages["download"]["p99"], 3)
+        self.assertEqual([s["set_url"] for s in sets], ["/set/2", "/set/1"])
+        self.assertEqual(sets[1]["duration"], 1.5)
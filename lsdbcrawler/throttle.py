@@ -0,0 +1,106 @@
+import time
+
+from lsdbcrawler.tracing import percentile
+
+
+class TokenBucket(object):
+    """Request rate ceiling of ``rate`` requests per second with bursts of ``burst``.
+
+    ``reserve`` always takes a token and returns how long the caller has to
+    wait before using it, so concurrent callers are spaced out in order.
+    """
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = burst
+        self.updated = clock()
+
+    def reserve(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+
+class SlotThrottle(object):
+    """AIMD controller of the concurrency of one download slot.
+
+    Outcomes of requests are collected in windows of ``window`` samples. After
+    each window the concurrency is multiplied by ``decrease`` if the error rate
+    exceeded ``error_budget`` or the p95 latency exceeded ``target_latency``,
+    and raised by ``increase`` otherwise, within ``min_concurrency`` and
+    ``max_concurrency``.
+    """
+
+    def __init__(
+        self,
+        start_concurrency,
+        min_concurrency,
+        max_concurrency,
+        error_budget,
+        target_latency,
+        window=20,
+        increase=1.0,
+        decrease=0.5,
+    ):
+        self.concurrency = float(start_concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.error_budget = error_budget
+        self.target_latency = target_latency
+        self.window = window
+        self.increase = increase
+        self.decrease = decrease
+
+        self.latencies = []
+        self.errors = 0
+        self.error_rate = 0.0
+        self.p95_latency = 0.0
+        self.increases = 0
+        self.decreases = 0
+
+    @property
+    def slot_concurrency(self):
+        return max(int(self.concurrency), 1)
+
+    def record(self, latency=None, error=False):
+        """Record one outcome; returns True when the concurrency was adjusted."""
+        self.latencies.append(latency if latency is not None else 0.0)
+        if error:
+            self.errors += 1
+        if len(self.latencies) < self.window:
+            return False
+
+        self.adjust()
+        return True
+
+    def adjust(self):
+        self.error_rate = self.errors / len(self.latencies)
+        self.p95_latency = percentile(sorted(self.latencies), 95)
+
+        overloaded = self.error_rate > self.error_budget or (
+            self.target_latency and self.p95_latency > self.target_latency
+        )
+        if overloaded:
+            self.concurrency = max(self.concurrency * self.decrease, self.min_concurrency)
+            self.decreases += 1
+        else:
+            self.concurrency = min(self.concurrency + self.increase, self.max_concurrency)
+            self.increases += 1
+
+        self.latencies = []
+        self.errors = 0
+
+    def state(self):
+        return {
+            "concurrency": self.slot_concurrency,
+            "error_rate": round(self.error_rate, 4),
+            "p95_latency": round(self.p95_latency, 4),
+            "increases": self.increases,
+            "decreases": self.decreases,
+        }
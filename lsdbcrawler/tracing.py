@@ -0,0 +1,72 @@
+import json
+import math
+from collections import defaultdict
+
+STAGES = ("schedule", "download", "parse", "pipeline")
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return 0.0
+    rank = max(int(math.ceil(percent / 100 * len(values))), 1)
+    return values[rank - 1]
+
+
+def read_spans(path):
+    with open(path, mode="r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def summarize(spans, slowest=10):
+    """Summarize trace spans into per stage percentiles and the slowest sets.
+
+    Returns ``(stages, sets)`` where ``stages`` maps a stage to its span count
+    and p50/p95/p99 durations, and ``sets`` lists the ``slowest`` traces as
+    dicts with their set url, end-to-end duration and time per stage.
+    """
+    durations = defaultdict(list)
+    traces = {}
+
+    for span in spans:
+        durations[span["stage"]].append(span["duration"])
+
+        trace = traces.get(span["trace_id"])
+        if trace is None:
+            trace = traces[span["trace_id"]] = {
+                "set_url": span["set_url"],
+                "start": span["start"],
+                "end": span["start"] + span["duration"],
+                "stages": defaultdict(float),
+            }
+        trace["start"] = min(trace["start"], span["start"])
+        trace["end"] = max(trace["end"], span["start"] + span["duration"])
+        trace["stages"][span["stage"]] += span["duration"]
+
+    stages = {}
+    for stage, values in durations.items():
+        values.sort()
+        stages[stage] = {
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+        }
+
+    sets = sorted(
+        (
+            {
+                "trace_id": trace_id,
+                "set_url": trace["set_url"],
+                "duration": trace["end"] - trace["start"],
+                "stages": dict(trace["stages"]),
+            }
+            for trace_id, trace in traces.items()
+        ),
+        key=lambda t: t["duration"],
+        reverse=True,
+    )
+    return stages, sets[:slowest]
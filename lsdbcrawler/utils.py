@@ -1,19 +1,14 @@
 import random
-from scrapy.utils.project import get_project_settings
 from scrapy.exceptions import NotConfigured
 from scrapy.exceptions import CloseSpider, IgnoreRequest
 
 
-scrapy_settings = get_project_settings()
-PROXY_LIST = scrapy_settings.get("PROXY_POOL")
-
-
-def randomProxy(https=False):
-    if not PROXY_LIST:
+def randomProxy(proxy_list, https=False):
+    if not proxy_list:
         raise NotConfigured("PROXY_POOL is not configured")
 
     try:
-        proxy = random.choice(PROXY_LIST)
+        proxy = random.choice(proxy_list)
     except IndexError as exc:
         raise CloseSpider("No proxies available") from exc
 
@@ -23,3 +18,12 @@ def randomProxy(https=False):
         proxy_url = "http://" + proxy
 
     return proxy_url
+
+
+def callback_name(request):
+    """Return the name of the spider method a request is routed to."""
+    callback = request.callback
+    if callback is None:
+        return "parse"
+    return getattr(callback, "__name__", str(callback))
+